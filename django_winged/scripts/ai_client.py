@@ -0,0 +1,195 @@
+"""
+Shared outbound client for AI providers.
+
+One AIClient per provider (see get_client and settings.AI_CLIENTS) holds a
+pooled requests session, a token bucket spacing out requests, retries with
+exponential backoff, full jitter and Retry-After, and a circuit breaker that
+fails calls fast after repeated failures instead of waiting on a provider that is down.
+"""
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average and bursts of up to capacity.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token, returns seconds to wait before using it.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1 # May go negative, later callers queue up behind.
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def async_acquire(self):
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold failures in a row. Once open, calls fail until
+    reset_timeout passes, then one trial call is let through to close it again.
+    """
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"Circuit open after {self.failures} failures.")
+            self.opened_at = time.monotonic() # Half open, this call is the trial.
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+def parse_retry_after(value):
+    """
+    returns seconds from a Retry-After header, given as seconds or an http date, or None.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AIClient:
+    """
+    call and async_call run a function, retrying it on retry_on exceptions.
+    A retry_after attribute on the exception, in seconds, overrides the backoff,
+    a false retryable one raises it right away.
+    """
+    def __init__(self, rate=1, burst=1, max_attempts=3, base_delay=1, max_delay=30, failure_threshold=5, reset_timeout=30, pool_size=10):
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get_delay(self, attempt, error):
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def call(self, function, retry_on=(Exception,)):
+        for attempt in range(self.max_attempts):
+            self.breaker.before_call()
+            self.bucket.acquire()
+            try:
+                result = function()
+            except retry_on as e:
+                if not getattr(e, "retryable", True): # The request's fault, the provider answered.
+                    self.breaker.record_success() # Closes a half open circuit too.
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.max_attempts - 1:
+                    raise
+                delay = self.get_delay(attempt, e)
+                logger.warning(f"Retrying in {delay:.1f}s after: {e!r}")
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def async_call(self, function, retry_on=(Exception,)):
+        """
+        call for a coroutine function, waits without blocking the event loop.
+        """
+        for attempt in range(self.max_attempts):
+            self.breaker.before_call()
+            await self.bucket.async_acquire()
+            try:
+                result = await function()
+            except retry_on as e:
+                if not getattr(e, "retryable", True): # The request's fault, the provider answered.
+                    self.breaker.record_success() # Closes a half open circuit too.
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.max_attempts - 1:
+                    raise
+                delay = self.get_delay(attempt, e)
+                logger.warning(f"Retrying in {delay:.1f}s after: {e!r}")
+                await asyncio.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(provider):
+    """
+    returns the process wide AIClient for provider, configured by settings.AI_CLIENTS[provider].
+    """
+    with _clients_lock:
+        if provider not in _clients:
+            _clients[provider] = AIClient(**settings.AI_CLIENTS.get(provider, {}))
+        return _clients[provider]
+
+
+def reset_clients():
+    """
+    Drops every client, and so their rate limits and circuit state, e.g. between tests.
+    """
+    with _clients_lock:
+        _clients.clear()
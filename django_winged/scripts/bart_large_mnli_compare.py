@@ -1,15 +1,27 @@
+import abc
+import asyncio
+import threading
 import time
-import requests
+import aiohttp
 import os
 import logging
 
 from requests.exceptions import Timeout, RequestException
 from json.decoder import JSONDecodeError
 
+from collections import namedtuple
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
 from winged_app.models import ItemVsTwoCriteriaAIComparison
+from scripts.ai_client import get_client, parse_retry_after, CircuitOpenError
 
 HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
 API_URL = "https://api-inference.huggingface.co/models/facebook/bart-large-mnli"
+BATCH_SIZE = 2**4 # Statements per inference request.
 class HuggingFaceZeroShotAPIError(Exception):
     pass
 
@@ -22,21 +34,61 @@ class HuggingFaceZeroShotAPIInvalidResponse(HuggingFaceZeroShotAPIError):
 logging.basicConfig(filename='api_logs.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
+def get_error(status, headers, json_response):
+    """
+    returns the error for a failed response, with a retry_after when the API gives one
+    (Retry-After or, while the model loads, estimated_time) and not retryable on other 4xx.
+    """
+    error = HuggingFaceZeroShotAPIError(f"API response status {status}")
+    error.retry_after = parse_retry_after(headers.get("Retry-After"))
+    if error.retry_after is None and isinstance(json_response, dict) and "estimated_time" in json_response:
+        error.retry_after = json_response["estimated_time"]
+    error.retryable = status == 429 or status >= 500
+    return error
+
+
 def api_call(url, headers, data):
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=10)
-        response.raise_for_status()
-        logging.info(f"API response: {response.status_code}, {response.text}")
-        return response
+        response = get_client("huggingface").session.post(url, headers=headers, json=data, timeout=10)
     except Timeout as e:
         logging.error(f"Timeout error: {e}")
-        if response:
-            logging.info(f"API response: {response.status_code}, {response.text}")
         raise HuggingFaceZeroShotAPITimeoutError()
     except RequestException as e:
         logging.error(f"Request exception: {e}")
-        if response:
-            logging.info(f"API response: {response.status_code}, {response.text}")
+        raise HuggingFaceZeroShotAPIError()
+
+    logging.info(f"API response: {response.status_code}, {response.text}")
+    if not response.ok:
+        try:
+            json_response = response.json()
+        except ValueError:
+            json_response = None
+        raise get_error(response.status_code, response.headers, json_response)
+    return response
+
+
+async def async_api_call(session, url, headers, data):
+    """
+    Like api_call with an aiohttp session, returns the response's json.
+    """
+    try:
+        async with session.post(url, headers=headers, json=data, timeout=aiohttp.ClientTimeout(total=10)) as response:
+            text = await response.text()
+            logging.info(f"API response: {response.status}, {text}")
+            try:
+                json_response = await response.json(content_type=None)
+            except JSONDecodeError:
+                json_response = None
+            if response.status >= 400:
+                raise get_error(response.status, response.headers, json_response)
+            if json_response is None:
+                raise HuggingFaceZeroShotAPIInvalidResponse("Invalid response: not json")
+            return json_response
+    except asyncio.TimeoutError as e:
+        logging.error(f"Timeout error: {e}")
+        raise HuggingFaceZeroShotAPITimeoutError()
+    except aiohttp.ClientError as e:
+        logging.error(f"Request exception: {e}")
         raise HuggingFaceZeroShotAPIError()
 
 
@@ -48,74 +100,282 @@ def parse_response(response, criteria__version_1_statement):
     return json_response, json_response['labels'][0] == criteria__version_1_statement
 
 
-#this function can be generalized to be used with criterion vs two item statements too.
-def compute_zero_shot_comparison(item_statement_version_statement, criteria_version_1_statement, criteria_version_2_statement, api_key=HUGGINGFACE_API_KEY, api_url=API_URL, post_function=api_call, parser_function=parse_response):
-    remaining_attempts = 3
-    sleep_time = 5
+def parse_batch_response(response, inputs_count):
+    """
+    returns the result of each input of a batched request, in input order.
+    """
+    return validate_batch_results(response.json(), inputs_count)
+
+
+def validate_batch_results(json_response, inputs_count):
+    if not isinstance(json_response, list) or len(json_response) != inputs_count:
+        logging.error("Invalid response: expected one result per input")
+        raise HuggingFaceZeroShotAPIInvalidResponse("Invalid response: expected one result per input") from None
+    if any('labels' not in result for result in json_response):
+        logging.error("Invalid response: 'labels' missing")
+        raise HuggingFaceZeroShotAPIInvalidResponse("Invalid response: 'labels' missing") from None
+    return json_response
+
 
+def post_with_retries(data, parse, api_key=HUGGINGFACE_API_KEY, api_url=API_URL, post_function=api_call):
+    """
+    Posts data and parses the response through the huggingface AIClient: rate
+    limited, retried with backoff and failing fast while its circuit is open.
+    """
+    headers = {"Authorization": f"Bearer {api_key}"}
+    try:
+        return get_client("huggingface").call(lambda: parse(post_function(api_url, headers, data)), retry_on=(HuggingFaceZeroShotAPIError,))
+    except CircuitOpenError as e:
+        logging.error(f"Not calling API: {e}")
+        raise HuggingFaceZeroShotAPIError(str(e)) from e
+    except HuggingFaceZeroShotAPIError as e:
+        if not getattr(e, "retryable", True):
+            raise
+        logging.error("Max retries reached without successful API response.")
+        raise HuggingFaceZeroShotAPIError("Max retries reached without successful API response.") from e
+
+
+async def async_post_with_retries(session, data, parse, api_key=HUGGINGFACE_API_KEY, api_url=API_URL, post_function=async_api_call):
+    """
+    Like post_with_retries, without blocking other requests while it waits.
+    """
     headers = {"Authorization": f"Bearer {api_key}"}
+
+    async def post():
+        return parse(await post_function(session, api_url, headers, data))
+
+    try:
+        return await get_client("huggingface").async_call(post, retry_on=(HuggingFaceZeroShotAPIError,))
+    except CircuitOpenError as e:
+        logging.error(f"Not calling API: {e}")
+        raise HuggingFaceZeroShotAPIError(str(e)) from e
+    except HuggingFaceZeroShotAPIError as e:
+        if not getattr(e, "retryable", True):
+            raise
+        logging.error("Max retries reached without successful API response.")
+        raise HuggingFaceZeroShotAPIError("Max retries reached without successful API response.") from e
+
+
+class ZeroShotBackend(abc.ABC):
+    """
+    Zero-shot classifier behind compute_zero_shot_comparison(s).
+    classify returns, per statement, a {"sequence", "labels", "scores"} dict
+    with labels ordered best first, like the inference API.
+    ai_model is what stored comparisons are recorded and looked up under.
+    """
+    ai_model = None
+
+    @abc.abstractmethod
+    def classify(self, statements, candidate_labels):
+        """
+        returns a result dict per statement, see above.
+        """
+
+    async def aclassify(self, statements, candidate_labels, session):
+        """
+        classify for async callers, session is an aiohttp.ClientSession backends may use.
+        """
+        return await asyncio.to_thread(self.classify, statements, candidate_labels)
+
+
+class InferenceAPIBackend(ZeroShotBackend):
+    """
+    Hugging Face's hosted inference API, batch_size statements per request.
+    """
+    ai_model = "bart-large-mnli"
+
+    def __init__(self, api_key=HUGGINGFACE_API_KEY, api_url=API_URL, post_function=api_call, batch_size=BATCH_SIZE, async_post_function=async_api_call):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.post_function = post_function
+        self.async_post_function = async_post_function
+        self.batch_size = batch_size
+
+    def classify(self, statements, candidate_labels):
+        statements = list(statements)
+        results = []
+        for start in range(0, len(statements), self.batch_size):
+            inputs = statements[start:start + self.batch_size]
+            data = {"inputs": inputs, "parameters": {"candidate_labels": list(candidate_labels)}}
+            results += post_with_retries(data, lambda response: parse_batch_response(response, len(inputs)), self.api_key, self.api_url, self.post_function)
+        return results
+
+    async def aclassify(self, statements, candidate_labels, session):
+        statements = list(statements)
+        batches = [statements[start:start + self.batch_size] for start in range(0, len(statements), self.batch_size)]
+        results = await asyncio.gather(*(
+            async_post_with_retries(
+                session, {"inputs": inputs, "parameters": {"candidate_labels": list(candidate_labels)}},
+                lambda json_response, count=len(inputs): validate_batch_results(json_response, count),
+                self.api_key, self.api_url, self.async_post_function,
+                )
+            for inputs in batches
+            ))
+        return [result for batch_results in results for result in batch_results]
+
+
+class LocalPipelineBackend(ZeroShotBackend):
+    """
+    A transformers zero-shot-classification pipeline run in process, on CPU
+    unless device is given. model is a hub name or a local path, loaded on first use.
+    """
+    def __init__(self, model=None, batch_size=BATCH_SIZE, device=-1):
+        self.model = model or settings.ZERO_SHOT_MODEL
+        self.batch_size = batch_size
+        self.device = device
+        self.ai_model = os.path.basename(self.model.rstrip("/"))[:2**7]
+        self.pipeline = None
+        self.lock = threading.Lock() # Concurrent callers would only fight over the same cores.
+
+    def get_pipeline(self):
+        if self.pipeline is None:
+            from transformers import pipeline # Heavy, only imported by processes that use it.
+            self.pipeline = pipeline("zero-shot-classification", model=self.model, device=self.device)
+        return self.pipeline
+
+    def classify(self, statements, candidate_labels):
+        statements = list(statements)
+        if not statements:
+            return []
+        with self.lock:
+            return self.get_pipeline()(statements, candidate_labels=list(candidate_labels), batch_size=self.batch_size)
+
+
+class StubBackend(ZeroShotBackend):
+    """
+    Offline stand in for tests and local runs: ranks labels by words shared with the statement.
+    """
+    ai_model = "stub"
+
+    def classify(self, statements, candidate_labels):
+        results = []
+        for statement in statements:
+            words = set(statement.lower().split())
+            overlaps = [len(words & set(label.lower().split())) + 1 for label in candidate_labels]
+            ranked = sorted(zip(candidate_labels, overlaps), key=lambda pair: -pair[1]) # Stable, ties keep label order.
+            results.append({
+                "sequence": statement,
+                "labels": [label for label, overlap in ranked],
+                "scores": [overlap / sum(overlaps) for label, overlap in ranked],
+                })
+        return results
+
+
+ZERO_SHOT_BACKENDS = {
+    "inference_api": InferenceAPIBackend,
+    "local": LocalPipelineBackend,
+    "stub": StubBackend,
+    }
+_backends = {}
+
+
+def get_zero_shot_backend(name=None):
+    """
+    returns the backend named name, settings.ZERO_SHOT_BACKEND by default, one instance per process.
+    """
+    name = name or settings.ZERO_SHOT_BACKEND
+    if name not in _backends:
+        _backends[name] = ZERO_SHOT_BACKENDS[name]()
+    return _backends[name]
+
+
+#this function can be generalized to be used with criterion vs two item statements too.
+def compute_zero_shot_comparison(item_statement_version_statement, criteria_version_1_statement, criteria_version_2_statement, api_key=None, api_url=None, post_function=None, parser_function=None, backend=None):
+    """
+    api_key, api_url and post_function override the inference API backend's own,
+    parser_function its response parsing. Other backends take none of them.
+    """
+    backend = backend or get_zero_shot_backend()
+    if not isinstance(backend, InferenceAPIBackend):
+        if any(argument is not None for argument in (api_key, api_url, post_function, parser_function)):
+            raise ValueError(f"api_key, api_url, post_function and parser_function only apply to the inference API backend, not {type(backend).__name__}.")
+        result = backend.classify([item_statement_version_statement], [criteria_version_1_statement, criteria_version_2_statement])[0]
+        return result, result['labels'][0] == criteria_version_1_statement
+
+    parser_function = parser_function or parse_response
     data = {"inputs": item_statement_version_statement, "parameters": {"candidate_labels": [criteria_version_1_statement, criteria_version_2_statement]}}
+    return post_with_retries(
+        data, lambda response: parser_function(response, criteria_version_1_statement),
+        api_key or backend.api_key, api_url or backend.api_url, post_function or backend.post_function,
+        )
 
-    while remaining_attempts > 0:
-        try:
-            time.sleep(sleep_time)
-            response = post_function(api_url, headers, data)
-            result = parser_function(response, criteria_version_1_statement)
-            return result
-            
-        except HuggingFaceZeroShotAPITimeoutError:
-            logging.warning("Timeout occurred, retrying...")
-            remaining_attempts -= 1
-            continue
-        
-        except HuggingFaceZeroShotAPIError:
-            logging.warning("API error occurred, retrying with increased sleep time...")
-            remaining_attempts -= 1
-            sleep_time *= 2
-            continue
-        
 
-    logging.error("Max retries reached without successful API response.")
-    raise HuggingFaceZeroShotAPIError("Max retries reached without successful API response.")
+def compute_zero_shot_comparisons(item_statements, criteria_version_1_statement, criteria_version_2_statement, backend=None):
+    """
+    Like compute_zero_shot_comparison for many item statements, batched by the backend.
+    returns a (json, criteria choice) pair per statement, in order.
+    """
+    backend = backend or get_zero_shot_backend()
+    results = backend.classify(item_statements, [criteria_version_1_statement, criteria_version_2_statement])
+    return [(result, result['labels'][0] == criteria_version_1_statement) for result in results]
 
 
 
-def check_for_user_made_comparison(item, criteria_1, criteria_2):
+class LatestComparisons(namedtuple('LatestComparisons', ['user', 'model'])):
     """
-    Checks for a comparison the user already made from the front end
-    with item's current_statement_version.
+    Latest user made and model made comparison of an item version, either may be None.
     """
-    comparison = ItemVsTwoCriteriaAIComparison.objects.filter(
-        user_choice=True,
-        criteria_statement_version_1=criteria_1.current_criteria_statement_version,
-        criteria_statement_version_2=criteria_2.current_criteria_statement_version,
-        item_compared_statement_version=item.current_statement_version,
-    )
+    @property
+    def choice(self):
+        return (self.user or self.model).criteria_choice
+
 
-    return comparison.order_by('created_at').reverse().first() if comparison.exists() else False
+def latest_comparisons(item_statement_version_ids, criteria_version_1, criteria_version_2, ai_model):
+    """
+    returns {item statement version id: LatestComparisons} for versions with a
+    user made or ai_model made comparison against the two criteria versions, in one query.
+    """
+    comparisons = ItemVsTwoCriteriaAIComparison.objects.filter(
+        Q(user_choice=True) | Q(user_choice=False, ai_model=ai_model),
+        criteria_statement_version_1=criteria_version_1,
+        criteria_statement_version_2=criteria_version_2,
+        item_compared_statement_version_id__in=list(item_statement_version_ids),
+        ).annotate(recency=Window(
+            RowNumber(),
+            partition_by=[F('item_compared_statement_version_id'), F('user_choice')],
+            order_by=[F('created_at').desc(), F('pk').desc()],
+            )).filter(recency=1)
 
+    latest = {}
+    for comparison in comparisons:
+        version_id = comparison.item_compared_statement_version_id
+        user, model = latest.get(version_id, (None, None))
+        if comparison.user_choice:
+            user = comparison
+        else:
+            model = comparison
+        latest[version_id] = LatestComparisons(user, model)
+    return latest
 
 
-def item_vs_criteria(item, criteria_1, criteria_2, force_recompute=False):
+def prefetch_comparisons(items, criteria_1, criteria_2):
+    """
+    latest_comparisons for items' current versions, to pass to item_vs_criteria as
+    cached_comparisons when calling it item by item, e.g. through functools.partial.
+    """
+    return latest_comparisons(
+        [item.current_statement_version_id for item in items],
+        criteria_1.current_criteria_statement_version,
+        criteria_2.current_criteria_statement_version,
+        get_zero_shot_backend().ai_model,
+        )
+
+
+def item_vs_criteria(item, criteria_1, criteria_2, force_recompute=False, cached_comparisons=None):
+    """
+    cached_comparisons, from prefetch_comparisons, saves the lookup query,
+    items missing from it have no stored comparison.
+    """
     if force_recompute:
         return compute_and_store_comparison(item, criteria_1, criteria_2)
-    
-    user_made_comparison = check_for_user_made_comparison(item, criteria_1, criteria_2)
-    if user_made_comparison:
-        return user_made_comparison.criteria_choice
 
-    try:
-        comparison = ItemVsTwoCriteriaAIComparison.objects.filter(
-            ai_model="bart-large-mnli",
-            criteria_statement_version_1=criteria_1.current_criteria_statement_version,
-            criteria_statement_version_2=criteria_2.current_criteria_statement_version,
-            item_compared_statement_version=item.current_statement_version,
-        ).order_by('created_at').reverse().first()
-        if not comparison:
-            raise ItemVsTwoCriteriaAIComparison.DoesNotExist
-        return comparison.criteria_choice
-    except ItemVsTwoCriteriaAIComparison.DoesNotExist:
-        return compute_and_store_comparison(item, criteria_1, criteria_2)
+    if cached_comparisons is None:
+        cached_comparisons = prefetch_comparisons([item], criteria_1, criteria_2)
+
+    latest = cached_comparisons.get(item.current_statement_version_id)
+    if latest:
+        return latest.choice
+    return compute_and_store_comparison(item, criteria_1, criteria_2)
 
 
 
@@ -130,7 +390,7 @@ def compute_and_store_comparison(item, criteria_1, criteria_2):
 
     if response:
         comparison = ItemVsTwoCriteriaAIComparison.objects.create(
-            ai_model="bart-large-mnli",
+            ai_model=get_zero_shot_backend().ai_model,
             criteria_statement_version_1=criteria_1.current_criteria_statement_version,
             criteria_statement_version_2=criteria_2.current_criteria_statement_version,
             item_compared_statement_version=item.current_statement_version,
@@ -141,3 +401,131 @@ def compute_and_store_comparison(item, criteria_1, criteria_2):
         return comparison.criteria_choice
 
     raise ValueError("Comparison computation failed.")
+
+
+
+def known_choices(items, criteria_version_1, criteria_version_2, backend):
+    """
+    returns {item pk: criteria choice} of items with a stored user or backend comparison, user choices first.
+    """
+    latest = latest_comparisons([item.current_statement_version_id for item in items], criteria_version_1, criteria_version_2, backend.ai_model)
+    return {item.pk: latest[item.current_statement_version_id].choice for item in items if item.current_statement_version_id in latest}
+
+
+def store_comparisons(batch, responses, criteria_version_1, criteria_version_2, backend, execution_in_seconds):
+    """
+    Stores a batch's comparisons with one bulk_create.
+    returns {item pk: criteria choice}.
+    """
+    ItemVsTwoCriteriaAIComparison.objects.bulk_create([
+        ItemVsTwoCriteriaAIComparison(
+            ai_model=backend.ai_model,
+            criteria_statement_version_1=criteria_version_1,
+            criteria_statement_version_2=criteria_version_2,
+            item_compared_statement_version_id=item.current_statement_version_id,
+            response=response,
+            criteria_choice=criteria_choice,
+            execution_in_seconds=execution_in_seconds,
+            )
+        for item, (response, criteria_choice) in zip(batch, responses)
+        ])
+    return {item.pk: criteria_choice for item, (response, criteria_choice) in zip(batch, responses)}
+
+
+def items_vs_criteria(items, criteria_1, criteria_2, force_recompute=False, batch_size=BATCH_SIZE, on_batch=None, backend=None):
+    """
+    Like item_vs_criteria for many items, classifying batch_size statements at a time
+    and storing each batch's comparisons with one bulk_create.
+    Calls on_batch({item pk: criteria choice}) as each batch's choices are known,
+    a batch failing for any reason calls it with {item pk: exception} instead
+    and the rest still run.
+    returns {item pk: criteria choice} of the items that succeeded.
+    """
+    backend = backend or get_zero_shot_backend()
+    criteria_version_1 = criteria_1.current_criteria_statement_version
+    criteria_version_2 = criteria_2.current_criteria_statement_version
+    on_batch = on_batch or (lambda results: None)
+
+    results = {} if force_recompute else known_choices(items, criteria_version_1, criteria_version_2, backend)
+    if results:
+        on_batch(dict(results))
+
+    pending = [item for item in items if item.pk not in results]
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        start_time = time.time()
+        try:
+            responses = compute_zero_shot_comparisons(
+                [item.statement for item in batch],
+                criteria_version_1.computed_statement,
+                criteria_version_2.computed_statement,
+                backend,
+                )
+            batch_results = store_comparisons(batch, responses, criteria_version_1, criteria_version_2, backend, (time.time() - start_time) / len(batch))
+        except Exception as e: # A bad response body, model or db error fails this batch only.
+            logging.exception(f"Batch of {len(batch)} items failed: {e!r}")
+            on_batch({item.pk: e for item in batch})
+            continue
+        results.update(batch_results)
+        on_batch(batch_results)
+    return results
+
+
+async def async_items_vs_criteria(items, criteria_1, criteria_2, force_recompute=False, batch_size=BATCH_SIZE, on_batch=None, backend=None, concurrency=None):
+    """
+    Like items_vs_criteria with up to concurrency batches (settings.ZERO_SHOT_CONCURRENCY
+    by default) being classified at once, each stored and passed to on_batch as it completes.
+    A failing batch is passed as {item pk: exception} without stopping the others.
+    """
+    backend = backend or get_zero_shot_backend()
+    concurrency = concurrency or settings.ZERO_SHOT_CONCURRENCY
+    on_batch = sync_to_async(on_batch or (lambda results: None))
+
+    def prepare():
+        criteria_version_1 = criteria_1.current_criteria_statement_version
+        criteria_version_2 = criteria_2.current_criteria_statement_version
+        labels = [criteria_version_1.computed_statement, criteria_version_2.computed_statement]
+        known = {} if force_recompute else known_choices(items, criteria_version_1, criteria_version_2, backend)
+        return criteria_version_1, criteria_version_2, labels, known
+
+    criteria_version_1, criteria_version_2, labels, results = await sync_to_async(prepare)()
+    if results:
+        await on_batch(dict(results))
+
+    pending = [item for item in items if item.pk not in results]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fail_batch(batch, error):
+        # Reported like any batch, gather goes on with the others.
+        logging.exception(f"Batch of {len(batch)} items failed: {error!r}")
+        await on_batch({item.pk: error for item in batch})
+
+    async def run_batch(batch, session):
+        async with semaphore:
+            start_time = time.time()
+            try:
+                responses = await backend.aclassify([item.statement for item in batch], labels, session)
+            except Exception as e:
+                return await fail_batch(batch, e)
+            execution_in_seconds = (time.time() - start_time) / len(batch)
+        try:
+            batch_results = await sync_to_async(store_comparisons)(batch, [
+                (response, response['labels'][0] == labels[0]) for response in responses
+                ], criteria_version_1, criteria_version_2, backend, execution_in_seconds)
+        except Exception as e:
+            return await fail_batch(batch, e)
+        results.update(batch_results)
+        await on_batch(batch_results)
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        await asyncio.gather(*(
+            run_batch(pending[start:start + batch_size], session) for start in range(0, len(pending), batch_size)
+            ))
+    return results
+
+
+def concurrent_items_vs_criteria(*args, **kwargs):
+    """
+    Runs async_items_vs_criteria from sync code, its db work stays on the calling thread.
+    """
+    return async_to_sync(async_items_vs_criteria)(*args, **kwargs)
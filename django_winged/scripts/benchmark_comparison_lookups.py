@@ -0,0 +1,141 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from winged_app.models import Item, Criteria, ItemVsTwoCriteriaAIComparison, CriterionVsItemsAIComparison
+from scripts.bart_large_mnli_compare import latest_comparisons
+
+
+AI_MODELS = ["bart-large-mnli", "stub", "gpt-4", "all-MiniLM-L6-v2"]
+BASELINE_SQL = [
+    # Single column indexes the comparison tables had before the composite ones.
+    "SET CONSTRAINTS ALL IMMEDIATE", # Deferred foreign key checks would block the DDL.
+    "CREATE INDEX benchmark_item_version ON winged_app_itemvstwocriteriaaicomparison (item_compared_statement_version_id)",
+    "CREATE INDEX benchmark_criterion_version ON winged_app_criterionvsitemsaicomparison (criterion_statement_version_id)",
+    "DROP INDEX itemvscriteria_model_idx",
+    "DROP INDEX itemvscriteria_user_idx",
+    "DROP INDEX criterionvsitems_model_idx",
+    "DROP INDEX criterionvsitems_user_idx",
+    ]
+
+
+def timed(function, repeat=20):
+    function()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def execution_time(function):
+    """
+    returns PostgreSQL's own execution time, in seconds, of the query function runs,
+    leaving out round trip and ORM time, or None on other backends.
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    with CaptureQueriesContext(connection) as context:
+        function()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + context.captured_queries[-1]['sql'])
+        return cursor.fetchone()[0][0]['Execution Time'] / 1000
+
+
+def create_comparisons(size, rng):
+    user = User.objects.create_user('benchmark_comparisons_user')
+    items = Item.bulk_create_with_versions([f"benchmark item {i}" for i in range(max(size // 50, 2))], None, user)
+    versions = [item.current_statement_version_id for item in items]
+    criteria_versions = [Criteria.objects.create(name=f"criteria {i}", statement=f"criteria {i}", user=user).current_criteria_statement_version_id for i in range(20)]
+    pairs = [(criteria_versions[i], criteria_versions[i + 1]) for i in range(0, 10, 2)]
+
+    ItemVsTwoCriteriaAIComparison.objects.bulk_create((
+        ItemVsTwoCriteriaAIComparison(
+            item_compared_statement_version_id=rng.choice(versions),
+            criteria_statement_version_1_id=pair[0],
+            criteria_statement_version_2_id=pair[1],
+            criteria_choice=rng.random() < 0.5,
+            **({'user_choice': True} if rng.random() < 0.02 else {'ai_model': rng.choice(AI_MODELS)}),
+            )
+        for pair in (rng.choice(pairs) for _ in range(size))
+        ), batch_size=5000)
+    CriterionVsItemsAIComparison.objects.bulk_create((
+        CriterionVsItemsAIComparison(
+            criterion_statement_version_id=rng.choice(criteria_versions),
+            item_compared_1_statement_version_id=rng.choice(versions),
+            item_compared_2_statement_version_id=rng.choice(versions),
+            ai_model=rng.choice(AI_MODELS),
+            user_choice=rng.random() < 0.02,
+            item_choice=rng.random() < 0.5,
+            )
+        for _ in range(size)
+        ), batch_size=5000)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE winged_app_itemvstwocriteriaaicomparison, winged_app_criterionvsitemsaicomparison")
+    return versions, pairs
+
+
+def benchmark_lookups(versions, pairs):
+    """
+    returns {lookup: (seconds, db execution seconds)} for the lookups comparison scripts make.
+    """
+    batch = random.Random(1).sample(versions, 100)
+    item_comparison = ItemVsTwoCriteriaAIComparison.objects.filter(ai_model="bart-large-mnli").order_by('pk')[len(versions) // 2]
+    criterion_comparison = CriterionVsItemsAIComparison.objects.order_by('pk')[len(versions) // 2]
+    criterion_lookup = dict(
+        ai_model=criterion_comparison.ai_model,
+        criterion_statement_version=criterion_comparison.criterion_statement_version_id,
+        item_compared_1_statement_version=criterion_comparison.item_compared_1_statement_version_id,
+        item_compared_2_statement_version=criterion_comparison.item_compared_2_statement_version_id,
+        )
+
+    lookups = {
+        "latest_comparisons, 100 item versions": lambda: latest_comparisons(batch, *pairs[0], "bart-large-mnli"),
+        "item vs criteria, latest model made": lambda: ItemVsTwoCriteriaAIComparison.objects.filter(
+            ai_model="bart-large-mnli",
+            item_compared_statement_version=item_comparison.item_compared_statement_version_id,
+            criteria_statement_version_1=item_comparison.criteria_statement_version_1_id,
+            criteria_statement_version_2=item_comparison.criteria_statement_version_2_id,
+            ).order_by('-created_at').first(),
+        "criterion vs items, latest model made": lambda: CriterionVsItemsAIComparison.objects.filter(**criterion_lookup).order_by('-created_at').first(),
+        "criterion vs items, latest user made": lambda: CriterionVsItemsAIComparison.objects.filter(user_choice=True, **criterion_lookup).order_by('-created_at').first(),
+        }
+    return {name: (timed(lookup)[1], execution_time(lookup)) for name, lookup in lookups.items()}
+
+
+def run(*args):
+    """
+    with "py manage.py runscript benchmark_comparison_lookups" to time cached
+    comparison lookups over 1M rows in each AI comparison table, or
+    "--script-args <size>" rows. On PostgreSQL they are timed again over the
+    single column indexes the tables had before, for comparison.
+    Everything is created in a transaction rolled back at the end.
+    """
+    size = int(args[0]) if args else 10**6
+    rng = random.Random(0)
+
+    with transaction.atomic():
+        start = time.perf_counter()
+        versions, pairs = create_comparisons(size, rng)
+        print(f"Created {size} rows per comparison table in {time.perf_counter() - start:.0f}s.")
+
+        composite = benchmark_lookups(versions, pairs)
+        baseline = {}
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for sql in BASELINE_SQL:
+                    cursor.execute(sql)
+                cursor.execute("ANALYZE winged_app_itemvstwocriteriaaicomparison, winged_app_criterionvsitemsaicomparison")
+            baseline = benchmark_lookups(versions, pairs)
+
+        def describe(seconds, db_seconds):
+            return f"{seconds * 1000:.2f}ms" + (f" ({db_seconds * 1000:.3f}ms in db)" if db_seconds is not None else "")
+
+        for name, times in composite.items():
+            before = f", single column indexes {describe(*baseline[name])}" if name in baseline else ""
+            print(f"{name}: composite indexes {describe(*times)}{before}.")
+
+        transaction.set_rollback(True)
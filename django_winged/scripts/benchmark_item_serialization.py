@@ -0,0 +1,54 @@
+import time
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from winged_app.models import Container, Item, SpectrumType, SpectrumValue
+from winged_app.serializers import ItemSerializer, serialize_items_fast
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def benchmark(size, user, spectrum_types):
+    container = Container.objects.create(name=f"benchmark_{size}", user=user)
+    items = Item.objects.bulk_create(
+        (Item(statement=f"benchmark item {i}", parent_container=container, user=user) for i in range(size)),
+        batch_size=1000,
+        )
+    SpectrumValue.objects.bulk_create(
+        (SpectrumValue(value=i % 101, spectrum_type=spectrum_type, parent_item=item, user=user) for i, item in enumerate(items) for spectrum_type in spectrum_types),
+        batch_size=1000,
+        )
+
+    def items_queryset():
+        return ItemSerializer.setup_eager_loading(Item.objects.filter(parent_container=container, user=user))
+
+    regular, regular_time = timed(lambda: JSONRenderer().render(ItemSerializer(items_queryset(), many=True).data))
+    fast, fast_time = timed(lambda: JSONRenderer().render(serialize_items_fast(items_queryset())))
+
+    assert regular == fast, "serialize_items_fast output differs from ItemSerializer's."
+    print(f"{size:>6} items: ItemSerializer {regular_time:.2f}s, serialize_items_fast {fast_time:.2f}s, {regular_time / fast_time:.1f}x faster.")
+
+
+def run(*args):
+    """
+    with "py manage.py runscript benchmark_item_serialization" to compare
+    ItemSerializer and serialize_items_fast over 1k, 10k and 50k items with
+    two spectrum values each, or over "--script-args <size> ...".
+    Everything is created in a transaction rolled back at the end.
+    """
+    sizes = [int(i) for i in args] or [1000, 10000, 50000]
+
+    with transaction.atomic():
+        user = User.objects.create_user('benchmark_item_serialization_user')
+        spectrum_types = [SpectrumType.objects.create(name=f"benchmark_{i}", description="", user=user) for i in range(2)]
+
+        for size in sizes:
+            benchmark(size, user, spectrum_types)
+
+        transaction.set_rollback(True)
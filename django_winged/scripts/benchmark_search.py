@@ -0,0 +1,59 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from winged_app.models import Item
+from winged_app.search import search_items
+
+
+WORDS = (
+    "call email review draft send book fix clean buy check write update report team client invoice "
+    "budget meeting friday monday doctor dentist passport bank loan garden fence paint plants groceries "
+    "milk eggs bread car insurance tax return flight hotel birthday gift course chapter exercise"
+    ).split()
+
+
+def timed(function, repeat=5):
+    function()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def run(*args):
+    """
+    with "py manage.py runscript benchmark_search" to time /search/ queries,
+    a first page of 20 results and their count, over 100k items with edit
+    history, or "--script-args <size>" items.
+    Everything is created in a transaction rolled back at the end.
+    """
+    size = int(args[0]) if args else 100000
+    rng = random.Random(0)
+
+    with transaction.atomic():
+        user = User.objects.create_user('benchmark_search_user')
+        items = Item.objects.bulk_create(
+            (Item(statement=' '.join(rng.choice(WORDS) for _ in range(8)), user=user) for _ in range(size)),
+            batch_size=1000,
+            )
+        for item in items[::10]: # Some edit history.
+            item.statement = ' '.join(rng.choice(WORDS) for _ in range(8))
+        Item.objects.bulk_update(items[::10], ['statement'], batch_size=1000)
+        if connection.vendor == 'postgresql': # Steady state: planner stats and GIN pending lists merged, as autovacuum does.
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE winged_app_item")
+                cursor.execute("ANALYZE winged_app_itemsearchdocument")
+                cursor.execute("SELECT gin_clean_pending_list('winged_app_itemsearchdocument_search_vector_gin')")
+                cursor.execute("SELECT gin_clean_pending_list('winged_app_itemsearchdocument_history_search_vector_gin')")
+
+        for query, include_history in [("passport", False), ("bank loan", False), ("doctor friday", True), ("unmatched", False)]:
+            def page():
+                results = search_items(Item.objects.filter(user=user), query, include_history)
+                return results.count(), list(results[:20])
+            (count, _), seconds = timed(page)
+            print(f"{size} items, q={query!r} history={include_history}: {count} matches, first page and count in {seconds * 1000:.1f}ms.")
+
+        transaction.set_rollback(True)
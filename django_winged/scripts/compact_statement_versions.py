@@ -0,0 +1,17 @@
+from winged_app.models import ItemStatementVersion, CriteriaStatementVersion
+from winged_app.version_history import compact_versions, SNAPSHOT_INTERVAL
+
+
+def run(*args):
+    """
+    with "py manage.py runscript compact_statement_versions" to store past
+    item and criteria statement versions as snapshots plus compressed deltas
+    and print the space saved, "--script-args <n>" keeps up to n deltas per snapshot.
+    Safe to run again at any time, e.g. from cron, it only compacts new versions.
+    """
+    snapshot_interval = int(args[0]) if args else SNAPSHOT_INTERVAL
+
+    for version_model, parent_field in [(ItemStatementVersion, 'parent_item'), (CriteriaStatementVersion, 'parent_criteria')]:
+        before, after = compact_versions(version_model, parent_field, snapshot_interval)
+        saved = f"{1 - after / before:.2%}" if before else "n/a"
+        print(f"{version_model.__name__}: {before} -> {after} statement bytes, {saved} saved.")
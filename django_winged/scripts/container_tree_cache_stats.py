@@ -0,0 +1,20 @@
+from winged_app.tree_cache import container_tree_cache_stats, reset_container_tree_cache_stats
+
+
+def run(*args):
+    """
+    with "py manage.py runscript container_tree_cache_stats" to print
+    container tree cache hits, misses and hit ratio,
+    add "--script-args reset" to start counting again.
+    Needs a cache shared with the web workers (REDIS_URL), with a process
+    local one ask a worker instead: GET container-tree-cache-stats/ as staff.
+    """
+    stats = container_tree_cache_stats()
+    if not stats['shared']:
+        print("Cache is local to this process, the web workers' counts are at GET container-tree-cache-stats/.")
+        return
+    ratio = f"{stats['hit_ratio']:.2%}" if stats['hit_ratio'] is not None else "n/a"
+    print(f"hits: {stats['hits']}, misses: {stats['misses']}, hit ratio: {ratio}")
+
+    if "reset" in args:
+        reset_container_tree_cache_stats()
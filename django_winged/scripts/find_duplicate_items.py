@@ -0,0 +1,23 @@
+from django.contrib.auth.models import User
+
+from winged_app.models import Item
+from winged_app.duplicates import find_duplicate_items, DEFAULT_THRESHOLD
+
+
+def run(*args):
+    """
+    with "py manage.py runscript find_duplicate_items --script-args <username> [container id or all] [threshold]"
+    to print clusters of near-duplicate items of the user, in the container if given.
+    """
+    user = User.objects.get(username=args[0])
+    items = Item.objects.filter(user=user)
+    if len(args) > 1 and args[1] != 'all':
+        items = items.filter(parent_container_id=int(args[1]))
+    threshold = int(args[2]) if len(args) > 2 else DEFAULT_THRESHOLD
+
+    clusters = find_duplicate_items(items, threshold)
+    for cluster in clusters:
+        print(f"{len(cluster)} items:")
+        for id, statement, parent_container_id in cluster:
+            print(f"    {id} (container {parent_container_id}): {statement}")
+    print(f"{len(clusters)} clusters, {sum(len(cluster) for cluster in clusters)} items at threshold {threshold}.")
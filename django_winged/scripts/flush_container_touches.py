@@ -0,0 +1,12 @@
+from winged_app.container_touches import flush_last_opened_at, is_buffering
+
+
+def run():
+    """
+    with "py manage.py runscript flush_container_touches" to write containers
+    last_opened_at buffered in the cache to db in bulk, run it periodically, e.g. from cron.
+    """
+    if not is_buffering():
+        print("BUFFER_CONTAINER_TOUCHES is off, touches are written right away, nothing to flush.")
+        return
+    print(f"{flush_last_opened_at()} containers flushed.")
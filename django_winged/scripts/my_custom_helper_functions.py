@@ -1,6 +1,7 @@
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from winged_app.models import Item, Criteria, ItemVsTwoCriteriaAIComparison
-from scripts.bart_large_mnli_compare import item_vs_criteria
+from scripts.bart_large_mnli_compare import item_vs_criteria, items_vs_criteria, concurrent_items_vs_criteria
 
 
 """
@@ -24,6 +25,26 @@ def create_user_comparison_record(request, item, actionable):
     return comparison
 
 
+def create_user_comparison_records(request, item_statement_version_ids, actionable):
+    """
+    Like create_user_comparison_record for many items at once,
+    given their current_statement_version ids, in one insert.
+    """
+    actionable_criteria = get_object_or_404(Criteria, name="actionable", user=request.user)
+    non_actionable_criteria = get_object_or_404(Criteria, name="non-actionable", user=request.user)
+
+    return ItemVsTwoCriteriaAIComparison.objects.bulk_create([
+        ItemVsTwoCriteriaAIComparison(
+            user_choice=True,
+            criteria_statement_version_1=actionable_criteria.current_criteria_statement_version,
+            criteria_statement_version_2=non_actionable_criteria.current_criteria_statement_version,
+            item_compared_statement_version_id=item_statement_version_id,
+            criteria_choice=actionable,
+            )
+        for item_statement_version_id in item_statement_version_ids
+        ])
+
+
 def reclassify_items(items, criteria_1, criteria_2, comparison_function):
     total = len(items)
     count = 0
@@ -45,13 +66,43 @@ def reclassify_items(items, criteria_1, criteria_2, comparison_function):
         print(success_message)
 
 
+def reclassify_items_in_batches(items, criteria_1, criteria_2, batch_comparison_function=items_vs_criteria):
+    """
+    Like reclassify_items with a comparison function taking many items at once,
+    see items_vs_criteria, saving each batch's results with one update per choice.
+    """
+    items = list(items)
+    total = len(items)
+    statements = {item.pk: item.statement for item in items}
+    count = 0
+
+    def save_batch(results):
+        nonlocal count
+        results = dict(results)
+        for choice in (True, False):
+            item_ids = [pk for pk, result in results.items() if result is choice]
+            try:
+                Item.objects.filter(pk__in=item_ids).update(actionable=choice, updated_at=timezone.now())
+            except Exception as e: # Reported as failed, later batches still saved.
+                results.update({pk: e for pk in item_ids})
+
+        for pk, result in results.items():
+            count += 1
+            if isinstance(result, Exception):
+                print(f"{pk}|'{' '.join(statements[pk].split(' ')[0:5])}...' failed to be processed. {result}")
+            else:
+                print(f"{count}/{total} processed. '{statements[pk]}'\nsent to {'actionable' if result else 'non-actionable'}.")
+
+    batch_comparison_function(items, criteria_1, criteria_2, on_batch=save_batch)
+
+
 def run():
     """
     with "py manage.py runscript my_custom_helper_functions" to
-    run reclassify_items over all items in db.
+    run reclassify_items_in_batches over all items in db.
     """
     items = Item.objects.all()
     actionable = Criteria.objects.get(name="actionable")
     non_actionable = Criteria.objects.get(name="non-actionable")
 
-    reclassify_items(items, actionable, non_actionable, item_vs_criteria)
\ No newline at end of file
+    reclassify_items_in_batches(items, actionable, non_actionable, concurrent_items_vs_criteria)
\ No newline at end of file
@@ -1,10 +1,16 @@
 import os
 import openai
 import Levenshtein
-import time
+
+from scripts.ai_client import get_client, parse_retry_after
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+RETRYABLE_ERRORS = (
+    openai.error.Timeout, openai.error.APIConnectionError, openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError, openai.error.APIError, openai.error.TryAgain,
+    )
+
 system_content = """Choose one item from a given 
             set of two items based on a statement of values. Your output should be ONLY the string of the 
             chosen item, without any additional text. The items are strings of text of any kind. Please focus 
@@ -20,8 +26,17 @@ assistant_content = "what materials are out there for the concept of 'work ethic
 user_content = "1.'{}'.\n2.'{}'.\n\nValues: '{}'"
 
 
+def create_chat_completion(**kwargs):
+    try:
+        return openai.ChatCompletion.create(**kwargs)
+    except RETRYABLE_ERRORS as e:
+        e.retry_after = parse_retry_after((e.headers or {}).get("retry-after"))
+        raise
+
+
 def gpt_compare(criteria, item_1, item_2):
-    time.sleep(1)
+    client = get_client("openai")
+    openai.requestssession = client.session
     messages=[
             {"role": "system", "content": system_content},
             {"role": "user", "content": user_content_set_up},
@@ -29,11 +44,10 @@ def gpt_compare(criteria, item_1, item_2):
             {"role": "user", "content": user_content.format(item_1, item_2, criteria)},
         ]
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=messages,
-        temperature=0.2,
-    )
+    response = client.call(
+        lambda: create_chat_completion(model="gpt-4", messages=messages, temperature=0.2, request_timeout=60),
+        retry_on=RETRYABLE_ERRORS,
+        )
 
     chosen_item = response['choices'][0]['message']['content'].strip()
 
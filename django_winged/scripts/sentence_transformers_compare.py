@@ -1,56 +1,79 @@
-import torch
-import torch.nn.functional as F
 import time
 
+import numpy as np
+
+from functools import lru_cache
+
 from sentence_transformers import SentenceTransformer
 from winged_app.models import CriterionVsItemsAIComparison
+from winged_app.embeddings import get_embeddings, cosine_similarities, ENCODE_BATCH_SIZE
 
 
 def all_MiniLM_L6_v2_criterion_vs_items(criterion, item_1, item_2):
     return criterion_vs_items(criterion, item_1, item_2, model_name="all-MiniLM-L6-v2")
 
-model_name = "sentence-transformers/all-MiniLM-L6-v2"
-model = SentenceTransformer(model_name)
 
-def strings_compute_criterion_embedding_comparison(criteria, item_1, item_2):
-    # Convert criteria and items to embeddings
-    embeddings = model.encode([criteria, item_1, item_2])
+@lru_cache(maxsize=None)
+def get_sentence_transformer(model_name):
+    """
+    returns sentence-transformers/<model_name>, loaded once per process.
+    """
+    return SentenceTransformer("sentence-transformers/" + model_name)
 
-    # Normalize embeddings
-    embeddings = F.normalize(torch.tensor(embeddings), p=2, dim=1)
 
-    # Compute cosine similarity between criteria and items
-    similarity_with_item_1 = F.cosine_similarity(embeddings[0].unsqueeze(0), embeddings[1].unsqueeze(0))
-    similarity_with_item_2 = F.cosine_similarity(embeddings[0].unsqueeze(0), embeddings[2].unsqueeze(0))
+def embed_versions(versions, model_name):
+    """
+    returns model_name embeddings of item or criteria statement versions, each
+    encoded once ever and stored, see embeddings.get_embeddings. Call it with
+    every version up front to fill the store in batches.
+    """
+    return get_embeddings(versions, model_name, lambda texts: get_sentence_transformer(model_name).encode(texts, batch_size=ENCODE_BATCH_SIZE))
 
-    # Compare similarities
-    return similarity_with_item_2 > similarity_with_item_1
+
+def compute_criterion_embedding_comparison(criterion_version, item_1_version, item_2_version, model_name):
+    """
+    returns the similarities response and whether item_2_version is closer to criterion_version.
+    """
+    embeddings = embed_versions([criterion_version, item_1_version, item_2_version], model_name)
+    similarity_with_item_1, similarity_with_item_2 = cosine_similarities(embeddings[0], embeddings[1:])
+    response = {"similarities": [float(similarity_with_item_1), float(similarity_with_item_2)]}
+    return response, bool(similarity_with_item_2 > similarity_with_item_1)
 
 
-def compute_criterion_embedding_comparison(criteria, item_1, item_2, model_name):
-    model_name = "sentence-transformers/" + model_name
-    model = SentenceTransformer(model_name)
-    # Convert criteria and items to embeddings
-    embeddings = model.encode([criteria, item_1, item_2])
 
-    # Normalize embeddings
-    embeddings = F.normalize(torch.tensor(embeddings), p=2, dim=1)
+def versions_comparison_function(model_name, versions=()):
+    """
+    returns a binary insertion comparison of (criteria, item_1, item_2), True
+    when item_2 is closer, on their current versions' embeddings. Those of
+    versions are filled and loaded up front, the comparison computes from them
+    without queries and only loads versions it wasn't given.
+    """
+    embeddings = {}
 
-    # Compute cosine similarity between criteria and items
-    similarity_with_item_1 = F.cosine_similarity(embeddings[0].unsqueeze(0), embeddings[1].unsqueeze(0))
-    similarity_with_item_2 = F.cosine_similarity(embeddings[0].unsqueeze(0), embeddings[2].unsqueeze(0))
+    def load(versions):
+        # Keyed by model too, item and criteria version pks overlap.
+        versions = list(versions)
+        embeddings.update(zip(((type(version), version.pk) for version in versions), embed_versions(versions, model_name)))
 
-    # Compare similarities
-    return similarity_with_item_2 > similarity_with_item_1
+    def compare(criteria, item_1, item_2):
+        versions = [criteria.current_criteria_statement_version, item_1.current_statement_version, item_2.current_statement_version]
+        missing = [version for version in versions if (type(version), version.pk) not in embeddings]
+        if missing:
+            load(missing)
+        criterion_vector, *item_vectors = [embeddings[(type(version), version.pk)] for version in versions]
+        similarity_with_item_1, similarity_with_item_2 = cosine_similarities(criterion_vector, np.stack(item_vectors))
+        return bool(similarity_with_item_2 > similarity_with_item_1)
 
+    load(versions)
+    return compare
 
 
 def compute_and_store_criterion_comparison(criteria, item_1, item_2, model_name):
     start_time = time.time()
     response, item_choice = compute_criterion_embedding_comparison(
-        criteria.current_criteria_statement_version.computed_statement,
-        item_1.current_statement_version.statement,
-        item_2.current_statement_version.statement,
+        criteria.current_criteria_statement_version,
+        item_1.current_statement_version,
+        item_2.current_statement_version,
         model_name,
     )
     end_time = time.time()
@@ -58,14 +81,14 @@ def compute_and_store_criterion_comparison(criteria, item_1, item_2, model_name)
     if response:
         comparison = CriterionVsItemsAIComparison.objects.create(
             ai_model=model_name,
-            criterion_statement_version=criteria.current_criteria_statement_version.computed_statement,
-            item_compared_1_statement_version=item_1.current_statement_version.statement,
-            item_compared_2_statement_version=item_2.current_statement_version.statement,
+            criterion_statement_version=criteria.current_criteria_statement_version,
+            item_compared_1_statement_version=item_1.current_statement_version,
+            item_compared_2_statement_version=item_2.current_statement_version,
             response=response,
             item_choice=item_choice,
             execution_in_seconds=end_time - start_time
         )
-        return comparison.criteria_choice
+        return comparison.item_choice
 
     raise ValueError("Comparison computation failed.")
 
@@ -105,6 +128,6 @@ def criterion_vs_items(criterion, item_1, item_2, model_name, force_recompute=Fa
         ).order_by('created_at').reverse().first()
         if not comparison:
             raise CriterionVsItemsAIComparison.DoesNotExist
-        return comparison.criteria_choice
+        return comparison.item_choice
     except CriterionVsItemsAIComparison.DoesNotExist:
         return compute_and_store_criterion_comparison(criterion, item_1, item_2, model_name)
\ No newline at end of file
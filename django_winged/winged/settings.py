@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
+
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -96,6 +98,57 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Local memory by default, set REDIS_URL (e.g. redis://localhost:6379/0) to share it between processes.
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'winged',
+        }
+    }
+
+# Seconds a serialized container tree stays cached, signals invalidate it sooner on changes.
+CONTAINER_TREE_CACHE_TIMEOUT = 60 * 60
+
+# Buffer container last_opened_at touches in the cache, flushed to db by
+# "py manage.py runscript flush_container_touches". Needs a cache shared between
+# processes (Redis), otherwise every open is written right away.
+BUFFER_CONTAINER_TOUCHES = bool(REDIS_URL)
+
+# Seconds a buffered container last_opened_at stays merged into reads, well past
+# the flush interval (py manage.py runscript flush_container_touches).
+CONTAINER_TOUCH_TIMEOUT = 60 * 60 * 24
+
+# Zero-shot classifier for item vs criteria comparisons, see scripts/bart_large_mnli_compare.py:
+# "inference_api" (Hugging Face hosted), "local" (transformers pipeline of ZERO_SHOT_MODEL, a hub name or path) or "stub" (offline).
+ZERO_SHOT_BACKEND = os.getenv("ZERO_SHOT_BACKEND", "inference_api")
+ZERO_SHOT_MODEL = os.getenv("ZERO_SHOT_MODEL", "facebook/bart-large-mnli")
+# Batches of statements classified at once when reclassifying a container.
+ZERO_SHOT_CONCURRENCY = int(os.getenv("ZERO_SHOT_CONCURRENCY", 8))
+
+# Precision statement embeddings are stored at, float16 halves their size for a negligible loss in similarity.
+EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "float16")
+
+# Outbound AI provider clients, see scripts/ai_client.py: requests per second (rate) and
+# burst, retries with backoff from base_delay up to max_delay seconds, and a circuit
+# opening after failure_threshold failures in a row for reset_timeout seconds.
+AI_CLIENTS = {
+    'huggingface': {'rate': 5, 'burst': 10, 'max_attempts': 3, 'failure_threshold': 5, 'reset_timeout': 30},
+    'openai': {'rate': 1, 'burst': 3, 'max_attempts': 5, 'failure_threshold': 5, 'reset_timeout': 60},
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -4,7 +4,9 @@ from winged_app.views import (
     ContainerItemListAPIView, ContainerTreeView, ContainerViewSet,
     ItemViewSet, ItemStatementVersionViewSet, UserViewSet, SpectrumValueViewSet,
     SpectrumTypeViewSet, RunScriptAPIView, ReEvaluateActionableItemsAPIView,
-    ItemsVsSpectrumOpeanAiComparisonCost
+    ItemsVsSpectrumOpeanAiComparisonCost, ContainerSubtreeItemListAPIView,
+    ReEvaluateSubtreeActionableItemsAPIView, ContainerItemBulkCreateAPIView, ItemSearchAPIView,
+    ItemDuplicatesAPIView, ContainerTreeCacheStatsAPIView
     )
 from django.contrib import admin
 from rest_framework.authtoken.views import obtain_auth_token
@@ -26,11 +28,18 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include(router.urls)),
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
+    path('search/', ItemSearchAPIView.as_view(), name='search'),
+    path('duplicates/', ItemDuplicatesAPIView.as_view(), name='duplicates'),
+    path('container-tree-cache-stats/', ContainerTreeCacheStatsAPIView.as_view(), name='container-tree-cache-stats'),
     path('containers/<int:pk>/items/', ContainerItemListAPIView.as_view(), name='container-items'),
+    path('containers/<int:pk>/items/bulk-create/', ContainerItemBulkCreateAPIView.as_view(), name='container-items-bulk-create'),
+    path('containers/<int:pk>/items/duplicates/', ItemDuplicatesAPIView.as_view(), name='container-item-duplicates'),
+    path('containers/<int:pk>/subtree/items/', ContainerSubtreeItemListAPIView.as_view(), name='container-subtree-items'),
 
     path("containers/<int:container_id>/run-script/spectrumtypes/<int:spectrumtype_id>/<str:comparison_mode>/", RunScriptAPIView.as_view(), name="run-script"),
 
     path('containers/<int:source_container_id>/reclassify-actionable/', ReEvaluateActionableItemsAPIView.as_view(), name='reclassify-actionable-container-items'),
+    path('containers/<int:source_container_id>/subtree/reclassify-actionable/', ReEvaluateSubtreeActionableItemsAPIView.as_view(), name='reclassify-actionable-container-subtree-items'),
     
     path('containers/<int:container_id>/spectrumtypes/<int:spectrumtype_id>/items-vs-spectrum-comparison-cost/', ItemsVsSpectrumOpeanAiComparisonCost.as_view(), name='items-vs-spectrum-comparison-cost')
 ]
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class WingedAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'winged_app'
\ No newline at end of file
+    name = 'winged_app'
+
+    def ready(self):
+        import winged_app.signals # Connect receivers.
+        from winged_app.search import install_sqlite_search
+        post_migrate.connect(install_sqlite_search, sender=self)
@@ -0,0 +1,113 @@
+"""
+Cache buffer of container last_opened_at touches.
+
+Opening a container only records when in the cache and appends its id to a
+log numbered by an atomic counter. flush_last_opened_at later writes every
+logged container with one bulk UPDATE, leaving updated_at, and so anything
+validated on it, alone. Until then reads merge the buffered value in.
+
+Only with settings.BUFFER_CONTAINER_TOUCHES, which needs a cache shared by the
+web workers and the flush script, e.g. Redis. A process local one would keep
+touches where the flush never sees them.
+"""
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+
+from winged_app.tree_cache import is_shared_cache
+
+
+SEQUENCE_KEY = "container_touches:sequence"
+FLUSHED_KEY = "container_touches:flushed"
+FLUSH_BATCH_SIZE = 2**10
+
+
+def is_buffering():
+    return settings.BUFFER_CONTAINER_TOUCHES
+
+
+@checks.register()
+def check_shared_cache(app_configs, **kwargs):
+    if is_buffering() and not is_shared_cache():
+        return [checks.Error(
+            "BUFFER_CONTAINER_TOUCHES needs a cache shared between processes.",
+            hint="Set REDIS_URL, or BUFFER_CONTAINER_TOUCHES = False to write touches right away.",
+            id='winged_app.E001',
+            )]
+    return []
+
+
+def _log_key(number):
+    return f"container_touches:log:{number}"
+
+
+def _last_opened_at_key(container_id):
+    return f"container_touches:last_opened_at:{container_id}"
+
+
+def buffer_last_opened_at(container_id, opened_at):
+    # Kept past flushes, merging it with the same db value is harmless and a
+    # touch landing mid flush can't be deleted before it is written.
+    cache.set(_last_opened_at_key(container_id), opened_at, timeout=settings.CONTAINER_TOUCH_TIMEOUT)
+    cache.add(SEQUENCE_KEY, 0, timeout=None)
+    try:
+        number = cache.incr(SEQUENCE_KEY)
+    except ValueError: # Evicted between add and incr, flush starts over too.
+        number = 1
+        cache.set(SEQUENCE_KEY, number, timeout=None)
+    cache.set(_log_key(number), container_id, timeout=None)
+
+
+def get_buffered_last_opened_at(container_ids):
+    """
+    returns {container id: buffered last_opened_at} for those with one.
+    """
+    container_ids = list(container_ids)
+    buffered = cache.get_many([_last_opened_at_key(container_id) for container_id in container_ids])
+    return {
+        container_id: buffered[_last_opened_at_key(container_id)]
+        for container_id in container_ids if _last_opened_at_key(container_id) in buffered
+        }
+
+
+def merge_last_opened_at(containers):
+    """
+    Sets last_opened_at on containers to their buffered value when it is later.
+    """
+    if not is_buffering():
+        return containers
+    buffered = get_buffered_last_opened_at(container.pk for container in containers)
+    for container in containers:
+        opened_at = buffered.get(container.pk)
+        if opened_at is not None and (container.last_opened_at is None or opened_at > container.last_opened_at):
+            container.last_opened_at = opened_at
+    return containers
+
+
+def flush_last_opened_at():
+    """
+    Writes buffered last_opened_at touches logged since the last flush to db,
+    one bulk UPDATE per FLUSH_BATCH_SIZE containers.
+    returns number of containers written.
+    """
+    from winged_app.models import Container
+
+    flushed = cache.get(FLUSHED_KEY, 0)
+    sequence = cache.get(SEQUENCE_KEY, 0)
+    if sequence < flushed: # Counter was evicted and started over.
+        flushed = 0
+
+    log_keys = [_log_key(number) for number in range(flushed + 1, sequence + 1)]
+    container_ids = set()
+    for start in range(0, len(log_keys), FLUSH_BATCH_SIZE):
+        container_ids.update(cache.get_many(log_keys[start:start + FLUSH_BATCH_SIZE]).values())
+
+    containers = [
+        Container(pk=container_id, last_opened_at=opened_at)
+        for container_id, opened_at in get_buffered_last_opened_at(container_ids).items()
+        ]
+    Container.objects.bulk_update(containers, ['last_opened_at'], batch_size=FLUSH_BATCH_SIZE)
+
+    cache.delete_many(log_keys)
+    cache.set(FLUSHED_KEY, sequence, timeout=None)
+    return len(containers)
@@ -0,0 +1,70 @@
+"""
+Near-duplicate detection over item statements.
+
+Every statement is scored against every later one with rapidfuzz.process.cdist,
+a block of rows at a time so memory stays at BLOCK_SIZE * len(statements)
+bytes, and pairs at or above the threshold are joined into clusters.
+"""
+import numpy as np
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
+
+
+DEFAULT_THRESHOLD = 90
+BLOCK_SIZE = 2**10
+
+
+def _find_root(parents, index):
+    while parents[index] != index:
+        parents[index] = parents[parents[index]]
+        index = parents[index]
+    return index
+
+
+def _union(parents, first, second):
+    first, second = _find_root(parents, first), _find_root(parents, second)
+    if first != second:
+        parents[max(first, second)] = min(first, second)
+
+
+def cluster_similar(statements, threshold=DEFAULT_THRESHOLD, workers=-1):
+    """
+    returns lists of indexes into statements, each with 2+ statements scoring at
+    least threshold (0-100 fuzz.ratio after lowercasing and stripping punctuation)
+    against another in it, largest first.
+    """
+    processed = [default_process(statement or '') for statement in statements]
+    parents = list(range(len(statements)))
+
+    # Exact duplicates joined up front, only distinct texts go through cdist.
+    first_index = {}
+    for index, text in enumerate(processed):
+        if text:
+            _union(parents, first_index.setdefault(text, index), index)
+    distinct = list(first_index)
+    distinct_indexes = list(first_index.values())
+
+    for start in range(0, len(distinct), BLOCK_SIZE):
+        scores = process.cdist(
+            distinct[start:start + BLOCK_SIZE], distinct[start:], scorer=fuzz.ratio,
+            processor=None, score_cutoff=threshold, dtype=np.uint8, workers=workers,
+            )
+        for row, column in zip(*np.nonzero(scores)):
+            if column > row: # Upper triangle, each pair once and not against itself.
+                _union(parents, distinct_indexes[start + row], distinct_indexes[start + column])
+
+    clusters = {}
+    for index in range(len(statements)):
+        clusters.setdefault(_find_root(parents, index), []).append(index)
+    return sorted((cluster for cluster in clusters.values() if len(cluster) > 1), key=len, reverse=True)
+
+
+def find_duplicate_items(items, threshold=DEFAULT_THRESHOLD, workers=-1):
+    """
+    returns clusters of near-duplicate items, as lists of (id, statement, parent_container_id), see cluster_similar.
+    """
+    rows = list(items.order_by('pk').values_list('id', 'statement', 'parent_container_id'))
+    return [
+        [rows[index] for index in cluster]
+        for cluster in cluster_similar([row[1] for row in rows], threshold, workers)
+        ]
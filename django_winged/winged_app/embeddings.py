@@ -0,0 +1,70 @@
+"""
+Persistent embeddings of item and criteria statement versions.
+
+A version's text never changes once it is a version (edits make a new one),
+so its embedding by a model is computed once, stored as a float16 or float32
+blob in StatementEmbedding and loaded from there ever after.
+"""
+import numpy as np
+from django.conf import settings
+
+from winged_app.models import StatementEmbedding, ItemStatementVersion, CriteriaStatementVersion
+
+
+ENCODE_BATCH_SIZE = 2**6
+VERSION_FIELDS = {
+    ItemStatementVersion: ('item_statement_version', 'parent_item'),
+    CriteriaStatementVersion: ('criteria_statement_version', 'parent_criteria'),
+}
+
+
+def to_blob(vector, dtype):
+    return np.asarray(vector, dtype=dtype).tobytes()
+
+
+def from_blob(blob, dtype):
+    return np.frombuffer(bytes(blob), dtype=dtype).astype(np.float32)
+
+
+def get_embeddings(versions, model_name, encode, dtype=None):
+    """
+    returns a float32 array with the model_name embedding of each of versions,
+    item or criteria statement versions, in order. Stored ones take one query per
+    version model, the rest are encoded by encode(texts), returning one vector
+    per text, ENCODE_BATCH_SIZE texts at a time, and stored at dtype
+    (settings.EMBEDDING_DTYPE by default).
+    """
+    dtype = dtype or settings.EMBEDDING_DTYPE
+    keys = [(type(version), version.pk) for version in versions]
+    embeddings = {}
+
+    for version_model in {version_model for version_model, pk in keys}:
+        field, parent_field = VERSION_FIELDS[version_model]
+        ids = {pk for model, pk in keys if model is version_model}
+        stored = StatementEmbedding.objects.filter(model_name=model_name, **{f'{field}__in': ids}).values_list(f'{field}_id', 'dtype', 'vector')
+        for version_id, stored_dtype, blob in stored:
+            embeddings[(version_model, version_id)] = from_blob(blob, stored_dtype)
+
+        # Reloaded with what computed_statement reads, not a query per version.
+        missing = [pk for pk in dict.fromkeys(pk for model, pk in keys if model is version_model) if (version_model, pk) not in embeddings]
+        missing_versions = version_model.objects.select_related(parent_field, 'delta_base').in_bulk(missing) if missing else {}
+        for start in range(0, len(missing), ENCODE_BATCH_SIZE):
+            batch = [missing_versions[pk] for pk in missing[start:start + ENCODE_BATCH_SIZE]]
+            vectors = np.asarray(encode([version.computed_statement or '' for version in batch]), dtype=np.float32)
+            # Ignoring conflicts, a concurrent fill may have stored the same ones.
+            StatementEmbedding.objects.bulk_create([
+                StatementEmbedding(model_name=model_name, dtype=dtype, vector=to_blob(vector, dtype), **{field: version})
+                for version, vector in zip(batch, vectors)
+                ], ignore_conflicts=True)
+            for version, vector in zip(batch, vectors):
+                embeddings[(version_model, version.pk)] = vector.astype(dtype).astype(np.float32) # As stored, same result on later reads.
+
+    return np.stack([embeddings[key] for key in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+
+
+def cosine_similarities(vector, vectors):
+    """
+    returns the cosine similarity of vector to each of vectors.
+    """
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(vector)
+    return vectors @ vector / np.where(norms == 0, 1, norms)
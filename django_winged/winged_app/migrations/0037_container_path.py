@@ -0,0 +1,41 @@
+# Generated by Django 4.2.3 on 2026-10-18 18:56
+
+from django.db import migrations, models
+
+
+def populate_container_paths(apps, schema_editor):
+    Container = apps.get_model('winged_app', 'Container')
+    parents = dict(Container.objects.values_list('id', 'parent_container_id'))
+    paths = {}
+
+    def build_path(container_id, seen=()):
+        if container_id in paths:
+            return paths[container_id]
+        parent_id = parents.get(container_id)
+        if parent_id is None or parent_id in seen + (container_id,): # Root, or a legacy cycle cut here.
+            path = f"/{container_id}/"
+        else:
+            path = f"{build_path(parent_id, seen + (container_id,))}{container_id}/"
+        paths[container_id] = path
+        return path
+
+    containers = list(Container.objects.only('id'))
+    for container in containers:
+        container.path = build_path(container.id)
+    Container.objects.bulk_update(containers, ['path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('winged_app', '0036_alter_itemvstwocriteriaaicomparison_criteria_statement_version_1_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='container',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=1024),
+        ),
+        migrations.RunPython(populate_container_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.3 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('winged_app', '0037_container_path'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['user', 'parent_container', 'actionable', 'archived', 'done'], name='item_container_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('archived', False), ('done', False)), fields=['user', 'parent_container', 'created_at'], name='item_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='spectrumvalue',
+            index=models.Index(fields=['user', 'spectrum_type', 'value'], name='spectrumvalue_type_value_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.3 on 2026-10-18 19:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('winged_app', '0038_item_spectrumvalue_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='criteriastatementversion',
+            name='delta_base',
+            field=models.ForeignKey(default=None, editable=False, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='deltas', to='winged_app.criteriastatementversion'),
+        ),
+        migrations.AddField(
+            model_name='criteriastatementversion',
+            name='statement_delta',
+            field=models.BinaryField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='itemstatementversion',
+            name='delta_base',
+            field=models.ForeignKey(default=None, editable=False, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='deltas', to='winged_app.itemstatementversion'),
+        ),
+        migrations.AddField(
+            model_name='itemstatementversion',
+            name='statement_delta',
+            field=models.BinaryField(default=None, null=True),
+        ),
+    ]
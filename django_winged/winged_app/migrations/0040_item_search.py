@@ -0,0 +1,90 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:02
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+from winged_app.version_history import apply_delta
+
+
+CREATE_TRIGGER = """
+CREATE FUNCTION winged_app_item_search_document() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO winged_app_itemsearchdocument (item_id, search_vector, history_search_vector)
+        VALUES (NEW.id, to_tsvector('english', coalesce(NEW.statement, '')), ''::tsvector);
+    ELSIF NEW.statement IS DISTINCT FROM OLD.statement THEN
+        UPDATE winged_app_itemsearchdocument SET
+            search_vector = to_tsvector('english', coalesce(NEW.statement, '')),
+            history_search_vector = history_search_vector || to_tsvector('english', coalesce(OLD.statement, ''))
+        WHERE item_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER winged_app_item_search_document
+AFTER INSERT OR UPDATE OF statement ON winged_app_item
+FOR EACH ROW EXECUTE FUNCTION winged_app_item_search_document();
+
+CREATE INDEX winged_app_itemsearchdocument_search_vector_gin ON winged_app_itemsearchdocument USING gin (search_vector);
+CREATE INDEX winged_app_itemsearchdocument_history_search_vector_gin ON winged_app_itemsearchdocument USING gin (history_search_vector);
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS winged_app_item_search_document ON winged_app_item;
+DROP FUNCTION IF EXISTS winged_app_item_search_document();
+"""
+
+
+def install_postgresql_search(apps, schema_editor):
+    """
+    Trigger keeping ItemSearchDocument current, its GIN indexes and a document per
+    existing item, past statements, compacted or not, included. Other backends
+    are handled by search.install_sqlite_search.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    ItemStatementVersion = apps.get_model('winged_app', 'ItemStatementVersion')
+    schema_editor.execute(CREATE_TRIGGER)
+    schema_editor.execute("""
+        INSERT INTO winged_app_itemsearchdocument (item_id, search_vector, history_search_vector)
+        SELECT id, to_tsvector('english', coalesce(statement, '')), ''::tsvector FROM winged_app_item
+        """)
+
+    history = {}
+    versions = ItemStatementVersion.objects.filter(parent_item__isnull=False).exclude(
+        statement__isnull=True, statement_delta__isnull=True
+        ).select_related('delta_base').order_by('parent_item_id', 'pk')
+    for version in versions.iterator(chunk_size=2**10):
+        statement = version.statement if version.statement_delta is None else apply_delta(version.delta_base.statement, version.statement_delta)
+        history.setdefault(version.parent_item_id, []).append(statement)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            "UPDATE winged_app_itemsearchdocument SET history_search_vector = to_tsvector('english', %s) WHERE item_id = %s",
+            [(' '.join(statements), item_id) for item_id, statements in history.items()],
+            )
+
+
+def remove_postgresql_search(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('winged_app', '0039_statement_version_deltas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemSearchDocument',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='winged_app.item')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+                ('history_search_vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+            ],
+        ),
+        migrations.RunPython(install_postgresql_search, remove_postgresql_search),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('winged_app', '0040_item_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='criterionvsitemsaicomparison',
+            name='criterion_statement_version',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='criterion_comparisons', to='winged_app.criteriastatementversion'),
+        ),
+        migrations.AlterField(
+            model_name='itemvstwocriteriaaicomparison',
+            name='item_compared_statement_version',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='one_item_vs_two_criteria_comparisons', to='winged_app.itemstatementversion'),
+        ),
+        migrations.AddIndex(
+            model_name='criterionvsitemsaicomparison',
+            index=models.Index(fields=['criterion_statement_version', 'item_compared_1_statement_version', 'item_compared_2_statement_version', 'ai_model', '-created_at'], name='criterionvsitems_model_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='criterionvsitemsaicomparison',
+            index=models.Index(condition=models.Q(('user_choice', True)), fields=['criterion_statement_version', 'item_compared_1_statement_version', 'item_compared_2_statement_version', 'ai_model', '-created_at'], name='criterionvsitems_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemvstwocriteriaaicomparison',
+            index=models.Index(fields=['item_compared_statement_version', 'criteria_statement_version_1', 'criteria_statement_version_2', 'ai_model', '-created_at'], name='itemvscriteria_model_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemvstwocriteriaaicomparison',
+            index=models.Index(condition=models.Q(('user_choice', True)), fields=['item_compared_statement_version', 'criteria_statement_version_1', 'criteria_statement_version_2', '-created_at'], name='itemvscriteria_user_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('winged_app', '0041_comparison_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatementEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=128)),
+                ('dtype', models.CharField(choices=[('float16', 'float16'), ('float32', 'float32')], max_length=8)),
+                ('vector', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('criteria_statement_version', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='winged_app.criteriastatementversion')),
+                ('item_statement_version', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='winged_app.itemstatementversion')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='statementembedding',
+            constraint=models.UniqueConstraint(condition=models.Q(('item_statement_version__isnull', False)), fields=('item_statement_version', 'model_name'), name='embedding_item_version_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='statementembedding',
+            constraint=models.UniqueConstraint(condition=models.Q(('criteria_statement_version__isnull', False)), fields=('criteria_statement_version', 'model_name'), name='embedding_criteria_version_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='statementembedding',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('criteria_statement_version__isnull', True), ('item_statement_version__isnull', False)), models.Q(('criteria_statement_version__isnull', False), ('item_statement_version__isnull', True)), _connector='OR'), name='embedding_one_version'),
+        ),
+    ]
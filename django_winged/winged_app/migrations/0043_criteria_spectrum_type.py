@@ -0,0 +1,41 @@
+# Generated by Django 4.2.3 on 2026-10-18 21:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_spectrum_type_criteria(apps, schema_editor):
+    """
+    Links criteria made for spectrum types before this field, found by their
+    "spectrum type <pk>" name, to them. Duplicates left by concurrent runs go.
+    """
+    Criteria = apps.get_model('winged_app', 'Criteria')
+    SpectrumType = apps.get_model('winged_app', 'SpectrumType')
+    spectrum_type_users = dict(SpectrumType.objects.values_list('id', 'user_id'))
+    linked = set()
+    for criteria in Criteria.objects.filter(name__startswith="spectrum type ").order_by('pk'):
+        spectrum_type_id = criteria.name[len("spectrum type "):]
+        if not spectrum_type_id.isdigit() or spectrum_type_users.get(int(spectrum_type_id)) != criteria.user_id:
+            continue
+        if int(spectrum_type_id) in linked:
+            criteria.delete()
+            continue
+        criteria.spectrum_type_id = int(spectrum_type_id)
+        criteria.save(update_fields=['spectrum_type'])
+        linked.add(int(spectrum_type_id))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('winged_app', '0042_statement_embeddings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='criteria',
+            name='spectrum_type',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='criteria', to='winged_app.spectrumtype'),
+        ),
+        migrations.RunPython(link_spectrum_type_criteria, migrations.RunPython.noop),
+    ]
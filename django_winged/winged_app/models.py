@@ -1,9 +1,182 @@
 from django.db import models, transaction
+from django.db.models import Value, Q
+from django.db.models.functions import Concat, Substr
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 
-class Container(models.Model):
+from winged_app.container_touches import buffer_last_opened_at, merge_last_opened_at, is_buffering
+from winged_app.version_history import apply_delta
+
+
+class TrackedFieldsMixin:
+    """
+    Keeps field values as loaded from db on the instance, so saves can tell
+    what changed without reading the row again.
+    """
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._track_loaded_values(fields)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._track_loaded_values(kwargs.get('update_fields'))
+
+    def _track_loaded_values(self, fields=None):
+        """
+        Marks fields, or every loaded field, as in sync with db.
+        """
+        loaded = getattr(self, '_loaded_values', {})
+        for field in self._meta.concrete_fields:
+            if (fields is None or field.name in fields or field.attname in fields) and field.attname in self.__dict__:
+                loaded[field.attname] = self.__dict__[field.attname]
+        self._loaded_values = loaded
+
+    def get_loaded_value(self, attname, default=None):
+        """
+        returns attname value as last loaded from or saved to db.
+        """
+        return getattr(self, '_loaded_values', {}).get(attname, default)
+
+    def get_dirty_fields(self):
+        """
+        returns names of fields changed since loaded, plus auto_now ones
+        as save sets them, or None for instances not loaded from db.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        dirty = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in self.__dict__: # Deferred fields can't have changed.
+                continue
+            if getattr(field, 'auto_now', False) or field.attname not in loaded or loaded[field.attname] != self.__dict__[field.attname]:
+                dirty.append(field.name)
+        return dirty
+
+
+class VersionedModelMixin(TrackedFieldsMixin):
+    """
+    Keeps every past value of versioned_field as a row of the model version_field points to.
+    The current version row holds None while its value lives on the instance. Once the
+    value changes, the old one is written to it and a new current version row is created.
+    """
+    versioned_field = None # Field on both models, e.g. 'statement'.
+    version_field = None # Current version row, e.g. 'current_statement_version'.
+    version_parent_field = None # Version rows' link back to instance, e.g. 'parent_item'.
+    versioned_at_field = None # Time of last value change, e.g. 'statement_updated_at'.
+
+    @classmethod
+    def get_version_model(cls):
+        return cls._meta.get_field(cls.version_field).related_model
+
+    def create_version(self):
+        return self.get_version_model().objects.create(**{self.versioned_field: None, self.version_parent_field: self, 'user_id': self.user_id})
+
+    def save(self, *args, **kwargs):
+        """
+        Custom save method to manage the current version row in a single pass,
+        writing only changed fields on updates.
+        """
+        with transaction.atomic(): # Make sure creations and saves are done in one db transaction.
+            if not self.pk: # Creating instance.
+                super().save(*args, **kwargs) # Need the pk before creating the version row.
+                setattr(self, self.version_field, self.create_version())
+                type(self).objects.filter(pk=self.pk).update(**{self.version_field: getattr(self, self.version_field)})
+                self._track_loaded_values([self.version_field])
+                return
+
+            # Updating Instance.
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = self.get_dirty_fields()
+            changed_fields = []
+
+            version_attname = self._meta.get_field(self.version_field).attname
+            if getattr(self, version_attname) is None:
+                setattr(self, self.version_field, self.create_version())
+                changed_fields.append(self.version_field)
+
+            if update_fields is None or self.versioned_field in update_fields:
+                previous_value = self.get_loaded_value(self.versioned_field, default=models.DEFERRED)
+                if previous_value is models.DEFERRED: # Not loaded from db, read it.
+                    previous_value = type(self).objects.values_list(self.versioned_field, flat=True).get(pk=self.pk)
+                if previous_value != getattr(self, self.versioned_field):
+                    # Keep previous value on current version row before dropping it for a new one.
+                    if self._meta.get_field(self.version_field).is_cached(self): # Keep the loaded row in sync too.
+                        version = getattr(self, self.version_field)
+                        setattr(version, self.versioned_field, previous_value)
+                        version.save(update_fields=[self.versioned_field])
+                    else:
+                        self.get_version_model().objects.filter(pk=getattr(self, version_attname)).update(**{self.versioned_field: previous_value})
+                    setattr(self, self.versioned_at_field, timezone.now())
+                    setattr(self, self.version_field, self.create_version())
+                    changed_fields += [self.versioned_at_field, self.version_field]
+
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields).union(changed_fields)
+            super().save(*args, **kwargs)
+
+
+class CompactableStatementVersion(TrackedFieldsMixin, models.Model):
+    """
+    Past statement versions, whole or compacted into a delta against an older
+    snapshot version of the same parent (see version_history.compact_versions).
+    Compacted versions hold statement None, like current ones, so read their
+    statement through stored_statement.
+    """
+    statement_delta = models.BinaryField(null=True, default=None, editable=False)
+    delta_base = models.ForeignKey('self', null=True, default=None, editable=False, related_name='deltas', on_delete=models.RESTRICT) # Cascades with its parent, see expand_deltas otherwise.
+
+    class Meta:
+        abstract = True
+
+    @property
+    def stored_statement(self):
+        """
+        returns statement this version holds itself, rebuilt when compacted.
+        """
+        if self.statement_delta is None:
+            return self.statement
+        return apply_delta(self.delta_base.statement, self.statement_delta)
+
+    def expand_deltas(self):
+        """
+        Stores versions compacted against self whole again, before self changes or goes.
+        """
+        base_statement = self.get_loaded_value('statement', default=self.statement)
+        deltas = list(self.deltas.all())
+        for version in deltas:
+            version.statement = apply_delta(base_statement, version.statement_delta)
+            version.statement_delta = version.delta_base = None
+        type(self).objects.bulk_update(deltas, ['statement', 'statement_delta', 'delta_base'])
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False): # Joins the versioned model save, if any, at no cost.
+            previous_statement = self.get_loaded_value('statement')
+            if previous_statement is not None and previous_statement != self.statement: # Only snapshots have dependents.
+                self.expand_deltas()
+            if self.statement is not None and self.statement_delta is not None: # Statement written over a compacted version.
+                self.statement_delta = self.delta_base = None
+                if kwargs.get('update_fields') is not None:
+                    kwargs['update_fields'] = set(kwargs['update_fields']).union(['statement_delta', 'delta_base'])
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            if self.statement is not None:
+                self.expand_deltas()
+            return super().delete(*args, **kwargs)
+
+
+class Container(TrackedFieldsMixin, models.Model):
     name = models.CharField(max_length=2**6)
     description = models.TextField(max_length=2**10)
     parent_container = models.ForeignKey('self', blank=True, null=True, on_delete=models.SET_NULL)
@@ -13,24 +186,104 @@ class Container(models.Model):
     last_opened_at = models.DateTimeField(null=True, default=None)
     is_on_actionables_tab = models.BooleanField(default=True)
     is_collapsed = models.BooleanField(default=True)
+    # Materialized path of ids from root to self, e.g. '/1/5/9/'. Maintained by save and delete.
+    path = models.CharField(max_length=2**10, db_index=True, default='', editable=False)
+
+    def save(self, *args, **kwargs):
+        """
+        Custom save method to keep path current on create and on move,
+        rebasing the whole moved subtree with one UPDATE.
+        """
+        with transaction.atomic(): # Make sure the container and its subtree paths change together.
+            if not self.pk: # Creating instance.
+                super().save(*args, **kwargs) # Need the pk before building path.
+                self.path = self.build_path()
+                Container.objects.filter(pk=self.pk).update(path=self.path)
+                return
+
+            update_fields = kwargs.get('update_fields')
+            # Parent as loaded tells a move apart from any other update.
+            moved = self.parent_container_id != self.get_loaded_value('parent_container_id', default=object())
+            if not moved or (update_fields is not None and 'parent_container' not in update_fields):
+                return super().save(*args, **kwargs)
+
+            # Moving instance.
+            old_path = self.path
+            new_path = self.build_path()
+            if old_path and new_path.startswith(old_path):
+                raise ValueError("Container can't be moved under itself or its descendants.")
+
+            self.path = new_path
+            super().save(*args, **kwargs)
+            if old_path:
+                Container.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(new_path), Substr('path', len(old_path) + 1))
+                    )
+
+    def delete(self, *args, **kwargs):
+        """
+        Children are orphaned through SET_NULL without calling save,
+        so their subtrees are rebased as roots here.
+        """
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            if self.path:
+                Container.objects.filter(path__startswith=self.path).update(path=Substr('path', len(self.path)))
+        return result
+
+    def build_path(self):
+        """
+        returns path for self as child of parent_container as currently in db.
+        """
+        parent_path = ''
+        if self.parent_container_id:
+            parent_path = Container.objects.values_list('path', flat=True).get(pk=self.parent_container_id)
+        return f"{parent_path or '/'}{self.pk}/"
+
+    def get_subtree(self):
+        """
+        returns self and every descendant container through one indexed path prefix predicate.
+        """
+        return Container.objects.filter(path__startswith=self.path, user=self.user)
+
+    def get_subtree_items(self):
+        """
+        returns items in self and in every descendant container.
+        """
+        return Item.objects.filter(parent_container__path__startswith=self.path, user=self.user)
 
     def __str__(self):
         return self.name
 
     def update_last_opened_at(self):
+        """
+        Buffers the touch in the cache when a shared one is configured, see
+        container_touches, otherwise writes just last_opened_at.
+        """
         self.last_opened_at = timezone.now()
-        self.save()
+        if is_buffering():
+            buffer_last_opened_at(self.pk, self.last_opened_at)
+        else:
+            Container.objects.filter(pk=self.pk).update(last_opened_at=self.last_opened_at) # Leaves updated_at alone.
 
         return True, self.last_opened_at
+
+    def get_last_opened_at(self):
+        """
+        returns last_opened_at with any touch not flushed to db yet merged in.
+        """
+        merge_last_opened_at([self])
+        return self.last_opened_at
     
     def toggle_tab(self):
         self.is_on_actionables_tab = not self.is_on_actionables_tab
-        self.save()
+        # Served in trees and listings validated on updated_at, so written right away, but only these.
+        self.save(update_fields=['is_on_actionables_tab', 'updated_at'])
 
         return self.is_on_actionables_tab
 
 
-class Item(models.Model):
+class Item(VersionedModelMixin, models.Model):
     actionable = models.BooleanField(default=False, null=False)
     done = models.BooleanField(default=False, null=False)
     statement = models.TextField(max_length=2**7)
@@ -46,35 +299,46 @@ class Item(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Container listings and reclassification filter on all of these.
+            models.Index(fields=['user', 'parent_container', 'actionable', 'archived', 'done'], name='item_container_state_idx'),
+            # Open items only, already in listing order. Partial on PostgreSQL and SQLite.
+            models.Index(fields=['user', 'parent_container', 'created_at'], name='item_open_idx', condition=Q(archived=False, done=False)),
+        ]
+
+    versioned_field = 'statement'
+    version_field = 'current_statement_version'
+    version_parent_field = 'parent_item'
+    versioned_at_field = 'statement_updated_at'
 
-    def save(self, *args, **kwargs):
+    @property
+    def moved_container(self):
+        """
+        True when parent_container changed since loaded from db.
         """
-        Custom save method to manage current_statement_version and ItemStatementVersion.
+        return self.parent_container_id != self.get_loaded_value('parent_container_id', default=self.parent_container_id)
 
+    @classmethod
+    def bulk_create_with_versions(cls, statements, parent_container, user):
         """
-        with transaction.atomic(): # Make sure creations and saves are done in one db transaction.
-            if not self.pk: # Creating instance.
-                super().save(*args, **kwargs)
-                self.current_statement_version = ItemStatementVersion.objects.create(statement=None, parent_item=self, user=self.user)
-                self.save()
-                return 
-            elif not self.current_statement_version:
-                self.current_statement_version = ItemStatementVersion.objects.create(statement=None, parent_item=self, user=self.user)
-                self.save()
-            else: # Updating Instance.
-                # Fetch self.statement as it was previous to change we are about to save.
-                current_statement = Item.objects.get(pk=self.pk).statement
-                if current_statement != self.statement: # Check if the statement string has been changed.
-                    # Assign statement on db to current current_statement_version field.
-                    self.current_statement_version.statement = current_statement
-                    self.statement_updated_at = timezone.now()
-                    # Save current_statement_version with old statement before droping new one.
-                    self.current_statement_version.save()
-                    # Drop previous current_statement_version for a new one.
-                    self.current_statement_version = ItemStatementVersion.objects.create(statement=None, parent_item=self, user=self.user)
-                    
-
-        return super().save(*args, **kwargs)
+        Creates one item per statement in parent_container, each with its
+        current_statement_version, like save does one by one.
+        Takes three queries however many statements: items, versions, link,
+        unless the backend splits big inserts (SQLite caps query parameters).
+        """
+        with transaction.atomic():
+            items = cls.objects.bulk_create([
+                cls(statement=statement, parent_container=parent_container, user=user) for statement in statements
+                ])
+            versions = ItemStatementVersion.objects.bulk_create([
+                ItemStatementVersion(statement=None, parent_item=item, user=user) for item in items
+                ])
+            for item, version in zip(items, versions):
+                item.current_statement_version = version
+            cls.objects.bulk_update(items, ['current_statement_version'])
+        for item in items:
+            item._track_loaded_values()
+        return items
 
 
     def __str__(self):
@@ -107,7 +371,7 @@ class Item(models.Model):
         self.save()
         return self.done
 
-class ItemStatementVersion(models.Model):
+class ItemStatementVersion(CompactableStatementVersion):
     """
     Statements that an element has had.
     """
@@ -118,10 +382,21 @@ class ItemStatementVersion(models.Model):
     
     @property
     def computed_statement(self):
-        return self.statement if self.statement else self.parent_criteria.statement
+        stored_statement = self.stored_statement
+        return stored_statement if stored_statement else self.parent_item.statement
     
     def __str__(self) -> str:
-        return self.statement if self.statement else self.parent_item.statement
+        return self.computed_statement
+
+class ItemSearchDocument(models.Model):
+    """
+    Search vectors of an item's statement and of its past statements, on PostgreSQL.
+    Written only by a trigger on the item table (see migration 0040), read through search.search_items.
+    """
+    item = models.OneToOneField(Item, primary_key=True, related_name='search_document', on_delete=models.CASCADE)
+    search_vector = SearchVectorField(null=True)
+    history_search_vector = SearchVectorField(null=True)
+
 
 class SpectrumType(models.Model):
     name = models.CharField(max_length=2**6)
@@ -133,6 +408,19 @@ class SpectrumType(models.Model):
     def __str__(self) -> str:
         return self.name
 
+    def get_criteria(self):
+        """
+        returns the Criteria whose statement versions follow this spectrum type's
+        description, for comparisons keyed on statement versions.
+        """
+        criteria, created = Criteria.objects.get_or_create(
+            spectrum_type=self, defaults={'name': self.name, 'statement': self.description, 'user': self.user},
+            ) # Unique, a concurrent create loses and gets the winner's.
+        if criteria.statement != self.description: # Edited description, new version.
+            criteria.statement = self.description
+            criteria.save()
+        return criteria
+
 
 class SpectrumValue(models.Model):
     value = models.IntegerField()
@@ -145,6 +433,10 @@ class SpectrumValue(models.Model):
 
     class Meta:
         unique_together = ('spectrum_type', 'parent_item')
+        indexes = [
+            # Ranking and cost views filter values of a spectrum type by user and value.
+            models.Index(fields=['user', 'spectrum_type', 'value'], name='spectrumvalue_type_value_idx'),
+        ]
 
     def __str__(self) -> str:
         first_five_words = " ".join(word for word in self.parent_item.statement.split(" ")[:5])
@@ -162,7 +454,7 @@ class ItemVsTwoCriteriaAIComparison(models.Model):
     criteria_statement_version_1 = models.ForeignKey('CriteriaStatementVersion', null=True, related_name='first_criteria_one_item_vs_two_criteria_comparisons', on_delete=models.SET_NULL, db_index=True) #if criterias are statement versions I can have access to parent Criteria on second level reference.
     criteria_statement_version_2 = models.ForeignKey('CriteriaStatementVersion', null=True, related_name='second_criteria_one_item_vs_two_criteria_comparisons', on_delete=models.SET_NULL, db_index=True)
 
-    item_compared_statement_version = models.ForeignKey(ItemStatementVersion, related_name="one_item_vs_two_criteria_comparisons", on_delete=models.CASCADE, db_index=True)
+    item_compared_statement_version = models.ForeignKey(ItemStatementVersion, related_name="one_item_vs_two_criteria_comparisons", on_delete=models.CASCADE, db_index=False) # Leads the composite indexes.
     
     criteria_choice = models.BooleanField(choices=CHOICES, null=False, default=False, db_index=True)
     response = models.JSONField(null=True, default=None)
@@ -170,6 +462,20 @@ class ItemVsTwoCriteriaAIComparison(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Latest model made comparison of an item version against two criteria versions.
+            models.Index(
+                fields=['item_compared_statement_version', 'criteria_statement_version_1', 'criteria_statement_version_2', 'ai_model', '-created_at'],
+                name='itemvscriteria_model_idx',
+                ),
+            # Latest user made one, few rows so partial.
+            models.Index(
+                fields=['item_compared_statement_version', 'criteria_statement_version_1', 'criteria_statement_version_2', '-created_at'],
+                name='itemvscriteria_user_idx', condition=Q(user_choice=True),
+                ),
+        ]
+
     def __str__(self) -> str:
         return self.item_compared_statement_version.parent_item.statement
 
@@ -182,7 +488,7 @@ class CriterionVsItemsAIComparison(models.Model):
     user_choice = models.BooleanField(null=False, default=False)
     system_prompt_text_version = models.ForeignKey('SystemPromptTextVersion', on_delete=models.SET_NULL, null=True)
 
-    criterion_statement_version = models.ForeignKey('CriteriaStatementVersion', null=True, related_name='criterion_comparisons', on_delete=models.SET_NULL, db_index=True)
+    criterion_statement_version = models.ForeignKey('CriteriaStatementVersion', null=True, related_name='criterion_comparisons', on_delete=models.SET_NULL, db_index=False) # Leads the composite indexes.
     
     item_compared_1_statement_version = models.ForeignKey(ItemStatementVersion, on_delete=models.CASCADE, related_name="first_item_statement_version_criterion_comparisons", null=True)
     item_compared_2_statement_version = models.ForeignKey(ItemStatementVersion, on_delete=models.CASCADE, related_name="second_item_statement_version_criterion_comparisons", null=True)
@@ -193,13 +499,54 @@ class CriterionVsItemsAIComparison(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Latest comparison of a criterion version against two item versions by a model.
+            models.Index(
+                fields=['criterion_statement_version', 'item_compared_1_statement_version', 'item_compared_2_statement_version', 'ai_model', '-created_at'],
+                name='criterionvsitems_model_idx',
+                ),
+            # Same for user made ones, few rows so partial.
+            models.Index(
+                fields=['criterion_statement_version', 'item_compared_1_statement_version', 'item_compared_2_statement_version', 'ai_model', '-created_at'],
+                name='criterionvsitems_user_idx', condition=Q(user_choice=True),
+                ),
+        ]
+
     def __str__(self):
         choice = f"{self.item_compared_1_statement_version.computed_statement if self.item_choice else self.item_compared_2_statement_version.computed_statement}"
         string = f"{self.criterion_statement_version.computed_statement} - {choice}"
         return string
 
 
-class Criteria(models.Model):
+class StatementEmbedding(models.Model):
+    """
+    An item or criteria statement version encoded by model_name, each version
+    encoded once per model. Written and read through embeddings.get_embeddings.
+    """
+    DTYPES = [
+        ('float16', 'float16'),
+        ('float32', 'float32'),
+    ]
+    model_name = models.CharField(max_length=2**7)
+    item_statement_version = models.ForeignKey('ItemStatementVersion', null=True, related_name='embeddings', on_delete=models.CASCADE, db_index=False) # Leads the unique constraints.
+    criteria_statement_version = models.ForeignKey('CriteriaStatementVersion', null=True, related_name='embeddings', on_delete=models.CASCADE, db_index=False)
+    dtype = models.CharField(max_length=2**3, choices=DTYPES)
+    vector = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item_statement_version', 'model_name'], condition=Q(item_statement_version__isnull=False), name='embedding_item_version_unique'),
+            models.UniqueConstraint(fields=['criteria_statement_version', 'model_name'], condition=Q(criteria_statement_version__isnull=False), name='embedding_criteria_version_unique'),
+            models.CheckConstraint(
+                check=Q(item_statement_version__isnull=False, criteria_statement_version__isnull=True) | Q(item_statement_version__isnull=True, criteria_statement_version__isnull=False),
+                name='embedding_one_version',
+                ),
+        ]
+
+
+class Criteria(VersionedModelMixin, models.Model):
     name = models.CharField(max_length=2**6)
 
     statement = models.CharField(max_length=2**10, null=True)
@@ -207,44 +554,21 @@ class Criteria(models.Model):
 
     statement_updated_at = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE) # so users can modify even default actiona vs actionable criteria statements.
+    spectrum_type = models.OneToOneField(SpectrumType, null=True, blank=True, related_name='criteria', on_delete=models.CASCADE) # Set on the one following a spectrum type's description.
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
-        """
-        Custom save method to manage current_criteria_statement_version and CriteriaStatementVersion.
-
-        """
-        with transaction.atomic(): # Make sure creations and saves are done in one db transaction.
-            if not self.current_criteria_statement_version: # Creating instance.
-                super().save(*args, **kwargs) # Need to save created parent_criteria first to save CriteriaStatementVersion second.
-                self.current_criteria_statement_version = CriteriaStatementVersion.objects.create(statement=None, parent_criteria=self, user=self.user)
-                self.save() # save above change on current_criteria_statement_version again.
-                return
-            elif not self.current_criteria_statement_version:
-                self.current_criteria_statement_version = CriteriaStatementVersion.objects.create(statement=None, parent_criteria=self, user=self.user)
-                self.save() # save above change on current_criteria_statement_version again.
-                return 
-            else: # Updating Instance.
-                # Fetch self.statement as it was previous to change we are about to save.
-                current_statement = Criteria.objects.get(pk=self.pk).statement
-                if current_statement != self.statement: # Check if the statement string has been changed.
-                    # Assign statement on db to current_criteria_statement_version field.
-                    self.current_criteria_statement_version.statement = current_statement
-                    self.statement_updated_at = timezone.now()
-                    # Save current_criteria_statement_version befored droping it.
-                    self.current_criteria_statement_version.save()
-                    # Drop previous current_criteria_statement_version for a new one.
-                    self.current_criteria_statement_version = CriteriaStatementVersion.objects.create(statement=None, parent_criteria=self, user=self.user)
-
-        return super().save(*args, **kwargs)
+    versioned_field = 'statement'
+    version_field = 'current_criteria_statement_version'
+    version_parent_field = 'parent_criteria'
+    versioned_at_field = 'statement_updated_at'
 
     def __str__(self):
         return self.name
 
 
-class CriteriaStatementVersion(models.Model):
+class CriteriaStatementVersion(CompactableStatementVersion):
     statement = models.CharField(max_length=2**10, null=True)
     parent_criteria = models.ForeignKey(Criteria, null=True, on_delete=models.SET_NULL)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE) # so users can modify even default actiona vs actionable criteria statements.
@@ -253,13 +577,14 @@ class CriteriaStatementVersion(models.Model):
 
     @property
     def computed_statement(self):
-        return self.statement if self.statement else self.parent_criteria.statement
+        stored_statement = self.stored_statement
+        return stored_statement if stored_statement else self.parent_criteria.statement
 
     def __str__(self):
-        return self.statement if self.statement else self.parent_criteria.statement
+        return self.computed_statement
 
 
-class SystemPrompt(models.Model):
+class SystemPrompt(VersionedModelMixin, models.Model):
     name = models.CharField(max_length=2**6, unique=True)
 
     text = models.CharField(max_length=2**10, null=True)
@@ -272,34 +597,10 @@ class SystemPrompt(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
-        """
-        Custom save method to manage current_prompt_text_version and SystemPromptTextVersion.
-
-        """
-        with transaction.atomic(): # Make sure creations and saves are done in one db transaction.
-            if not self.current_prompt_text_version: # Creating instance.
-                super().save(*args, **kwargs) # Need to save created parent_criteria first to save SystemPromptTextVersion second.
-                self.current_prompt_text_version = SystemPromptTextVersion.objects.create(text=None, parent_prompt=self, user=self.user)
-                self.save() # save above change on current_prompt_text_version again.
-                return
-            elif not self.current_prompt_text_version:
-                self.current_prompt_text_version = SystemPromptTextVersion.objects.create(text=None, parent_prompt=self, user=self.user)
-                self.save() # save above change on current_prompt_text_version again.
-                return
-            else: # Updating Instance.
-                # Fetch self.text as it was previous to change we are about to save.
-                current_text = SystemPrompt.objects.get(pk=self.pk).text
-                if current_text != self.text: # Check if the text string has been changed.
-                    # Assign text on db to current_prompt_text_version field.
-                    self.current_prompt_text_version.text = current_text
-                    self.prompt_text_updated_at = timezone.now()
-                    # Save current_prompt_text_version before droping it.
-                    self.current_prompt_text_version.save()
-                    # Drop previous current_prompt_text_version for a new one.
-                    self.current_prompt_text_version = SystemPromptTextVersion.objects.create(text=None, parent_prompt=self, user=self.user)
-
-        return super().save(*args, **kwargs)
+    versioned_field = 'text'
+    version_field = 'current_prompt_text_version'
+    version_parent_field = 'parent_prompt'
+    versioned_at_field = 'prompt_text_updated_at'
 
     def __str__(self):
         return f"{self.name} - {self.ai_model if self.ai_model else 'user'}"
@@ -0,0 +1,27 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class ItemCursorPagination(CursorPagination):
+    """
+    Cursor pagination over (created_at, id). Opt-in through ?page_size=,
+    without it the whole listing comes back as a plain list.
+    """
+    ordering = ('created_at', 'id')
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        # Views may page over their own tie-free key instead, see order_items_by_spectrum.
+        get_pagination_ordering = getattr(view, 'get_pagination_ordering', None)
+        ordering = get_pagination_ordering() if get_pagination_ordering else None
+        return ordering or self.ordering
+
+
+class SearchResultsPagination(PageNumberPagination):
+    """
+    Numbered pages of search results, best ranked first.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,103 @@
+"""
+Full-text search over items' statements and, optionally, their past statements.
+
+On PostgreSQL ItemSearchDocument holds a tsvector per item, GIN indexed and
+kept current by a trigger on the item table (see migration 0040). Other
+backends, i.e. SQLite for local runs and tests, use an FTS5 table kept by
+triggers installed after migrate by install_sqlite_search.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, Q, FloatField
+from django.db.models.expressions import RawSQL
+
+
+SEARCH_CONFIG = 'english'
+HISTORY_WEIGHT = 0.4 # Past statements matter less than the current one.
+SQLITE_TABLE = 'winged_app_item_fts'
+
+
+def search_items(items, query, include_history=False):
+    """
+    returns items matching query, best first, with a search_rank annotation.
+    """
+    if not query.split():
+        return items.none()
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(items, query, include_history)
+    return _search_sqlite(items, query, include_history)
+
+
+def _search_postgresql(items, query, include_history):
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    match = Q(search_document__search_vector=search_query)
+    rank = SearchRank(F('search_document__search_vector'), search_query)
+    if include_history:
+        match |= Q(search_document__history_search_vector=search_query)
+        rank = rank + HISTORY_WEIGHT * SearchRank(F('search_document__history_search_vector'), search_query)
+    return items.filter(match).annotate(search_rank=rank).order_by('-search_rank', 'pk')
+
+
+def _search_sqlite(items, query, include_history):
+    # Every word as a quoted phrase, all required, so user input can't be FTS5 syntax.
+    fts_query = ' '.join('"{}"'.format(word.replace('"', '""')) for word in query.split())
+    if not include_history:
+        fts_query = f'{{statement}} : ({fts_query})'
+    match = RawSQL(f'SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s', [fts_query])
+    rank = RawSQL(
+        f'SELECT -bm25({SQLITE_TABLE}, 1.0, %s) FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s AND rowid = winged_app_item.id',
+        [HISTORY_WEIGHT, fts_query], output_field=FloatField(),
+        )
+    return items.filter(pk__in=match).annotate(search_rank=rank).order_by('-search_rank', 'pk')
+
+
+def install_sqlite_search(using, **kwargs):
+    """
+    post_migrate receiver making sure SQLite has the FTS5 table, its triggers and
+    every item indexed. Runs after every migrate as remaking the item table drops triggers.
+    """
+    from django.db import connections
+
+    sqlite_connection = connections[using]
+    if sqlite_connection.vendor != 'sqlite' or 'winged_app_item' not in sqlite_connection.introspection.table_names():
+        return
+    with sqlite_connection.cursor() as cursor:
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} USING fts5(statement, history, tokenize='porter unicode61')")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {SQLITE_TABLE}_insert AFTER INSERT ON winged_app_item BEGIN
+                INSERT INTO {SQLITE_TABLE}(rowid, statement, history) VALUES (new.id, new.statement, '');
+            END""")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {SQLITE_TABLE}_update AFTER UPDATE OF statement ON winged_app_item
+            WHEN new.statement IS NOT old.statement BEGIN
+                UPDATE {SQLITE_TABLE} SET statement = new.statement, history = history || ' ' || coalesce(old.statement, '')
+                WHERE rowid = new.id;
+            END""")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {SQLITE_TABLE}_delete AFTER DELETE ON winged_app_item BEGIN
+                DELETE FROM {SQLITE_TABLE} WHERE rowid = old.id;
+            END""")
+        cursor.execute(f"SELECT id, statement FROM winged_app_item WHERE id NOT IN (SELECT rowid FROM {SQLITE_TABLE})")
+        missing = cursor.fetchall()
+        history = _statement_history([item_id for item_id, statement in missing], using)
+        cursor.executemany(
+            f"INSERT INTO {SQLITE_TABLE}(rowid, statement, history) VALUES (%s, %s, %s)",
+            [(item_id, statement, ' '.join(history.get(item_id, []))) for item_id, statement in missing],
+            )
+
+
+def _statement_history(item_ids, using, chunk_size=500):
+    """
+    returns {item id: past statements, oldest first}, compacted versions rebuilt
+    from their deltas as migration 0040 does for PostgreSQL.
+    """
+    from winged_app.models import ItemStatementVersion
+
+    history = {}
+    for start in range(0, len(item_ids), chunk_size): # Under SQLite's query parameter limit.
+        versions = ItemStatementVersion.objects.using(using).filter(parent_item_id__in=item_ids[start:start + chunk_size]).exclude(
+            statement__isnull=True, statement_delta__isnull=True
+            ).select_related('delta_base').order_by('parent_item_id', 'pk')
+        for version in versions:
+            history.setdefault(version.parent_item_id, []).append(version.stored_statement)
+    return history
@@ -1,8 +1,50 @@
 from django.contrib.auth.models import User
 from winged_app.models import Container, Item, ItemStatementVersion, SpectrumValue, SpectrumType
+from django.db.models import F, Prefetch
 from rest_framework import serializers
 
 
+def containers_by_parent(containers):
+    """
+    Groups containers under their parent_container_id, roots under None.
+    Lets a whole tree be serialized from a single query.
+    """
+    children = {}
+    for container in containers:
+        children.setdefault(container.parent_container_id, []).append(container)
+    return children
+
+
+def spectrum_types_by_container(user, containers=None):
+    """
+    Maps the user's container ids, or just those in containers, to the SpectrumTypes
+    their items have values for, loaded in one grouped query instead of one join per container.
+    """
+    lookups = {'spectrumvalue__parent_item__parent_container__user': user}
+    if containers is not None: # Same filter() call so both lookups share one join.
+        lookups['spectrumvalue__parent_item__parent_container__in'] = containers
+    spectrum_types = SpectrumType.objects.filter(**lookups).annotate(container_id=F('spectrumvalue__parent_item__parent_container')).distinct().order_by('pk')
+
+    types_by_container = {}
+    for spectrum_type in spectrum_types:
+        types_by_container.setdefault(spectrum_type.container_id, []).append(spectrum_type)
+    return types_by_container
+
+
+def get_container_spectrum_types(container, context):
+    """
+    Serialized SpectrumTypes for container, read from the context map
+    (see spectrum_types_by_container) when the view provided one.
+    """
+    types_by_container = context.get('spectrum_types_by_container')
+    if types_by_container is not None:
+        spectrum_types = types_by_container.get(container.pk, [])
+    else:
+        spectrum_types = SpectrumType.objects.filter(spectrumvalue__parent_item__parent_container=container).distinct().order_by('pk')
+    serializer = SpectrumTypeSerializer(spectrum_types, many=True)
+    return serializer.data
+
+
 class ContainerChildrenListSerializer(serializers.ModelSerializer):
     children = serializers.SerializerMethodField()
     spectrum_types = serializers.SerializerMethodField()
@@ -12,14 +54,39 @@ class ContainerChildrenListSerializer(serializers.ModelSerializer):
         fields = ['spectrum_types', 'id', 'name', 'description', 'parent_container', 'children', 'is_collapsed', 'is_on_actionables_tab']
 
     def get_children(self, container):
-        children = container.container_set.exclude(parent_container=None)
-        serializer = self.__class__(children, many=True)
+        children_by_parent = self.context.get('children_by_parent')
+        if children_by_parent is not None: # Tree already fetched, see containers_by_parent.
+            children = children_by_parent.get(container.pk, [])
+        else:
+            children = container.container_set.exclude(parent_container=None)
+        serializer = self.__class__(children, many=True, context=self.context)
         return serializer.data
 
     def get_spectrum_types(self, container):
-        spectrum_types = SpectrumType.objects.filter(spectrumvalue__parent_item__parent_container=container).distinct()
-        serializer = SpectrumTypeSerializer(spectrum_types, many=True)
-        return serializer.data
+        return get_container_spectrum_types(container, self.context)
+
+
+class ContainerLazyTreeSerializer(ContainerChildrenListSerializer):
+    """
+    Expands only containers that aren't collapsed, collapsed ones come with
+    no children but a children_count hint so they can be fetched on demand.
+    Needs children_by_parent in context, and a children_count annotation on
+    containers whose children it doesn't hold.
+    """
+    children_count = serializers.SerializerMethodField()
+
+    class Meta(ContainerChildrenListSerializer.Meta):
+        fields = ContainerChildrenListSerializer.Meta.fields + ['children_count']
+
+    def get_children(self, container):
+        if container.is_collapsed:
+            return []
+        return super().get_children(container)
+
+    def get_children_count(self, container):
+        if hasattr(container, 'children_count'): # Annotated, see ContainerTreeView.get_lazy_containers.
+            return container.children_count
+        return len(self.context['children_by_parent'].get(container.pk, []))
 
 
 class ItemSerializer(serializers.ModelSerializer):
@@ -32,6 +99,15 @@ class ItemSerializer(serializers.ModelSerializer):
     def __init__(self, *args, **kwargs):
         kwargs['partial'] = True
         super().__init__(*args, **kwargs)
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Prefetches what get_spectrum_values reads, spectrum values with their
+        spectrum types, so listing items takes a constant number of queries.
+        """
+        spectrum_values = SpectrumValue.objects.select_related('spectrum_type').order_by('pk')
+        return queryset.prefetch_related(Prefetch('spectrumvalue_set', queryset=spectrum_values))
     
     def create(self, validated_data):
         # set the user_id to the authenticated user
@@ -45,6 +121,68 @@ class ItemSerializer(serializers.ModelSerializer):
 
 
 
+class ItemSearchResultSerializer(ItemSerializer):
+    search_rank = serializers.FloatField(read_only=True)
+
+    class Meta(ItemSerializer.Meta):
+        fields = ItemSerializer.Meta.fields + ['search_rank']
+
+
+def serialize_items_fast(items):
+    """
+    Read-only equivalent of ItemSerializer(items, many=True).data built from
+    values() rows and a single spectrum values query, without model instances.
+    """
+    rows = list(items.prefetch_related(None).values('done', 'statement', 'id', 'parent_container', 'actionable', 'archived'))
+    spectrum_values = SpectrumValue.objects.filter(parent_item__in=items.order_by().values('pk')).order_by('pk').values(
+        'id', 'value', 'spectrum_type', 'spectrum_type__name', 'parent_item', 'gpt_curated'
+        )
+
+    values_by_item = {}
+    for value in spectrum_values:
+        values_by_item.setdefault(value['parent_item'], []).append({
+            'id': value['id'],
+            'value': value['value'],
+            'spectrum_type': value['spectrum_type'],
+            'label': value['spectrum_type__name'],
+            'parent_item': value['parent_item'],
+            'gpt_curated': value['gpt_curated'],
+            })
+
+    for row in rows:
+        row['spectrum_values'] = values_by_item.get(row['id'], [])
+    return rows
+
+
+class ItemBulkCreateSerializer(serializers.Serializer):
+    statements = serializers.ListField(
+        child=serializers.CharField(max_length=Item._meta.get_field('statement').max_length),
+        allow_empty=False, max_length=2**10
+        )
+
+
+class ItemBulkPatchSerializer(serializers.Serializer):
+    done = serializers.BooleanField(required=False)
+    archived = serializers.BooleanField(required=False)
+    actionable = serializers.BooleanField(required=False)
+    parent_container = serializers.PrimaryKeyRelatedField(queryset=Container.objects.all(), required=False, allow_null=True)
+
+    def validate_parent_container(self, container):
+        if container is not None and container.user != self.context['request'].user:
+            raise serializers.ValidationError("Container not found.")
+        return container
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError("Nothing to update.")
+        return attrs
+
+
+class ItemBulkUpdateSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=2**10)
+    patch = ItemBulkPatchSerializer()
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -64,15 +202,27 @@ class ContainerSerializer(serializers.ModelSerializer):
         super().__init__(*args, **kwargs)
 
     def get_spectrum_types(self, container):
-        spectrum_types = SpectrumType.objects.filter(spectrumvalue__parent_item__parent_container=container).distinct()
-        serializer = SpectrumTypeSerializer(spectrum_types, many=True)
-        return serializer.data
+        return get_container_spectrum_types(container, self.context)
+
+    def validate_parent_container(self, container):
+        # Container.save refuses these moves, answered as a 400 rather than a 500.
+        if container is not None and self.instance is not None and (
+            container.pk == self.instance.pk
+            or (self.instance.path and self.instance.get_subtree().filter(pk=container.pk).exists())
+            ):
+            raise serializers.ValidationError("Container can't be moved under itself or its descendants.")
+        return container
 
 
 class ItemStatementVersionSerializer(serializers.ModelSerializer):
     class Meta:
         model = ItemStatementVersion
-        fields = '__all__'
+        exclude = ['statement_delta', 'delta_base']
+
+    def to_representation(self, version):
+        data = super().to_representation(version)
+        data['statement'] = version.stored_statement # Rebuilt for compacted versions.
+        return data
 
 
 class SpectrumTypeSerializer(serializers.ModelSerializer):
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from winged_app.models import Container, Item, SpectrumValue, SpectrumType
+from winged_app.tree_cache import invalidate_container_tree
+
+
+@receiver([post_save, post_delete], sender=Container)
+def invalidate_tree_on_container_change(sender, instance, **kwargs):
+    invalidate_container_tree(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=SpectrumType)
+def invalidate_tree_on_spectrum_type_change(sender, instance, **kwargs):
+    # Trees hold serialized spectrum types.
+    invalidate_container_tree(instance.user_id)
+
+
+@receiver(post_save, sender=SpectrumValue)
+def invalidate_tree_on_spectrum_value_save(sender, instance, created, update_fields=None, **kwargs):
+    # Only new values or a changed spectrum_type can change a container's spectrum types.
+    if created or update_fields is None or 'spectrum_type' in update_fields:
+        invalidate_container_tree(instance.user_id)
+
+
+@receiver(post_delete, sender=SpectrumValue)
+def invalidate_tree_on_spectrum_value_delete(sender, instance, **kwargs):
+    invalidate_container_tree(instance.user_id)
+
+
+@receiver(post_save, sender=Item)
+def invalidate_tree_on_item_move(sender, instance, created, **kwargs):
+    # A moved item takes its spectrum values, and so their types, to another container.
+    if not created and instance.moved_container and instance.spectrumvalue_set.exists():
+        invalidate_container_tree(instance.user_id)
@@ -0,0 +1,161 @@
+from django.test import TestCase, override_settings
+from unittest.mock import Mock, patch
+
+import openai
+
+from scripts.ai_client import AIClient, TokenBucket, CircuitOpenError, parse_retry_after, get_client, reset_clients
+from scripts.bart_large_mnli_compare import api_call, post_with_retries, HuggingFaceZeroShotAPIError
+from scripts.openai_compare import gpt_compare
+
+
+class RetryableError(Exception):
+    pass
+
+
+class TokenBucketTest(TestCase):
+    @patch('scripts.ai_client.time.monotonic', return_value=100.0)
+    def test_burst_then_rate(self, mock_monotonic):
+        bucket = TokenBucket(rate=2, capacity=3)
+
+        self.assertEqual([bucket.reserve() for i in range(5)], [0, 0, 0, 0.5, 1.0])
+        mock_monotonic.return_value = 101.5 # Refilled 3 tokens, 2 owed.
+        self.assertEqual(bucket.reserve(), 0)
+
+
+@patch('scripts.ai_client.time.sleep')
+class AIClientTest(TestCase):
+    def setUp(self):
+        self.client = AIClient(rate=100, burst=100, max_attempts=3, base_delay=1, max_delay=4, failure_threshold=4, reset_timeout=30)
+
+    def test_retries_with_jittered_backoff(self, mock_sleep):
+        function = Mock(side_effect=[RetryableError(), RetryableError(), "ok"])
+
+        self.assertEqual(self.client.call(function, retry_on=(RetryableError,)), "ok")
+        delays = [call.args[0] for call in mock_sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(0 <= delays[0] <= 1 and 0 <= delays[1] <= 2)
+
+    def test_honors_retry_after(self, mock_sleep):
+        error = RetryableError()
+        error.retry_after = 7
+        function = Mock(side_effect=[error, "ok"])
+
+        self.client.call(function, retry_on=(RetryableError,))
+
+        mock_sleep.assert_called_once_with(7)
+
+    def test_not_retryable(self, mock_sleep):
+        error = RetryableError()
+        error.retryable = False
+        function = Mock(side_effect=error)
+
+        with self.assertRaises(RetryableError):
+            self.client.call(function, retry_on=(RetryableError,))
+        self.assertEqual(function.call_count, 1)
+        self.assertEqual(self.client.breaker.failures, 0)
+
+    def test_circuit_breaker(self, mock_sleep):
+        function = Mock(side_effect=RetryableError())
+        with patch('scripts.ai_client.time.monotonic', return_value=1000.0) as mock_monotonic:
+            with self.assertRaises(RetryableError):
+                self.client.call(function, retry_on=(RetryableError,))
+            # Opens on the 4th failure, failing the rest of the call and later ones without calling function.
+            for i in range(2):
+                with self.assertRaises(CircuitOpenError):
+                    self.client.call(function, retry_on=(RetryableError,))
+            self.assertEqual(function.call_count, 4)
+
+            # Half open after reset_timeout, a success closes it.
+            mock_monotonic.return_value = 1031.0
+            function.side_effect = None
+            function.return_value = "ok"
+            self.assertEqual(self.client.call(function, retry_on=(RetryableError,)), "ok")
+            self.assertIsNone(self.client.breaker.opened_at)
+
+    def test_not_retryable_closes_half_open_circuit(self, mock_sleep):
+        function = Mock(side_effect=RetryableError())
+        with patch('scripts.ai_client.time.monotonic', return_value=1000.0) as mock_monotonic:
+            for i in range(2):
+                with self.assertRaises((RetryableError, CircuitOpenError)):
+                    self.client.call(function, retry_on=(RetryableError,))
+            self.assertIsNotNone(self.client.breaker.opened_at)
+
+            # The trial call gets a 4xx, the provider is up again.
+            mock_monotonic.return_value = 1031.0
+            error = RetryableError()
+            error.retryable = False
+            function.side_effect = error
+            with self.assertRaises(RetryableError):
+                self.client.call(function, retry_on=(RetryableError,))
+            self.assertIsNone(self.client.breaker.opened_at)
+
+            function.side_effect = None
+            function.return_value = "ok"
+            self.assertEqual(self.client.call(function, retry_on=(RetryableError,)), "ok")
+
+    def test_parse_retry_after(self, mock_sleep):
+        self.assertEqual(parse_retry_after("3"), 3)
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0)
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertIsNone(parse_retry_after(None))
+
+
+@override_settings(AI_CLIENTS={'huggingface': {'rate': 100, 'burst': 100, 'failure_threshold': 3}, 'openai': {'rate': 100, 'burst': 100}})
+@patch('scripts.ai_client.time.sleep')
+class ProviderClientTest(TestCase):
+    def setUp(self):
+        reset_clients()
+
+    def tearDown(self):
+        reset_clients()
+
+    def response(self, status_code, json=None, headers=None):
+        response = Mock(status_code=status_code, ok=status_code < 400, headers=headers or {}, text="")
+        response.json.return_value = json
+        return response
+
+    def test_pooled_session(self, mock_sleep):
+        with patch.object(get_client('huggingface').session, 'post', return_value=self.response(200, [])) as mock_post:
+            api_call("https://example.com", {}, {})
+            api_call("https://example.com", {}, {})
+
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertIs(get_client('huggingface'), get_client('huggingface'))
+
+    def test_huggingface_retry_after(self, mock_sleep):
+        responses = [
+            self.response(429, headers={"Retry-After": "2"}),
+            self.response(503, {"error": "Model is currently loading", "estimated_time": 12.5}),
+            self.response(200, {"labels": ["a", "b"]}),
+            ]
+        with patch.object(get_client('huggingface').session, 'post', side_effect=responses):
+            result = post_with_retries({}, lambda response: response.json())
+
+        self.assertEqual(result, {"labels": ["a", "b"]})
+        self.assertEqual([call.args[0] for call in mock_sleep.call_args_list], [2, 12.5])
+
+    def test_huggingface_bad_request_not_retried(self, mock_sleep):
+        with patch.object(get_client('huggingface').session, 'post', return_value=self.response(400)) as mock_post:
+            with self.assertRaises(HuggingFaceZeroShotAPIError):
+                post_with_retries({}, lambda response: response.json())
+
+        self.assertEqual(mock_post.call_count, 1)
+
+    def test_huggingface_circuit_open(self, mock_sleep):
+        with patch.object(get_client('huggingface').session, 'post', return_value=self.response(500)) as mock_post:
+            for i in range(2):
+                with self.assertRaises(HuggingFaceZeroShotAPIError):
+                    post_with_retries({}, lambda response: response.json())
+
+        self.assertEqual(mock_post.call_count, 3)
+
+    @patch('openai.ChatCompletion.create')
+    def test_gpt_compare_retries(self, mock_create, mock_sleep):
+        mock_create.side_effect = [
+            openai.error.RateLimitError("slow down", headers={"retry-after": "1"}),
+            {"choices": [{"message": {"content": "item two"}}]},
+            ]
+
+        self.assertTrue(gpt_compare("criteria", "item one!", "item two"))
+        mock_sleep.assert_called_once_with(1)
+        self.assertIs(openai.requestssession, get_client('openai').session)
@@ -1,13 +1,23 @@
-from django.test import TestCase
-from unittest.mock import Mock, patch
-from scripts.bart_large_mnli_compare import compute_zero_shot_comparison, HuggingFaceZeroShotAPITimeoutError, HuggingFaceZeroShotAPIError
+from django.test import TestCase, override_settings
+import asyncio
+import json
+
+from unittest.mock import Mock, AsyncMock, patch
+from scripts.bart_large_mnli_compare import (
+    compute_zero_shot_comparison, compute_zero_shot_comparisons, items_vs_criteria, HuggingFaceZeroShotAPITimeoutError, HuggingFaceZeroShotAPIError,
+    InferenceAPIBackend, LocalPipelineBackend, StubBackend, ZeroShotBackend, concurrent_items_vs_criteria,
+    latest_comparisons, prefetch_comparisons, item_vs_criteria
+    )
+from scripts.my_custom_helper_functions import reclassify_items_in_batches
+from scripts.ai_client import reset_clients
 
 from django.contrib.auth.models import User
-from winged_app.models import Item, CriteriaStatementVersion, Criteria
+from winged_app.models import Item, CriteriaStatementVersion, Criteria, ItemVsTwoCriteriaAIComparison
 
 
 class TestComputeZeroShotComparison(TestCase):
     def setUp(self):
+        reset_clients()
         self.first_user = User.objects.create_user('first_user', 'first_user@example.com', 'testpass')
         self.item = Item.objects.create(statement="Test statement", user=self.first_user)
         self.item_current_statement_version = self.item.current_statement_version
@@ -90,3 +100,275 @@ class TestComputeZeroShotComparison(TestCase):
                     self.criteria_2.current_criteria_statement_version.computed_statement,
                     post_function=mock_api_call                
                 )
+
+
+class TestBatchedZeroShotComparison(TestCase):
+    def setUp(self):
+        reset_clients()
+        self.user = User.objects.create_user('first_user', 'first_user@example.com', 'testpass')
+        self.items = [Item.objects.create(statement=f"Test statement {i}", user=self.user) for i in range(3)]
+        self.criteria_1 = Criteria.objects.create(name="actionable", statement="Criteria 1", user=self.user)
+        self.criteria_2 = Criteria.objects.create(name="non-actionable", statement="Criteria 2", user=self.user)
+
+    def batch_response(self, first_labels):
+        # One result per input, first label the model's choice.
+        response = Mock()
+        response.json.return_value = [
+            {"sequence": "", "labels": [label, "Criteria 2" if label == "Criteria 1" else "Criteria 1"], "scores": [0.9, 0.1]}
+            for label in first_labels
+            ]
+        return response
+
+    def test_batched_request(self):
+        post_function = Mock(return_value=self.batch_response(["Criteria 1", "Criteria 2"]))
+
+        with patch('time.sleep', return_value=None):
+            results = compute_zero_shot_comparisons(["a", "b"], "Criteria 1", "Criteria 2", InferenceAPIBackend(post_function=post_function))
+
+        self.assertEqual([choice for response, choice in results], [True, False])
+        self.assertEqual(post_function.call_args.args[2]["inputs"], ["a", "b"])
+
+    def test_result_count_mismatch_retries(self):
+        post_function = Mock(side_effect=[self.batch_response(["Criteria 1"]), self.batch_response(["Criteria 1", "Criteria 1"])])
+
+        with patch('time.sleep', return_value=None):
+            results = compute_zero_shot_comparisons(["a", "b"], "Criteria 1", "Criteria 2", InferenceAPIBackend(post_function=post_function))
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(post_function.call_count, 2)
+
+    @patch('scripts.bart_large_mnli_compare.compute_zero_shot_comparisons')
+    def test_items_vs_criteria(self, mock_compute):
+        ItemVsTwoCriteriaAIComparison.objects.create(
+            user_choice=True,
+            criteria_statement_version_1=self.criteria_1.current_criteria_statement_version,
+            criteria_statement_version_2=self.criteria_2.current_criteria_statement_version,
+            item_compared_statement_version=self.items[0].current_statement_version,
+            criteria_choice=False,
+            )
+        mock_compute.return_value = [({"labels": []}, True), ({"labels": []}, False)]
+
+        with self.assertNumQueries(2): # Stored comparisons, one bulk insert.
+            results = items_vs_criteria(self.items, self.criteria_1, self.criteria_2, batch_size=2)
+
+        self.assertEqual(results, {self.items[0].pk: False, self.items[1].pk: True, self.items[2].pk: False})
+        self.assertEqual(mock_compute.call_args.args[0], ["Test statement 1", "Test statement 2"])
+        self.assertEqual(ItemVsTwoCriteriaAIComparison.objects.filter(ai_model="bart-large-mnli").count(), 2)
+
+        # Stored model choices are reused.
+        self.assertEqual(items_vs_criteria(self.items, self.criteria_1, self.criteria_2), results)
+        self.assertEqual(mock_compute.call_count, 1)
+
+    @patch('scripts.bart_large_mnli_compare.compute_zero_shot_comparisons')
+    def test_reclassify_items_in_batches(self, mock_compute):
+        mock_compute.side_effect = [[({}, True), ({}, False)], HuggingFaceZeroShotAPIError()]
+
+        with patch('builtins.print'):
+            reclassify_items_in_batches(
+                self.items, self.criteria_1, self.criteria_2,
+                lambda *args, **kwargs: items_vs_criteria(*args, batch_size=2, **kwargs)
+                )
+
+        self.assertEqual([item.actionable for item in Item.objects.order_by('pk')], [True, False, self.items[2].actionable])
+
+    @patch('scripts.bart_large_mnli_compare.compute_zero_shot_comparisons')
+    def test_any_failed_batch_is_reported(self, mock_compute):
+        mock_compute.side_effect = [json.JSONDecodeError("Expecting value", "", 0), [({}, True)], [({}, False)]]
+        batches = []
+
+        results = items_vs_criteria(self.items, self.criteria_1, self.criteria_2, batch_size=1, on_batch=batches.append)
+
+        self.assertEqual(results, {self.items[1].pk: True, self.items[2].pk: False})
+        self.assertIsInstance(batches[0][self.items[0].pk], json.JSONDecodeError)
+
+
+class TestZeroShotBackends(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('first_user', 'first_user@example.com', 'testpass')
+        self.criteria_1 = Criteria.objects.create(name="actionable", statement="something to do now", user=self.user)
+        self.criteria_2 = Criteria.objects.create(name="non-actionable", statement="an idea for later", user=self.user)
+
+    def test_stub_backend(self):
+        response, choice = compute_zero_shot_comparison("what to do today", "something to do now", "an idea for later", backend=StubBackend())
+
+        self.assertTrue(choice)
+        self.assertEqual(response["labels"], ["something to do now", "an idea for later"])
+        self.assertAlmostEqual(sum(response["scores"]), 1)
+
+    def test_backend_must_classify(self):
+        class IncompleteBackend(ZeroShotBackend):
+            ai_model = "incomplete"
+
+        with self.assertRaises(TypeError):
+            IncompleteBackend()
+
+    def test_api_arguments_need_api_backend(self):
+        with self.assertRaises(ValueError):
+            compute_zero_shot_comparison("what to do today", "something to do now", "an idea for later", post_function=Mock(), backend=StubBackend())
+
+    def test_api_backend_settings_used(self):
+        post_function = Mock(return_value=Mock(json=Mock(return_value={"labels": ["an idea for later", "something to do now"]})))
+        backend = InferenceAPIBackend(api_key="key", api_url="https://example.com/model", post_function=post_function)
+
+        response, choice = compute_zero_shot_comparison("what to do today", "something to do now", "an idea for later", backend=backend)
+
+        self.assertFalse(choice)
+        self.assertEqual(post_function.call_args.args[:2], ("https://example.com/model", {"Authorization": "Bearer key"}))
+
+    @override_settings(ZERO_SHOT_BACKEND="stub")
+    def test_configured_backend(self):
+        items = [Item.objects.create(statement=statement, user=self.user) for statement in ["an idea to keep", "do the dishes now"]]
+
+        results = items_vs_criteria(items, self.criteria_1, self.criteria_2)
+
+        self.assertEqual(results, {items[0].pk: False, items[1].pk: True})
+        self.assertEqual(set(ItemVsTwoCriteriaAIComparison.objects.values_list('ai_model', flat=True)), {"stub"})
+
+    @patch('transformers.pipeline')
+    def test_local_pipeline_backend(self, mock_pipeline):
+        classifier = mock_pipeline.return_value
+        classifier.return_value = [{"sequence": "a", "labels": ["an idea for later", "something to do now"], "scores": [0.7, 0.3]}]
+        backend = LocalPipelineBackend(model="/models/bart-large-mnli", batch_size=8)
+
+        results = compute_zero_shot_comparisons(["a"], "something to do now", "an idea for later", backend)
+
+        self.assertFalse(results[0][1])
+        self.assertEqual(backend.ai_model, "bart-large-mnli")
+        mock_pipeline.assert_called_once_with("zero-shot-classification", model="/models/bart-large-mnli", device=-1)
+        classifier.assert_called_once_with(["a"], candidate_labels=["something to do now", "an idea for later"], batch_size=8)
+
+
+class SlowBackend(StubBackend):
+    """
+    Stub answers after a pause, counting how many requests are in flight.
+    """
+    ai_model = "slow-stub"
+
+    def __init__(self, failing_statements=(), error=HuggingFaceZeroShotAPIError):
+        self.in_flight = self.max_in_flight = 0
+        self.failing_statements = set(failing_statements)
+        self.error = error
+
+    async def aclassify(self, statements, candidate_labels, session):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if self.failing_statements & set(statements):
+            raise self.error()
+        return self.classify(statements, candidate_labels)
+
+
+class TestConcurrentReclassification(TestCase):
+    def setUp(self):
+        reset_clients()
+        self.user = User.objects.create_user('first_user', 'first_user@example.com', 'testpass')
+        self.criteria_1 = Criteria.objects.create(name="actionable", statement="something to do now", user=self.user)
+        self.criteria_2 = Criteria.objects.create(name="non-actionable", statement="an idea for later", user=self.user)
+        self.items = [Item.objects.create(statement=f"do item {i} now" if i % 2 else f"an idea {i}", user=self.user) for i in range(10)]
+
+    def test_concurrency_limit(self):
+        backend = SlowBackend()
+        batches = []
+
+        results = concurrent_items_vs_criteria(self.items, self.criteria_1, self.criteria_2, batch_size=1, on_batch=batches.append, backend=backend, concurrency=3)
+
+        self.assertEqual(backend.max_in_flight, 3)
+        self.assertEqual(results, {item.pk: bool(i % 2) for i, item in enumerate(self.items)})
+        self.assertEqual(len(batches), 10)
+        self.assertEqual(ItemVsTwoCriteriaAIComparison.objects.filter(ai_model="slow-stub").count(), 10)
+
+    def test_failed_batch(self):
+        backend = SlowBackend(failing_statements=[self.items[0].statement])
+        batches = []
+
+        results = concurrent_items_vs_criteria(self.items, self.criteria_1, self.criteria_2, batch_size=5, on_batch=batches.append, backend=backend)
+
+        self.assertEqual(set(results), {item.pk for item in self.items[5:]})
+        failed = next(batch for batch in batches if self.items[0].pk in batch)
+        self.assertIsInstance(failed[self.items[0].pk], HuggingFaceZeroShotAPIError)
+
+    def test_any_failed_batch_is_reported(self):
+        backend = SlowBackend(failing_statements=[self.items[0].statement], error=OSError)
+        batches = []
+
+        results = concurrent_items_vs_criteria(self.items, self.criteria_1, self.criteria_2, batch_size=2, on_batch=batches.append, backend=backend)
+
+        self.assertEqual(set(results), {item.pk for item in self.items[2:]})
+        self.assertEqual(len(batches), 5)
+        self.assertIsInstance(next(batch for batch in batches if self.items[0].pk in batch)[self.items[1].pk], OSError)
+
+    def test_reclassify_items(self):
+        with patch('builtins.print'):
+            reclassify_items_in_batches(
+                self.items, self.criteria_1, self.criteria_2,
+                lambda *args, **kwargs: concurrent_items_vs_criteria(*args, backend=SlowBackend(), **kwargs)
+                )
+
+        self.assertEqual([item.actionable for item in Item.objects.order_by('pk')], [bool(i % 2) for i in range(10)])
+
+    @patch('asyncio.sleep', new_callable=AsyncMock)
+    def test_inference_api_backend(self, mock_sleep):
+        async def post_function(session, url, headers, data):
+            return [{"sequence": statement, "labels": ["an idea for later", "something to do now"], "scores": [0.6, 0.4]} for statement in data["inputs"]]
+        backend = InferenceAPIBackend(batch_size=4, async_post_function=post_function)
+
+        results = concurrent_items_vs_criteria(self.items, self.criteria_1, self.criteria_2, batch_size=10, backend=backend)
+
+        self.assertEqual(set(results.values()), {False})
+        self.assertEqual(ItemVsTwoCriteriaAIComparison.objects.filter(ai_model="bart-large-mnli").count(), 10)
+
+
+class TestLatestComparisons(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('first_user', 'first_user@example.com', 'testpass')
+        self.criteria_1 = Criteria.objects.create(name="actionable", statement="Criteria 1", user=self.user)
+        self.criteria_2 = Criteria.objects.create(name="non-actionable", statement="Criteria 2", user=self.user)
+        self.items = [Item.objects.create(statement=f"Test statement {i}", user=self.user) for i in range(3)]
+        self.versions = (self.criteria_1.current_criteria_statement_version, self.criteria_2.current_criteria_statement_version)
+
+    def compare(self, item, criteria_choice, user_choice=False, ai_model="bart-large-mnli", versions=None):
+        versions = versions or self.versions
+        return ItemVsTwoCriteriaAIComparison.objects.create(
+            user_choice=user_choice,
+            ai_model=None if user_choice else ai_model,
+            criteria_statement_version_1=versions[0],
+            criteria_statement_version_2=versions[1],
+            item_compared_statement_version=item.current_statement_version,
+            criteria_choice=criteria_choice,
+            )
+
+    def test_latest_per_version(self):
+        self.compare(self.items[0], True, user_choice=True)
+        user = self.compare(self.items[0], False, user_choice=True)
+        model = self.compare(self.items[0], True)
+        self.compare(self.items[1], True)
+        newer_model = self.compare(self.items[1], False)
+        self.compare(self.items[1], True, ai_model="gpt-4")
+        self.compare(self.items[2], True, versions=self.versions[::-1])
+
+        with self.assertNumQueries(1):
+            latest = latest_comparisons([item.current_statement_version_id for item in self.items], *self.versions, "bart-large-mnli")
+
+        self.assertEqual(latest, {
+            self.items[0].current_statement_version_id: (user, model),
+            self.items[1].current_statement_version_id: (None, newer_model),
+            })
+        self.assertFalse(latest[self.items[0].current_statement_version_id].choice) # User choice wins.
+        self.assertFalse(latest[self.items[1].current_statement_version_id].choice)
+
+    def test_item_vs_criteria_cache_hits(self):
+        for item in self.items:
+            self.compare(item, True)
+        cached = prefetch_comparisons(self.items, self.criteria_1, self.criteria_2)
+
+        with self.assertNumQueries(0):
+            choices = [item_vs_criteria(item, self.criteria_1, self.criteria_2, cached_comparisons=cached) for item in self.items]
+
+        self.assertEqual(choices, [True] * 3)
+
+    def test_item_vs_criteria_lookup(self):
+        self.compare(self.items[0], False, user_choice=True)
+
+        with self.assertNumQueries(1):
+            self.assertFalse(item_vs_criteria(self.items[0], self.criteria_1, self.criteria_2))
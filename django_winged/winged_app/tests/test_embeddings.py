@@ -0,0 +1,154 @@
+from django.test import TestCase, override_settings
+from unittest.mock import Mock, patch
+
+import numpy as np
+
+from django.contrib.auth.models import User
+from winged_app.models import Item, Criteria, SpectrumType, StatementEmbedding, CriterionVsItemsAIComparison
+from winged_app.embeddings import get_embeddings, cosine_similarities
+from scripts.sentence_transformers_compare import compute_and_store_criterion_comparison, criterion_vs_items, versions_comparison_function
+
+
+def fake_encode(texts):
+    # Same text, same vector, different texts point different ways.
+    return np.array([[len(text), sum(map(ord, text)) % 97, 1.0 / 3] for text in texts])
+
+
+class GetEmbeddingsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('embeddings_user', 'embeddings_user@example.com', 'testpass')
+        self.items = Item.bulk_create_with_versions([f"item statement {i}" for i in range(5)], None, self.user)
+        self.item_versions = [item.current_statement_version for item in self.items]
+        self.criteria = Criteria.objects.create(name="criteria", statement="criteria statement", user=self.user)
+        self.encode = Mock(side_effect=fake_encode)
+
+    def test_encodes_each_version_once(self):
+        versions = self.item_versions + [self.criteria.current_criteria_statement_version]
+
+        first = get_embeddings(versions, "test-model", self.encode)
+        with self.assertNumQueries(2): # One per version model, nothing to encode.
+            second = get_embeddings(versions, "test-model", self.encode)
+
+        self.assertEqual(sum(len(call.args[0]) for call in self.encode.call_args_list), 6)
+        np.testing.assert_array_equal(first, second)
+        self.assertEqual(first.dtype, np.float32)
+        self.assertEqual(StatementEmbedding.objects.filter(model_name="test-model").count(), 6)
+        self.assertEqual(self.criteria.current_criteria_statement_version.embeddings.count(), 1)
+
+    def test_keeps_order_and_duplicates(self):
+        versions = [self.item_versions[2], self.item_versions[0], self.item_versions[2]]
+
+        embeddings = get_embeddings(versions, "test-model", self.encode)
+
+        self.assertEqual(self.encode.call_count, 1)
+        self.assertEqual(len(self.encode.call_args.args[0]), 2)
+        np.testing.assert_array_equal(embeddings[0], embeddings[2])
+        np.testing.assert_allclose(embeddings[1], fake_encode(["item statement 0"])[0], rtol=1e-3)
+
+    def test_models_stored_separately(self):
+        get_embeddings(self.item_versions, "test-model", self.encode)
+        get_embeddings(self.item_versions, "other-model", self.encode)
+
+        self.assertEqual(self.encode.call_count, 2)
+
+    def test_edited_statement_is_new_version(self):
+        get_embeddings([self.items[0].current_statement_version], "test-model", self.encode)
+        self.items[0].statement = "edited statement"
+        self.items[0].save()
+        self.items[0].refresh_from_db()
+
+        get_embeddings([self.items[0].current_statement_version], "test-model", self.encode)
+
+        self.assertEqual(self.encode.call_args.args[0], ["edited statement"])
+
+    @patch('winged_app.embeddings.ENCODE_BATCH_SIZE', 2)
+    def test_encodes_in_batches(self):
+        get_embeddings(self.item_versions, "test-model", self.encode)
+
+        self.assertEqual([len(call.args[0]) for call in self.encode.call_args_list], [2, 2, 1])
+
+    @override_settings(EMBEDDING_DTYPE='float32')
+    def test_dtype_setting(self):
+        embeddings = get_embeddings(self.item_versions[:1], "test-model", self.encode)
+
+        stored = StatementEmbedding.objects.get()
+        self.assertEqual(stored.dtype, 'float32')
+        self.assertEqual(len(stored.vector), 3 * 4)
+        np.testing.assert_array_equal(embeddings[0], fake_encode(["item statement 0"])[0].astype(np.float32))
+
+    def test_float16_by_default(self):
+        first = get_embeddings(self.item_versions[:1], "test-model", self.encode)
+        second = get_embeddings(self.item_versions[:1], "test-model", self.encode)
+
+        self.assertEqual(len(StatementEmbedding.objects.get().vector), 3 * 2)
+        np.testing.assert_array_equal(first, second) # Fresh ones read back as stored.
+
+    def test_cosine_similarities(self):
+        similarities = cosine_similarities(np.array([1.0, 0.0]), np.array([[2.0, 0.0], [0.0, 3.0], [0.0, 0.0]]))
+
+        np.testing.assert_allclose(similarities, [1.0, 0.0, 0.0])
+
+
+class SentenceTransformersCompareTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('embeddings_user', 'embeddings_user@example.com', 'testpass')
+        self.criteria = Criteria.objects.create(name="criteria", statement="aaaa", user=self.user)
+        self.far_item = Item.objects.create(statement="zzzzzzzzzzzzzzzzzzz", user=self.user)
+        self.near_item = Item.objects.create(statement="aaab", user=self.user)
+        self.model = Mock()
+        self.model.encode.side_effect = lambda texts, batch_size: np.array(
+            [[1.0, 0.0] if text.startswith("a") else [0.0, 1.0] for text in texts]
+            )
+
+    def test_stores_comparison_of_versions(self):
+        with patch('scripts.sentence_transformers_compare.get_sentence_transformer', return_value=self.model):
+            self.assertTrue(compute_and_store_criterion_comparison(self.criteria, self.far_item, self.near_item, "test-model"))
+            self.assertFalse(compute_and_store_criterion_comparison(self.criteria, self.near_item, self.far_item, "test-model"))
+
+        comparison = CriterionVsItemsAIComparison.objects.order_by('created_at').first()
+        self.assertEqual(comparison.criterion_statement_version, self.criteria.current_criteria_statement_version)
+        self.assertEqual(comparison.item_compared_2_statement_version, self.near_item.current_statement_version)
+        self.assertEqual(comparison.response, {"similarities": [0.0, 1.0]})
+        self.assertEqual(self.model.encode.call_count, 2) # Criteria and item versions once, then stored ones.
+
+    def test_criterion_vs_items_reuses_comparison(self):
+        with patch('scripts.sentence_transformers_compare.get_sentence_transformer', return_value=self.model):
+            first = criterion_vs_items(self.criteria, self.far_item, self.near_item, "test-model")
+            second = criterion_vs_items(self.criteria, self.far_item, self.near_item, "test-model")
+
+        self.assertTrue(first)
+        self.assertTrue(second)
+        self.assertEqual(CriterionVsItemsAIComparison.objects.count(), 1)
+
+    def test_ranking_reads_embeddings_filled_up_front(self):
+        spectrum_type = SpectrumType.objects.create(name="urgency", description="aaaa", user=self.user)
+        criteria = spectrum_type.get_criteria()
+
+        with patch('scripts.sentence_transformers_compare.get_sentence_transformer', return_value=self.model):
+            compare = versions_comparison_function("test-model", [
+                criteria.current_criteria_statement_version, self.far_item.current_statement_version, self.near_item.current_statement_version
+                ])
+            with self.assertNumQueries(0):
+                self.assertTrue(compare(criteria, self.far_item, self.near_item))
+                self.assertFalse(compare(criteria, self.near_item, self.far_item))
+
+            other_item = Item.objects.create(statement="abba", user=self.user)
+            with self.assertNumQueries(3): # A miss looks up, reloads and stores just that version.
+                self.assertFalse(compare(criteria, other_item, self.far_item))
+
+        self.assertEqual(self.model.encode.call_count, 3) # The fill, one batch per version model, and the miss.
+
+    def test_spectrum_type_criteria_follows_description(self):
+        spectrum_type = SpectrumType.objects.create(name="urgency", description="aaaa", user=self.user)
+        version = spectrum_type.get_criteria().current_criteria_statement_version
+
+        self.assertEqual(spectrum_type.get_criteria().current_criteria_statement_version, version)
+        spectrum_type.description = "bbbb"
+        criteria = spectrum_type.get_criteria()
+
+        self.assertNotEqual(criteria.current_criteria_statement_version, version)
+        self.assertEqual(criteria.current_criteria_statement_version.computed_statement, "bbbb")
+        self.assertEqual(Criteria.objects.filter(spectrum_type=spectrum_type).count(), 1)
+
+        spectrum_type.delete()
+        self.assertFalse(Criteria.objects.filter(pk=criteria.pk).exists())
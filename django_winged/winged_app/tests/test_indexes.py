@@ -0,0 +1,92 @@
+from django.test import TestCase
+from django.db import connection
+from django.contrib.auth.models import User
+from ..models import Container, Item, SpectrumType, SpectrumValue, Criteria, ItemVsTwoCriteriaAIComparison, CriterionVsItemsAIComparison
+
+
+class IndexUsageTest(TestCase):
+    """
+    Asserts hot predicates are planned over the composite indexes, reading EXPLAIN output.
+    """
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Tables are tiny here, make the planner show which index it would take.
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+        self.user = User.objects.create_user('test_user', 'test_user@example.com', 'testpass123')
+        self.container = Container.objects.create(name="container", user=self.user)
+        self.spectrum_type = SpectrumType.objects.create(name="spectrum", description="", user=self.user)
+
+        for i in range(10):
+            item = Item.objects.create(statement=f"item_{i}", actionable=i % 2 == 0, done=i % 3 == 0, parent_container=self.container, user=self.user)
+            SpectrumValue.objects.create(value=i, spectrum_type=self.spectrum_type, parent_item=item, user=self.user)
+
+        self.items = list(Item.objects.filter(user=self.user))
+        self.criteria_versions = [
+            Criteria.objects.create(name=name, statement=name, user=self.user).current_criteria_statement_version
+            for name in ["actionable", "non-actionable"]
+            ]
+        for i, item in enumerate(self.items):
+            ItemVsTwoCriteriaAIComparison.objects.create(
+                ai_model=None if i % 5 == 0 else "bart-large-mnli", user_choice=i % 5 == 0,
+                criteria_statement_version_1=self.criteria_versions[0], criteria_statement_version_2=self.criteria_versions[1],
+                item_compared_statement_version=item.current_statement_version,
+                )
+            CriterionVsItemsAIComparison.objects.create(
+                ai_model="all-MiniLM-L6-v2", user_choice=i % 5 == 0, criterion_statement_version=self.criteria_versions[0],
+                item_compared_1_statement_version=item.current_statement_version,
+                item_compared_2_statement_version=self.items[0].current_statement_version,
+                )
+
+        if connection.vendor == 'postgresql':
+            # Stats left by earlier tests can make a single column index look as cheap.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "ANALYZE winged_app_item, winged_app_spectrumvalue, "
+                    "winged_app_itemvstwocriteriaaicomparison, winged_app_criterionvsitemsaicomparison"
+                    )
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), f"None of {index_names} in plan:\n{plan}")
+
+    def test_open_container_items(self):
+        items = Item.objects.filter(actionable=True, archived=False, done=False, parent_container=self.container, user=self.user)
+
+        self.assertUsesIndex(items, 'item_open_idx', 'item_container_state_idx')
+
+    def test_container_items_by_state(self):
+        items = Item.objects.filter(archived=True, parent_container=self.container, user=self.user)
+
+        self.assertUsesIndex(items, 'item_container_state_idx')
+
+    def test_spectrum_values_by_value(self):
+        zero_values = SpectrumValue.objects.filter(spectrum_type=self.spectrum_type, user=self.user, value=0)
+        non_zero_values = SpectrumValue.objects.filter(spectrum_type=self.spectrum_type, user=self.user).exclude(value=0)
+
+        self.assertUsesIndex(zero_values, 'spectrumvalue_type_value_idx')
+        self.assertUsesIndex(non_zero_values, 'spectrumvalue_type_value_idx')
+
+    def test_item_vs_criteria_latest(self):
+        lookup = dict(
+            criteria_statement_version_1=self.criteria_versions[0], criteria_statement_version_2=self.criteria_versions[1],
+            item_compared_statement_version=self.items[1].current_statement_version,
+            )
+        model_made = ItemVsTwoCriteriaAIComparison.objects.filter(ai_model="bart-large-mnli", **lookup).order_by('-created_at')
+        user_made = ItemVsTwoCriteriaAIComparison.objects.filter(user_choice=True, **lookup).order_by('-created_at')
+
+        self.assertUsesIndex(model_made, 'itemvscriteria_model_idx')
+        self.assertUsesIndex(user_made, 'itemvscriteria_user_idx')
+
+    def test_criterion_vs_items_latest(self):
+        lookup = dict(
+            ai_model="all-MiniLM-L6-v2", criterion_statement_version=self.criteria_versions[0],
+            item_compared_1_statement_version=self.items[1].current_statement_version,
+            item_compared_2_statement_version=self.items[0].current_statement_version,
+            )
+        model_made = CriterionVsItemsAIComparison.objects.filter(**lookup).order_by('-created_at')
+        user_made = CriterionVsItemsAIComparison.objects.filter(user_choice=True, **lookup).order_by('-created_at')
+
+        self.assertUsesIndex(model_made, 'criterionvsitems_model_idx')
+        self.assertUsesIndex(user_made, 'criterionvsitems_user_idx')
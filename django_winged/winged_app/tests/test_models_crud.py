@@ -1,11 +1,15 @@
-from django.test import TestCase, tag
+from django.test import TestCase, tag, override_settings
 from ..models import (
     Container, Item, ItemStatementVersion, SpectrumType, SpectrumValue,
     SystemPromptTextVersion, SystemPrompt, CriteriaStatementVersion,
     Criteria, ItemVsTwoCriteriaAIComparison
     )
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from ..container_touches import flush_last_opened_at, check_shared_cache
 from rest_framework.test import APIClient
 
 
@@ -671,3 +675,249 @@ class ItemVsTwoCriteriaAIComparisonCRUDTest(TestCase):
         )
         comparison.delete()
         self.assertEqual(ItemVsTwoCriteriaAIComparison.objects.count(), 0)
+
+
+class ContainerPathTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('test_user', 'test_user@example.com', 'testpass123')
+
+        self.root = Container.objects.create(name="root", user=self.user)
+        self.child = Container.objects.create(name="child", parent_container=self.root, user=self.user)
+        self.grandchild = Container.objects.create(name="grandchild", parent_container=self.child, user=self.user)
+        self.other_root = Container.objects.create(name="other_root", user=self.user)
+
+    def test_path_on_create(self):
+        self.assertEqual(self.root.path, f"/{self.root.pk}/")
+        self.assertEqual(self.child.path, f"/{self.root.pk}/{self.child.pk}/")
+
+        # Assert path made it to db.
+        self.grandchild.refresh_from_db()
+        self.assertEqual(self.grandchild.path, f"/{self.root.pk}/{self.child.pk}/{self.grandchild.pk}/")
+
+    def test_move_rebases_subtree(self):
+        child = Container.objects.get(pk=self.child.pk)
+        child.parent_container = self.other_root
+        child.save()
+
+        self.grandchild.refresh_from_db()
+        self.assertEqual(child.path, f"/{self.other_root.pk}/{self.child.pk}/")
+        self.assertEqual(self.grandchild.path, f"/{self.other_root.pk}/{self.child.pk}/{self.grandchild.pk}/")
+        self.assertEqual(list(self.root.get_subtree()), [self.root])
+
+    def test_move_to_root(self):
+        child = Container.objects.get(pk=self.child.pk)
+        child.parent_container = None
+        child.save()
+
+        self.grandchild.refresh_from_db()
+        self.assertEqual(self.grandchild.path, f"/{self.child.pk}/{self.grandchild.pk}/")
+
+    def test_move_under_descendant_not_allowed(self):
+        root = Container.objects.get(pk=self.root.pk)
+        root.parent_container = self.grandchild
+
+        with self.assertRaises(ValueError):
+            root.save()
+
+        root.refresh_from_db()
+        self.assertIsNone(root.parent_container)
+
+    def test_delete_rebases_orphans(self):
+        self.child.delete()
+
+        self.grandchild.refresh_from_db()
+        self.assertIsNone(self.grandchild.parent_container)
+        self.assertEqual(self.grandchild.path, f"/{self.grandchild.pk}/")
+
+    def test_subtree_items(self):
+        items = [Item.objects.create(statement=f"item in {c}", parent_container=c, user=self.user) for c in (self.root, self.child, self.grandchild, self.other_root)]
+
+        self.assertEqual(set(self.root.get_subtree_items()), set(items[:3]))
+        self.assertEqual(set(self.child.get_subtree_items()), set(items[1:3]))
+        self.assertEqual(self.root.get_subtree().count(), 3)
+
+
+class ItemBulkCreateTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('test_user', 'test_user@example.com', 'testpass123')
+        self.container = Container.objects.create(name="container", user=self.user)
+
+    def test_items_get_their_versions(self):
+        items = Item.bulk_create_with_versions(["first", "second", "third"], self.container, self.user)
+
+        self.assertEqual([item.statement for item in items], ["first", "second", "third"])
+        for item in Item.objects.filter(pk__in=[item.pk for item in items]):
+            self.assertEqual(item.parent_container, self.container)
+            self.assertEqual(item.current_statement_version.parent_item, item)
+            self.assertIsNone(item.current_statement_version.statement)
+            self.assertEqual(item.current_statement_version.user, self.user)
+            self.assertEqual(item.get_versions().count(), 1)
+
+    def test_constant_queries(self):
+        # Savepoint, items, versions, link and savepoint release.
+        with self.assertNumQueries(5):
+            Item.bulk_create_with_versions([f"item_{i}" for i in range(50)], self.container, self.user)
+
+    def test_statement_change_after_bulk_create(self):
+        item = Item.bulk_create_with_versions(["first"], self.container, self.user)[0]
+        first_version = item.current_statement_version
+
+        item.statement = "changed"
+        item.save()
+
+        first_version.refresh_from_db()
+        self.assertEqual(first_version.statement, "first")
+        self.assertNotEqual(item.current_statement_version, first_version)
+        self.assertEqual(item.get_versions().count(), 2)
+
+
+class VersionedSaveTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('test_user', 'test_user@example.com', 'testpass123')
+        self.container = Container.objects.create(name="container", user=self.user)
+
+    def test_create_queries(self):
+        # Savepoint, insert, version insert, version link and savepoint release.
+        with self.assertNumQueries(5):
+            Item.objects.create(statement="statement", parent_container=self.container, user=self.user)
+        with self.assertNumQueries(5):
+            Criteria.objects.create(name="criteria", statement="statement", user=self.user)
+        with self.assertNumQueries(5):
+            SystemPrompt.objects.create(name="prompt", text="text", ai_model="model", user=self.user)
+
+    def test_versioned_change_queries(self):
+        item = Item.objects.create(statement="first", parent_container=self.container, user=self.user)
+        criteria = Criteria.objects.create(name="criteria", statement="first", user=self.user)
+        system_prompt = SystemPrompt.objects.create(name="prompt", text="first", ai_model="model", user=self.user)
+        item, criteria, system_prompt = Item.objects.get(pk=item.pk), Criteria.objects.get(pk=criteria.pk), SystemPrompt.objects.get(pk=system_prompt.pk)
+
+        item.statement = criteria.statement = system_prompt.text = "second"
+        # Savepoint, previous value to current version, new version, update and savepoint release. No re-read.
+        for instance in [item, criteria, system_prompt]:
+            with self.assertNumQueries(5):
+                instance.save()
+
+        self.assertEqual(item.get_versions().exclude(statement=None).get().statement, "first")
+        self.assertEqual(CriteriaStatementVersion.objects.get(parent_criteria=criteria, statement__isnull=False).statement, "first")
+        self.assertEqual(SystemPromptTextVersion.objects.get(parent_prompt=system_prompt, text__isnull=False).text, "first")
+
+    def test_other_change_writes_only_changed_fields(self):
+        item = Item.objects.create(statement="statement", parent_container=self.container, user=self.user)
+        item = Item.objects.get(pk=item.pk)
+        item.done = True
+
+        with CaptureQueriesContext(connection) as queries:
+            item.save()
+
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"done"', updates[0])
+        self.assertNotIn('"statement"', updates[0])
+        self.assertEqual(item.get_versions().count(), 1)
+        self.assertTrue(Item.objects.get(pk=item.pk).done)
+
+    def test_refresh_from_db_keeps_loaded_values(self):
+        item = Item.objects.create(statement="first", parent_container=self.container, user=self.user)
+        stale_item = Item.objects.get(pk=item.pk)
+        item.statement = "second"
+        item.save()
+
+        stale_item.refresh_from_db()
+        stale_item.save()
+
+        self.assertEqual(item.get_versions().count(), 2)
+        self.assertEqual(Item.objects.get(pk=item.pk).statement, "second")
+
+    def test_instance_not_loaded_from_db(self):
+        item = Item.objects.create(statement="first", parent_container=self.container, user=self.user)
+        unloaded_item = Item(
+            pk=item.pk, statement="second", parent_container=self.container, user=self.user,
+            current_statement_version_id=item.current_statement_version_id, created_at=item.created_at,
+            )
+
+        unloaded_item.save()
+
+        self.assertEqual(item.get_versions().exclude(statement=None).get().statement, "first")
+        self.assertEqual(Item.objects.get(pk=item.pk).statement, "second")
+
+
+@override_settings(BUFFER_CONTAINER_TOUCHES=True)
+class ContainerTouchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('test_user', 'test_user@example.com', 'testpass123')
+        self.containers = [Container.objects.create(name=f"container_{i}", user=self.user) for i in range(3)]
+
+    def test_open_is_buffered(self):
+        container = Container.objects.get(pk=self.containers[0].pk)
+
+        with self.assertNumQueries(0):
+            _, opened_at = container.update_last_opened_at()
+
+        self.assertIsNone(Container.objects.get(pk=container.pk).last_opened_at)
+        self.assertEqual(Container.objects.get(pk=container.pk).get_last_opened_at(), opened_at)
+
+    def test_flush_writes_in_bulk_without_updated_at(self):
+        updated_at = {c.pk: c.updated_at for c in Container.objects.all()}
+        for container in self.containers + self.containers[:1]:
+            container.update_last_opened_at()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_last_opened_at(), 3)
+
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 1)
+        for container in Container.objects.all():
+            self.assertEqual(container.last_opened_at, next(c for c in self.containers if c.pk == container.pk).last_opened_at)
+            self.assertEqual(container.updated_at, updated_at[container.pk])
+        self.assertEqual(flush_last_opened_at(), 0)
+
+    def test_reads_keep_later_value(self):
+        self.containers[0].update_last_opened_at()
+        flush_last_opened_at()
+        _, opened_at = self.containers[0].update_last_opened_at()
+
+        container = Container.objects.get(pk=self.containers[0].pk)
+        self.assertLess(container.last_opened_at, opened_at)
+        self.assertEqual(container.get_last_opened_at(), opened_at)
+
+    def test_toggle_tab_writes_only_tab(self):
+        container = Container.objects.get(pk=self.containers[0].pk)
+        container.name = "unsaved name"
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(container.toggle_tab())
+
+        update = next(q['sql'] for q in queries if q['sql'].startswith('UPDATE'))
+        self.assertNotIn('"name"', update)
+        refreshed = Container.objects.get(pk=container.pk)
+        self.assertFalse(refreshed.is_on_actionables_tab)
+        self.assertGreater(refreshed.updated_at, self.containers[0].updated_at)
+
+
+
+class UnbufferedContainerTouchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('test_user', 'test_user@example.com', 'testpass123')
+        self.container = Container.objects.create(name="container", user=self.user)
+
+    @override_settings(BUFFER_CONTAINER_TOUCHES=False)
+    def test_open_is_written_without_updated_at(self):
+        container = Container.objects.get(pk=self.container.pk)
+
+        with self.assertNumQueries(1):
+            _, opened_at = container.update_last_opened_at()
+
+        container = Container.objects.get(pk=self.container.pk)
+        self.assertEqual(container.last_opened_at, opened_at)
+        self.assertEqual(container.updated_at, self.container.updated_at)
+        self.assertEqual(flush_last_opened_at(), 0)
+
+    @override_settings(BUFFER_CONTAINER_TOUCHES=True, CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_buffering_needs_shared_cache(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['winged_app.E001'])
+
+    @override_settings(BUFFER_CONTAINER_TOUCHES=True, CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379/0'}})
+    def test_buffering_with_shared_cache(self):
+        self.assertEqual(check_shared_cache(None), [])
@@ -0,0 +1,119 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ..models import Item, ItemStatementVersion, Criteria, CriteriaStatementVersion
+from ..version_history import encode_delta, apply_delta, plan_history, compact_versions
+
+
+class DeltaEncodingTest(TestCase):
+    def test_round_trip(self):
+        base = "Buy milk, eggs and bread at the corner store before it closes."
+        for text in [base, "Buy oat milk and bread at the store before it closes today.", "", "✓ ünïcode", base * 20]:
+            self.assertEqual(apply_delta(base, encode_delta(base, text)), text)
+
+    def test_similar_text_delta_is_smaller(self):
+        base = "Write the quarterly report and send it to the whole team by friday."
+        text = "Write the quarterly report and send it to the whole team by monday."
+
+        self.assertLess(len(encode_delta(base, text)), len(text.encode()))
+
+    def test_plan_history(self):
+        base = "Plan the team offsite agenda with every session and speaker listed."
+        texts = [base, base + " Done.", base + " Now.", "Something entirely different, sharing nothing at all.", base]
+
+        plan = plan_history(texts, snapshot_interval=1)
+
+        # First is a snapshot, one delta each, unrelated text kept whole.
+        self.assertEqual([base_index for delta, base_index in plan], [None, 0, None, None, None])
+
+
+class CompactVersionsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('test_user', 'test_user@example.com', 'testpass123')
+        self.item = Item.objects.create(statement="Call the bank about the mortgage rate renewal letter", user=self.user)
+        self.statements = [self.item.statement]
+        for i in range(6):
+            self.item.statement = f"Call the bank about the mortgage rate renewal letter, attempt {i}"
+            self.item.save()
+            self.statements.append(self.item.statement)
+
+    def past_statements(self):
+        versions = ItemStatementVersion.objects.filter(parent_item=self.item).select_related('delta_base').order_by('pk')
+        return [version.stored_statement for version in versions]
+
+    def test_compaction_keeps_every_version(self):
+        expected = self.past_statements()
+
+        before, after = compact_versions(ItemStatementVersion, 'parent_item', snapshot_interval=4)
+
+        self.assertLess(after, before)
+        self.assertEqual(self.past_statements(), expected)
+        self.assertEqual(expected, self.statements[:-1] + [None])
+        versions = ItemStatementVersion.objects.filter(parent_item=self.item).order_by('pk')
+        self.assertEqual([v.delta_base_id is None for v in versions], [True, False, False, False, False, True, True])
+        self.assertEqual(versions.last().computed_statement, self.item.statement)
+
+    def test_rerun_only_compacts_new_versions(self):
+        compact_versions(ItemStatementVersion, 'parent_item')
+        self.item.statement = "Call the bank about the mortgage rate renewal letter, last attempt"
+        self.item.save()
+
+        with self.assertNumQueries(4): # Versions, then savepoint, bulk update and release.
+            compact_versions(ItemStatementVersion, 'parent_item')
+
+        self.assertEqual(self.past_statements(), self.statements + [None])
+        before, after = compact_versions(ItemStatementVersion, 'parent_item')
+        self.assertEqual(before, after)
+
+    def test_snapshot_change_expands_deltas(self):
+        compact_versions(ItemStatementVersion, 'parent_item')
+        snapshot = ItemStatementVersion.objects.filter(parent_item=self.item).order_by('pk').first()
+        expected = self.past_statements()
+
+        snapshot.statement = "rewritten"
+        snapshot.save()
+
+        self.assertFalse(ItemStatementVersion.objects.filter(delta_base__isnull=False).exists())
+        self.assertEqual(self.past_statements(), ["rewritten"] + expected[1:])
+
+    def test_snapshot_delete_expands_deltas(self):
+        compact_versions(ItemStatementVersion, 'parent_item')
+        expected = self.past_statements()
+
+        ItemStatementVersion.objects.filter(parent_item=self.item).order_by('pk').first().delete()
+
+        self.assertEqual(self.past_statements(), expected[1:])
+
+    def test_item_delete_with_compacted_versions(self):
+        compact_versions(ItemStatementVersion, 'parent_item')
+
+        self.item.delete()
+
+        self.assertFalse(ItemStatementVersion.objects.exists())
+
+    def test_criteria_versions(self):
+        criteria = Criteria.objects.create(name="actionable", statement="Something a person can act on right away.", user=self.user)
+        for i in range(3):
+            criteria.statement = f"Something a person can act on right away, step {i}."
+            criteria.save()
+
+        compact_versions(CriteriaStatementVersion, 'parent_criteria')
+
+        versions = CriteriaStatementVersion.objects.filter(parent_criteria=criteria).order_by('pk')
+        self.assertTrue(any(v.statement_delta is not None for v in versions))
+        self.assertEqual(
+            [v.computed_statement for v in versions][1:3],
+            [f"Something a person can act on right away, step {i}." for i in range(2)]
+            )
+
+    def test_api_shows_rebuilt_statement(self):
+        compact_versions(ItemStatementVersion, 'parent_item')
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.get(reverse('itemstatementversions-list'))
+
+        self.assertEqual([v['statement'] for v in sorted(response.data, key=lambda v: v['id'])], self.statements[:-1] + [None])
+        self.assertNotIn('statement_delta', response.data[0])
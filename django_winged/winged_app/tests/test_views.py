@@ -1,9 +1,20 @@
 from rest_framework.test import APIClient
 from django.test import TestCase, tag
-from ..models import Container, Item, ItemStatementVersion, SpectrumType, SpectrumValue
+from ..models import Container, Item, ItemStatementVersion, SpectrumType, SpectrumValue, Criteria, ItemVsTwoCriteriaAIComparison
 from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
 from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from unittest import skipUnless
+from unittest.mock import Mock, patch
+from django.core.cache import cache
+from ..tree_cache import container_tree_cache_stats, reset_container_tree_cache_stats
+from ..search import install_sqlite_search, SQLITE_TABLE
+from ..version_history import compact_versions
+from ..views import ContainerTreeView
+from ..serializers import ContainerChildrenListSerializer, ItemSerializer, serialize_items_fast
+from rest_framework.renderers import JSONRenderer
 
         
 class TokenAuthenticationTest(TestCase):
@@ -90,6 +101,7 @@ class TokenAuthenticationTest(TestCase):
 
 class ContainerTreeViewContainersTest(TestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user('testuser', 'test@example.com', 'testpass')
         self.client = APIClient()
 
@@ -114,6 +126,54 @@ class ContainerTreeViewContainersTest(TestCase):
 
         self.assertEqual(response.status_code, 200)
 
+    def test_container_tree_same_as_recursive_serialization(self):
+        self.client.force_authenticate(user=self.user)
+        # Nest one more level so the tree is deeper than root-children.
+        child = Container.objects.filter(user=self.user).exclude(parent_container=None).first()
+        Container.objects.create(name="testuser_grandchild_container", user=self.user, parent_container=child)
+
+        response = self.client.get(reverse("containerTrees-list"))
+
+        roots = Container.objects.filter(parent_container=None, user=self.user).order_by('pk')
+        expected = ContainerChildrenListSerializer(roots, many=True).data
+
+        self.assertEqual(response.json(), expected)
+
+    def test_container_tree_fetches_containers_once(self):
+        self.client.force_authenticate(user=self.user)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("containerTrees-list"))
+
+        # Queries fetching container rows, validator aggregates aside.
+        container_queries = [q for q in context.captured_queries if q['sql'].startswith('SELECT "winged_app_container"."id"')]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(container_queries), 1)
+
+    def test_container_tree_spectrum_types_in_constant_queries(self):
+        self.client.force_authenticate(user=self.user)
+        spectrum_types = [SpectrumType.objects.create(name=f"spectrum_{i}", description="", user=self.user) for i in range(2)]
+        for i, container in enumerate(Container.objects.filter(user=self.user)):
+            item = Item.objects.create(statement=f"item_{i}", parent_container=container, user=self.user)
+            SpectrumValue.objects.create(value=i, spectrum_type=spectrum_types[i % 2], parent_item=item, user=self.user)
+            if i % 3 == 0:
+                SpectrumValue.objects.create(value=i, spectrum_type=spectrum_types[(i + 1) % 2], parent_item=item, user=self.user)
+
+        # Four validator aggregates, containers and the spectrum types map, regardless of tree size.
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse("containerTrees-list"))
+
+        roots = Container.objects.filter(parent_container=None, user=self.user).order_by('pk')
+        self.assertEqual(response.json(), ContainerChildrenListSerializer(roots, many=True).data)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("containers-list"))
+
+        for container in response.json():
+            expected = SpectrumType.objects.filter(spectrumvalue__parent_item__parent_container=container["id"]).distinct()
+            self.assertEqual(sorted(i["id"] for i in container["spectrum_types"]), sorted(i.id for i in expected))
+
 
 class ContainerItemListAPIViewTest(TestCase):
     def setUp(self):
@@ -149,3 +209,696 @@ class ContainerItemListAPIViewTest(TestCase):
         self.assertEqual(response.data[0]['id'], self.item1.id)
 
         # Repeat the test for user2 and container2 if desired
+
+    def test_items_spectrum_values_in_constant_queries(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token1.key)
+        spectrum_types = [SpectrumType.objects.create(name=f"spectrum_{i}", description="", user=self.user1) for i in range(3)]
+        url = reverse('container-items', kwargs={'pk': self.container1.pk})
+
+        def add_items(count):
+            for i in range(count):
+                item = Item.objects.create(statement=f'item_{i}', parent_container=self.container1, user=self.user1)
+                for spectrum_type in spectrum_types:
+                    SpectrumValue.objects.create(value=i, spectrum_type=spectrum_type, parent_item=item, user=self.user1)
+
+        add_items(2)
+        with CaptureQueriesContext(connection) as few_items:
+            self.client.get(url)
+
+        add_items(20)
+        with CaptureQueriesContext(connection) as many_items:
+            response = self.client.get(url)
+
+        self.assertEqual(len(few_items), len(many_items))
+        self.assertEqual(len(response.data), 23)
+        self.assertEqual(response.data[1]['spectrum_values'][0]['label'], 'spectrum_0')
+
+        with CaptureQueriesContext(connection) as items_list:
+            response = self.client.get(reverse('items-list'))
+        self.assertEqual(len(items_list), len(many_items))
+
+
+class ContainerSubtreeViewsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password1')
+        self.other_user = User.objects.create_user(username='user2', password='password2')
+
+        self.root = Container.objects.create(name='root', user=self.user)
+        self.child = Container.objects.create(name='child', parent_container=self.root, user=self.user)
+        self.sibling = Container.objects.create(name='sibling', user=self.user)
+
+        self.root_item = Item.objects.create(statement='root item', parent_container=self.root, user=self.user)
+        self.child_item = Item.objects.create(statement='child item', parent_container=self.child, user=self.user)
+        self.done_item = Item.objects.create(statement='done item', done=True, parent_container=self.child, user=self.user)
+        self.sibling_item = Item.objects.create(statement='sibling item', parent_container=self.sibling, user=self.user)
+
+    def test_subtree_items(self):
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse('container-subtree-items', kwargs={'pk': self.root.pk}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({i['id'] for i in response.data}, {self.root_item.id, self.child_item.id, self.done_item.id})
+
+    def test_subtree_items_not_allowed(self):
+        self.client.force_authenticate(user=self.other_user)
+
+        response = self.client.get(reverse('container-subtree-items', kwargs={'pk': self.root.pk}))
+
+        self.assertEqual(response.status_code, 404)
+
+    @patch('winged_app.views.threading.Thread')
+    def test_subtree_reclassify_items(self, mock_thread):
+        Criteria.objects.create(name="actionable", user=self.user)
+        Criteria.objects.create(name="non-actionable", user=self.user)
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post(reverse('reclassify-actionable-container-subtree-items', kwargs={'source_container_id': self.root.pk}))
+
+        self.assertEqual(response.status_code, 202)
+        items = mock_thread.call_args.kwargs['args'][0]
+        self.assertEqual(set(items), {self.root_item, self.child_item})
+
+
+class ContainerMoveTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password1')
+        self.root = Container.objects.create(name='root', user=self.user)
+        self.child = Container.objects.create(name='child', parent_container=self.root, user=self.user)
+        self.grandchild = Container.objects.create(name='grandchild', parent_container=self.child, user=self.user)
+        self.other_root = Container.objects.create(name='other_root', user=self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def move(self, container, parent):
+        return self.client.patch(reverse("containers-detail", args=[container.pk]), {"parent_container": parent.pk}, format='json')
+
+    def test_move_under_itself_or_descendant_rejected(self):
+        for parent in (self.root, self.child, self.grandchild):
+            response = self.move(self.root, parent)
+
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("parent_container", response.data)
+        self.assertIsNone(Container.objects.get(pk=self.root.pk).parent_container)
+
+    def test_move_elsewhere(self):
+        response = self.move(self.child, self.other_root)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Container.objects.get(pk=self.grandchild.pk).path.startswith(Container.objects.get(pk=self.other_root.pk).path))
+
+
+class ContainerTreeCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password1')
+        self.other_user = User.objects.create_user(username='user2', password='password2')
+
+        self.root = Container.objects.create(name='root', user=self.user)
+        self.child = Container.objects.create(name='child', parent_container=self.root, user=self.user)
+        self.other_root = Container.objects.create(name='other_root', user=self.user)
+        self.spectrum_type = SpectrumType.objects.create(name="spectrum", description="", user=self.user)
+        self.item = Item.objects.create(statement='item', parent_container=self.child, user=self.user)
+
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("containerTrees-list")
+
+    def tree_ids(self, tree):
+        ids = []
+        for node in tree:
+            ids.append(node["id"])
+            ids += self.tree_ids(node["children"])
+        return ids
+
+    def spectrum_types_of(self, tree, container_id):
+        for node in tree:
+            if node["id"] == container_id:
+                return [i["id"] for i in node["spectrum_types"]]
+            found = self.spectrum_types_of(node["children"], container_id)
+            if found is not None:
+                return found
+
+    def test_tree_served_from_cache(self):
+        reset_container_tree_cache_stats()
+        first = self.client.get(self.url).json()
+
+        # Only the conditional GET validators.
+        with self.assertNumQueries(4):
+            second = self.client.get(self.url).json()
+
+        self.assertEqual(first, second)
+        stats = container_tree_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+    def test_stats_endpoint_staff_only(self):
+        reset_container_tree_cache_stats()
+        self.client.get(self.url)
+        stats_url = reverse("container-tree-cache-stats")
+
+        self.assertEqual(self.client.get(stats_url).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(stats_url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["hits"], response.data["misses"], response.data["shared"]), (0, 1, False))
+
+    def test_container_changes_invalidate(self):
+        self.client.get(self.url)
+        new_container = Container.objects.create(name='new', parent_container=self.root, user=self.user)
+        self.assertIn(new_container.id, self.tree_ids(self.client.get(self.url).json()))
+
+        new_container.delete()
+        self.assertNotIn(new_container.id, self.tree_ids(self.client.get(self.url).json()))
+
+    def test_spectrum_value_changes_invalidate(self):
+        self.client.get(self.url)
+        spectrum_value = SpectrumValue.objects.create(value=1, spectrum_type=self.spectrum_type, parent_item=self.item, user=self.user)
+        self.assertEqual(self.spectrum_types_of(self.client.get(self.url).json(), self.child.id), [self.spectrum_type.id])
+
+        spectrum_value.delete()
+        self.assertEqual(self.spectrum_types_of(self.client.get(self.url).json(), self.child.id), [])
+
+    def test_item_move_invalidates(self):
+        SpectrumValue.objects.create(value=1, spectrum_type=self.spectrum_type, parent_item=self.item, user=self.user)
+        self.client.get(self.url)
+
+        item = Item.objects.get(pk=self.item.pk)
+        item.parent_container = self.other_root
+        item.save()
+
+        tree = self.client.get(self.url).json()
+        self.assertEqual(self.spectrum_types_of(tree, self.child.id), [])
+        self.assertEqual(self.spectrum_types_of(tree, self.other_root.id), [self.spectrum_type.id])
+
+    def test_tree_cached_per_user(self):
+        self.client.get(self.url)
+        other_container = Container.objects.create(name='other_user_container', user=self.other_user)
+
+        self.client.force_authenticate(user=self.other_user)
+        self.assertEqual(self.tree_ids(self.client.get(self.url).json()), [other_container.id])
+
+
+class ConditionalListTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password1')
+        self.client.force_authenticate(user=self.user)
+
+        self.container = Container.objects.create(name='container', user=self.user)
+        self.spectrum_type = SpectrumType.objects.create(name="spectrum", description="", user=self.user)
+        self.item = Item.objects.create(statement='item', parent_container=self.container, user=self.user)
+        self.spectrum_value = SpectrumValue.objects.create(value=1, spectrum_type=self.spectrum_type, parent_item=self.item, user=self.user)
+
+        self.urls = [
+            reverse('containerTrees-list'),
+            reverse('container-items', kwargs={'pk': self.container.pk}),
+            reverse('items-list'),
+            ]
+
+    def test_not_modified_when_current(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.has_header('Last-Modified'))
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+    def test_modified_after_changes(self):
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+
+        self.item.statement = 'changed item'
+        self.item.save()
+
+        for url, etag in zip(self.urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_modified_after_deletion(self):
+        etags = [self.client.get(url)['ETag'] for url in self.urls[1:]]
+
+        self.spectrum_value.delete()
+
+        for url, etag in zip(self.urls[1:], etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_depends_on_query_string(self):
+        url = self.urls[2]
+        etag = self.client.get(url)['ETag']
+
+        self.assertEqual(self.client.get(url + '?done=true', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ContainerLazyTreeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password1')
+        self.other_user = User.objects.create_user(username='user2', password='password2')
+        self.client.force_authenticate(user=self.user)
+
+        self.expanded_root = Container.objects.create(name='expanded_root', is_collapsed=False, user=self.user)
+        self.collapsed_child = Container.objects.create(name='collapsed_child', parent_container=self.expanded_root, user=self.user)
+        self.expanded_grandchild = Container.objects.create(name='expanded_grandchild', is_collapsed=False, parent_container=self.collapsed_child, user=self.user)
+        self.great_grandchild = Container.objects.create(name='great_grandchild', parent_container=self.expanded_grandchild, user=self.user)
+        self.collapsed_root = Container.objects.create(name='collapsed_root', user=self.user)
+
+        self.spectrum_type = SpectrumType.objects.create(name="spectrum", description="", user=self.user)
+        item = Item.objects.create(statement='item', parent_container=self.expanded_grandchild, user=self.user)
+        SpectrumValue.objects.create(value=1, spectrum_type=self.spectrum_type, parent_item=item, user=self.user)
+
+    def test_lazy_tree_expands_only_open_branches(self):
+        response = self.client.get(reverse('containerTrees-list'), {'lazy': 'true'})
+
+        self.assertEqual(response.status_code, 200)
+        expanded_root, collapsed_root = response.json()
+        self.assertEqual(expanded_root['children_count'], 1)
+        self.assertEqual(collapsed_root['children_count'], 0)
+
+        collapsed_child = expanded_root['children'][0]
+        self.assertEqual(collapsed_child['id'], self.collapsed_child.id)
+        self.assertEqual(collapsed_child['children'], [])
+        self.assertEqual(collapsed_child['children_count'], 1)
+
+    def test_lazy_tree_loads_only_served_containers(self):
+        view = ContainerTreeView()
+        view.request = Mock(user=self.user)
+
+        with self.assertNumQueries(2): # Roots, then the expanded root's children.
+            containers = view.get_lazy_containers()
+
+        self.assertEqual([c.pk for c in containers], [self.expanded_root.pk, self.collapsed_root.pk, self.collapsed_child.pk])
+        self.assertEqual([c.pk for c in view.get_lazy_containers(self.collapsed_child)], [self.expanded_grandchild.pk, self.great_grandchild.pk])
+
+    def test_full_tree_unchanged(self):
+        response = self.client.get(reverse('containerTrees-list'))
+
+        expanded_root = response.json()[0]
+        self.assertNotIn('children_count', expanded_root)
+        self.assertEqual(expanded_root['children'][0]['children'][0]['id'], self.expanded_grandchild.id)
+
+    def test_children_on_demand(self):
+        response = self.client.get(reverse('containerTrees-children', kwargs={'pk': self.collapsed_child.pk}))
+
+        self.assertEqual(response.status_code, 200)
+        [grandchild] = response.json()
+        self.assertEqual(grandchild['id'], self.expanded_grandchild.id)
+        self.assertEqual([i['id'] for i in grandchild['spectrum_types']], [self.spectrum_type.id])
+        # Expanded, so its own children come along.
+        self.assertEqual(grandchild['children'][0]['id'], self.great_grandchild.id)
+
+        response = self.client.get(reverse('containerTrees-children', kwargs={'pk': self.collapsed_child.pk}), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_children_not_allowed(self):
+        self.client.force_authenticate(user=self.other_user)
+
+        response = self.client.get(reverse('containerTrees-children', kwargs={'pk': self.collapsed_child.pk}))
+
+        self.assertEqual(response.status_code, 404)
+
+
+class ContainerItemListPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password1')
+        self.client.force_authenticate(user=self.user)
+        self.container = Container.objects.create(name='container', user=self.user)
+
+        self.items = []
+        for i in range(7):
+            self.items.append(Item.objects.create(statement=f'item_{i}', actionable=i % 2 == 0, done=i == 3, archived=i == 5, parent_container=self.container, user=self.user))
+        self.url = reverse('container-items', kwargs={'pk': self.container.pk})
+
+    def test_unpaginated_by_default(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual([i['id'] for i in response.data], [i.id for i in self.items])
+
+    def test_cursor_pages(self):
+        ids = []
+        url = self.url + '?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 3)
+            ids += [i['id'] for i in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(ids, [i.id for i in self.items])
+
+    def test_filters(self):
+        response = self.client.get(self.url, {'done': 'false', 'archived': 'false'})
+        self.assertEqual([i['id'] for i in response.data], [i.id for i in self.items if not i.done and not i.archived])
+
+        response = self.client.get(self.url, {'actionable': 'true', 'done': 'false', 'archived': 'false', 'page_size': 2})
+        self.assertEqual([i['id'] for i in response.data['results']], [self.items[0].id, self.items[2].id])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_invalid_filter(self):
+        response = self.client.get(self.url, {'done': 'maybe'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('done', response.json())
+
+
+class ContainerItemSpectrumOrderingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password1')
+        self.client.force_authenticate(user=self.user)
+        self.container = Container.objects.create(name='container', user=self.user)
+        self.spectrum_type = SpectrumType.objects.create(name='urgency', description='', user=self.user)
+        other_spectrum_type = SpectrumType.objects.create(name='effort', description='', user=self.user)
+
+        values = [30, None, 100, 0, None, 30, -5, 70]
+        self.items = []
+        for i, value in enumerate(values):
+            item = Item.objects.create(statement=f'item_{i}', parent_container=self.container, user=self.user)
+            if value is not None:
+                SpectrumValue.objects.create(value=value, spectrum_type=self.spectrum_type, parent_item=item, user=self.user)
+            SpectrumValue.objects.create(value=i, spectrum_type=other_spectrum_type, parent_item=item, user=self.user)
+            self.items.append(item)
+        # highest value first, equal values newest first, unvalued last.
+        order = [2, 7, 5, 0, 3, 6, 4, 1]
+        self.expected_ids = [self.items[i].id for i in order]
+        self.url = reverse('container-items', kwargs={'pk': self.container.pk})
+
+    def test_ordered_by_spectrum_value(self):
+        response = self.client.get(self.url, {'order_by_spectrum': self.spectrum_type.pk})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([i['id'] for i in response.data], self.expected_ids)
+
+    def test_cursor_pages_keep_order(self):
+        ids = []
+        url = self.url + f'?order_by_spectrum={self.spectrum_type.pk}&page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [i['id'] for i in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(ids, self.expected_ids)
+
+    def test_combined_with_filters(self):
+        Item.objects.filter(pk=self.items[7].pk).update(done=True)
+
+        response = self.client.get(self.url, {'order_by_spectrum': self.spectrum_type.pk, 'done': 'false'})
+
+        self.assertEqual([i['id'] for i in response.data], [i for i in self.expected_ids if i != self.items[7].id])
+
+    def test_invalid_spectrum_type(self):
+        response = self.client.get(self.url, {'order_by_spectrum': 'urgency'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('order_by_spectrum', response.json())
+
+
+class ContainerItemBulkCreateTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password1')
+        self.client.force_authenticate(user=self.user)
+        self.container = Container.objects.create(name='container', user=self.user)
+        self.url = reverse('container-items-bulk-create', kwargs={'pk': self.container.pk})
+
+    def test_bulk_create(self):
+        response = self.client.post(self.url, {'statements': ['first', 'second']}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([i['statement'] for i in response.data], ['first', 'second'])
+        self.assertEqual([i['parent_container'] for i in response.data], [self.container.pk] * 2)
+        self.assertEqual(ItemStatementVersion.objects.filter(parent_item__in=[i['id'] for i in response.data]).count(), 2)
+
+    def test_constant_queries(self):
+        with CaptureQueriesContext(connection) as few:
+            self.client.post(self.url, {'statements': ['item'] * 2}, format='json')
+        with CaptureQueriesContext(connection) as many: # Within one SQLite insert batch.
+            self.client.post(self.url, {'statements': ['item'] * 50}, format='json')
+
+        self.assertEqual(len(few), len(many))
+
+    def test_invalid_statements(self):
+        response = self.client.post(self.url, {'statements': ['ok', 'x' * 2**8]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(self.url, {'statements': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Item.objects.exists())
+
+    def test_other_users_container(self):
+        other_container = Container.objects.create(name='other', user=User.objects.create_user(username='user2', password='password2'))
+
+        response = self.client.post(reverse('container-items-bulk-create', kwargs={'pk': other_container.pk}), {'statements': ['item']}, format='json')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Item.objects.exists())
+
+
+class ItemBulkUpdateTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password1')
+        self.client.force_authenticate(user=self.user)
+        Criteria.objects.create(name="actionable", user=self.user)
+        Criteria.objects.create(name="non-actionable", user=self.user)
+        self.container = Container.objects.create(name='container', user=self.user)
+        self.other_container = Container.objects.create(name='other_container', user=self.user)
+        self.items = [Item.objects.create(statement=f'item_{i}', parent_container=self.container, user=self.user) for i in range(4)]
+        self.ids = [item.pk for item in self.items[:3]]
+        self.url = reverse('items-bulk-update')
+
+    def test_done(self):
+        response = self.client.post(self.url, {'ids': self.ids, 'patch': {'done': True}}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([i['id'] for i in response.data], self.ids)
+        self.assertTrue(all(i['done'] for i in response.data))
+        for item in Item.objects.filter(pk__in=self.ids):
+            self.assertTrue(item.done)
+            self.assertIsNotNone(item.completed_at)
+        self.assertFalse(Item.objects.get(pk=self.items[3].pk).done)
+
+        self.client.post(self.url, {'ids': self.ids, 'patch': {'done': False}}, format='json')
+        self.assertFalse(Item.objects.filter(pk__in=self.ids, completed_at__isnull=False).exists())
+
+    def test_move_and_archive(self):
+        before = Item.objects.get(pk=self.ids[0]).updated_at
+
+        self.client.post(self.url, {'ids': self.ids, 'patch': {'parent_container': self.other_container.pk, 'archived': True}}, format='json')
+
+        items = Item.objects.filter(pk__in=self.ids)
+        self.assertEqual({(i.parent_container_id, i.archived) for i in items}, {(self.other_container.pk, True)})
+        self.assertGreater(items.get(pk=self.ids[0]).updated_at, before)
+
+    def test_actionable_records_user_comparisons(self):
+        self.client.post(self.url, {'ids': self.ids, 'patch': {'actionable': True}}, format='json')
+
+        comparisons = ItemVsTwoCriteriaAIComparison.objects.all()
+        self.assertEqual(comparisons.count(), 3)
+        self.assertEqual(
+            {c.item_compared_statement_version_id for c in comparisons},
+            {item.current_statement_version_id for item in self.items[:3]}
+            )
+        self.assertTrue(all(c.user_choice and c.criteria_choice for c in comparisons))
+        self.assertEqual(Item.objects.filter(actionable=True).count(), 3)
+
+    def test_constant_queries(self):
+        with CaptureQueriesContext(connection) as few:
+            self.client.post(self.url, {'ids': self.ids[:1], 'patch': {'actionable': True, 'done': True}}, format='json')
+        with CaptureQueriesContext(connection) as many:
+            self.client.post(self.url, {'ids': self.ids, 'patch': {'actionable': False, 'done': False}}, format='json')
+
+        self.assertEqual(len(few), len(many))
+
+    def test_move_invalidates_tree(self):
+        spectrum_type = SpectrumType.objects.create(name='spectrum', description='', user=self.user)
+        SpectrumValue.objects.create(value=1, spectrum_type=spectrum_type, parent_item=self.items[0], user=self.user)
+        self.client.get(reverse('containerTrees-list'))
+
+        self.client.post(self.url, {'ids': self.ids, 'patch': {'parent_container': self.other_container.pk}}, format='json')
+
+        tree = self.client.get(reverse('containerTrees-list')).data
+        spectrum_types = {c['id']: [t['id'] for t in c['spectrum_types']] for c in tree}
+        self.assertEqual(spectrum_types[self.container.pk], [])
+        self.assertEqual(spectrum_types[self.other_container.pk], [spectrum_type.pk])
+
+    def test_unknown_or_foreign_ids_change_nothing(self):
+        other_user = User.objects.create_user(username='user2', password='password2')
+        foreign_item = Item.objects.create(statement='foreign', user=other_user)
+
+        response = self.client.post(self.url, {'ids': self.ids + [foreign_item.pk], 'patch': {'done': True}}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ids', response.json())
+        self.assertFalse(Item.objects.filter(done=True).exists())
+
+    def test_invalid_patch(self):
+        foreign_container = Container.objects.create(name='foreign', user=User.objects.create_user(username='user2', password='password2'))
+
+        for patch in [{}, {'parent_container': foreign_container.pk}, {'done': 'maybe'}]:
+            response = self.client.post(self.url, {'ids': self.ids, 'patch': patch}, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Item.objects.filter(parent_container=foreign_container).exists())
+
+
+class ItemSearchTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password1')
+        self.client.force_authenticate(user=self.user)
+        self.container = Container.objects.create(name='container', user=self.user)
+        self.visit = Item.objects.create(statement='visit the bank', parent_container=self.container, user=self.user)
+        self.loan = Item.objects.create(statement='bank loan from the bank', parent_container=self.container, user=self.user)
+        Item.objects.create(statement='water the plants', parent_container=self.container, user=self.user)
+        other_user = User.objects.create_user(username='user2', password='password2')
+        Item.objects.create(statement='bank holiday', user=other_user)
+        self.url = reverse('search')
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [i['id'] for i in response.data['results']]
+
+    def test_ranked_user_items(self):
+        response = self.client.get(self.url, {'q': 'bank'})
+
+        self.assertEqual([i['id'] for i in response.data['results']], [self.loan.pk, self.visit.pk])
+        self.assertGreater(response.data['results'][0]['search_rank'], response.data['results'][1]['search_rank'])
+        self.assertEqual(response.data['results'][0]['statement'], 'bank loan from the bank')
+
+    def test_all_words_and_stems(self):
+        self.assertEqual(self.search(q='banking visits'), [self.visit.pk])
+        self.assertEqual(self.search(q='bank plants'), [])
+
+    def test_history(self):
+        self.visit.statement = 'renew passport'
+        self.visit.save()
+
+        self.assertEqual(self.search(q='visit'), [])
+        self.assertEqual(self.search(q='visit', history='true'), [self.visit.pk])
+        self.assertEqual(self.search(q='passport'), [self.visit.pk])
+
+    @skipUnless(connection.vendor == 'sqlite', "FTS5 backfill")
+    def test_sqlite_backfill_includes_compacted_history(self):
+        for statement in ['visit the bank branch downtown before noon', 'visit the bank branch downtown before lunch', 'renew passport']:
+            self.visit.statement = statement
+            self.visit.save()
+        compact_versions(ItemStatementVersion, 'parent_item', snapshot_interval=2)
+        self.assertTrue(ItemStatementVersion.objects.filter(parent_item=self.visit, statement=None).exclude(statement_delta=None).exists())
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SQLITE_TABLE}")
+
+        install_sqlite_search('default')
+
+        for word in ['visit', 'noon', 'lunch']:
+            self.assertEqual(self.search(q=word, history='true'), [self.visit.pk])
+        self.assertEqual(self.search(q='passport'), [self.visit.pk])
+
+    def test_bulk_created_items(self):
+        self.client.post(reverse('container-items-bulk-create', kwargs={'pk': self.container.pk}), {'statements': ['paint the fence']}, format='json')
+
+        self.assertEqual(len(self.search(q='fence')), 1)
+
+    def test_pages(self):
+        for i in range(3):
+            Item.objects.create(statement=f'bank errand {i}', user=self.user)
+
+        response = self.client.get(self.url, {'q': 'bank', 'page_size': 2})
+
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'q': '  '}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'q': 'bank', 'history': 'maybe'}).status_code, 400)
+        # Search syntax characters are just text.
+        self.assertEqual(self.search(q='"bank AND ) {statement}'), [])
+
+
+class FastItemSerializationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password1')
+        self.client.force_authenticate(user=self.user)
+        self.container = Container.objects.create(name='container', user=self.user)
+        spectrum_types = [SpectrumType.objects.create(name=f"spectrum_{i}", description="", user=self.user) for i in range(2)]
+
+        for i in range(6):
+            item = Item.objects.create(statement=f'item "{i}" ✓', actionable=i % 2 == 0, archived=i == 4, parent_container=self.container if i else None, user=self.user)
+            for spectrum_type in spectrum_types[:i % 3]:
+                SpectrumValue.objects.create(value=i * 10, gpt_curated=i == 2, spectrum_type=spectrum_type, parent_item=item, user=self.user)
+
+    def test_same_json_as_item_serializer(self):
+        items = ItemSerializer.setup_eager_loading(Item.objects.filter(user=self.user))
+
+        fast = JSONRenderer().render(serialize_items_fast(items))
+        regular = JSONRenderer().render(ItemSerializer(items, many=True).data)
+
+        self.assertEqual(fast, regular)
+
+    def test_views_same_json_as_item_serializer(self):
+        for url, items in (
+            (reverse('items-list'), Item.objects.filter(user=self.user)),
+            (reverse('container-items', kwargs={'pk': self.container.pk}) + '?archived=false', Item.objects.filter(parent_container=self.container, archived=False)),
+            ):
+            response = self.client.get(url)
+            expected = ItemSerializer(ItemSerializer.setup_eager_loading(items), many=True).data
+            self.assertEqual(response.content, JSONRenderer().render(expected))
+
+
+class ItemDuplicatesTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password1')
+        self.client.force_authenticate(user=self.user)
+        self.container = Container.objects.create(name='container', user=self.user)
+        self.other_container = Container.objects.create(name='other container', user=self.user)
+        self.milk = Item.objects.create(statement='Buy milk and eggs', parent_container=self.container, user=self.user)
+        self.milk_again = Item.objects.create(statement='buy milk and eggs!', parent_container=self.container, user=self.user)
+        self.milk_typo = Item.objects.create(statement='Buy milk and egs', parent_container=self.other_container, user=self.user)
+        Item.objects.create(statement='Water the plants', parent_container=self.container, user=self.user)
+        other_user = User.objects.create_user(username='user2', password='password2')
+        Item.objects.create(statement='Buy milk and eggs', user=other_user)
+
+    def cluster_ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [[item['id'] for item in cluster] for cluster in response.data['clusters']]
+
+    def test_user_items(self):
+        response = self.client.get(reverse('duplicates'))
+
+        self.assertEqual(self.cluster_ids(response), [[self.milk.pk, self.milk_again.pk, self.milk_typo.pk]])
+        self.assertEqual(response.data['clusters'][0][2]['parent_container'], self.other_container.pk)
+
+    def test_container_items(self):
+        response = self.client.get(reverse('container-item-duplicates', kwargs={'pk': self.container.pk}))
+
+        self.assertEqual(self.cluster_ids(response), [[self.milk.pk, self.milk_again.pk]])
+
+    def test_threshold(self):
+        self.assertEqual(self.cluster_ids(self.client.get(reverse('duplicates'), {'threshold': 100})), [[self.milk.pk, self.milk_again.pk]])
+        self.assertEqual(self.client.get(reverse('duplicates'), {'threshold': 'high'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('duplicates'), {'threshold': 101}).status_code, 400)
+
+    def test_other_users_container(self):
+        other_container = Container.objects.create(name='theirs', user=User.objects.get(username='user2'))
+
+        response = self.client.get(reverse('container-item-duplicates', kwargs={'pk': other_container.pk}))
+
+        self.assertEqual(response.status_code, 404)
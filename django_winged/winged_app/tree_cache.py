@@ -0,0 +1,90 @@
+"""
+Per-user cache of serialized container trees.
+
+Trees are stored under a key holding the user's current tree version,
+invalidating a user's trees is replacing that version so old entries
+are never read again and just expire.
+
+Hit and miss counters live in the cache too, so they only add up across web
+workers with a shared cache (Redis). With a process local one each worker
+counts its own, read them through the workers at container-tree-cache-stats/.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+HITS_KEY = "container_tree_stats:hits"
+MISSES_KEY = "container_tree_stats:misses"
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+    )
+
+
+def is_shared_cache():
+    """
+    returns whether the default cache is seen by every process, not one each.
+    """
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def _version_key(user_id):
+    return f"container_tree_version:{user_id}"
+
+
+def get_container_tree_version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def container_tree_key(user_id, mode="full"):
+    return f"container_tree:{user_id}:{mode}:{get_container_tree_version(user_id)}"
+
+
+def invalidate_container_tree(user_id):
+    cache.set(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+
+
+def _count(key):
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError: # Evicted between add and incr.
+        cache.set(key, 1, timeout=None)
+
+
+def get_cached_container_tree(user_id, build_tree, mode="full"):
+    """
+    Returns the user's serialized tree from cache, calling build_tree
+    and caching its result on a miss.
+    """
+    key = container_tree_key(user_id, mode)
+    tree = cache.get(key)
+    if tree is not None:
+        _count(HITS_KEY)
+        return tree
+
+    _count(MISSES_KEY)
+    tree = build_tree()
+    cache.set(key, tree, timeout=settings.CONTAINER_TREE_CACHE_TIMEOUT)
+    return tree
+
+
+def container_tree_cache_stats():
+    """
+    Stats hook: hits, misses and hit ratio of the container tree cache, and
+    whether they are shared ones or this process' own.
+    """
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_ratio": hits / total if total else None, "shared": is_shared_cache()}
+
+
+def reset_container_tree_cache_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,139 @@
+import difflib
+import zlib
+
+from django.db import transaction
+
+
+SNAPSHOT_INTERVAL = 4 # Most deltas kept against one full snapshot, they drift apart with every edit.
+
+RAW = b'r'
+COMPRESSED = b'z'
+COPY = 0 # Followed by base start and length, as varints.
+INSERT = 1 # Followed by utf-8 length, as varint, and the text.
+MIN_COPY = 4
+
+
+def write_varint(number, out):
+    while number > 0x7f:
+        out.append(number & 0x7f | 0x80)
+        number >>= 7
+    out.append(number)
+
+
+def read_varint(data, position):
+    number = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        number |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return number, position
+        shift += 7
+
+
+def encode_delta(base, text):
+    """
+    returns text as a delta against base: copied base spans and inserted strings,
+    zlib compressed when that is shorter.
+    """
+    operations = [] # Copied (start, end) spans of base and inserted strings.
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, base, text, autojunk=False).get_opcodes():
+        if tag == 'equal' and i2 - i1 >= MIN_COPY:
+            operations.append((i1, i2))
+        elif tag != 'delete': # Short copies cost more than their text.
+            if operations and isinstance(operations[-1], str):
+                operations[-1] += text[j1:j2]
+            else:
+                operations.append(text[j1:j2])
+
+    raw = bytearray()
+    for operation in operations:
+        if isinstance(operation, str):
+            inserted = operation.encode()
+            raw.append(INSERT)
+            write_varint(len(inserted), raw)
+            raw += inserted
+        else:
+            raw.append(COPY)
+            write_varint(operation[0], raw)
+            write_varint(operation[1] - operation[0], raw)
+    compressed = zlib.compress(raw, 9)
+    return COMPRESSED + compressed if len(compressed) < len(raw) else RAW + bytes(raw)
+
+
+def apply_delta(base, delta):
+    """
+    returns the text encode_delta(base, text) was made from.
+    """
+    delta = bytes(delta)
+    raw = zlib.decompress(delta[1:]) if delta[:1] == COMPRESSED else delta[1:]
+    parts = []
+    position = 0
+    while position < len(raw):
+        operation = raw[position]
+        if operation == COPY:
+            start, position = read_varint(raw, position + 1)
+            length, position = read_varint(raw, position)
+            parts.append(base[start:start + length])
+        else:
+            length, position = read_varint(raw, position + 1)
+            parts.append(raw[position:position + length].decode())
+            position += length
+    return ''.join(parts)
+
+
+def stored_size(statement, delta):
+    return len(statement.encode()) if statement is not None else len(delta or b'')
+
+
+def plan_history(texts, snapshot_interval=SNAPSHOT_INTERVAL):
+    """
+    returns a (delta, base index) pair per text, oldest first, or (None, None) for
+    texts kept whole as snapshots. A text becomes a delta against the latest snapshot
+    while that is smaller than the text itself and the snapshot has room left.
+    """
+    plan = []
+    snapshot = None
+    for index, text in enumerate(texts):
+        if snapshot is not None and snapshot[1] < snapshot_interval:
+            delta = encode_delta(texts[snapshot[0]], text)
+            if len(delta) < len(text.encode()):
+                plan.append((delta, snapshot[0]))
+                snapshot = (snapshot[0], snapshot[1] + 1)
+                continue
+        plan.append((None, None))
+        snapshot = (index, 0)
+    return plan
+
+
+def compact_versions(version_model, parent_field, snapshot_interval=SNAPSHOT_INTERVAL):
+    """
+    Rewrites past versions of version_model, grouped by parent_field, as snapshots
+    and deltas against them (see plan_history). Current versions, holding no
+    statement of their own, are left alone. Rerunning only touches new versions.
+    returns stored statement bytes before and after.
+    """
+    versions = version_model.objects.filter(**{f'{parent_field}__isnull': False}).exclude(
+        statement__isnull=True, statement_delta__isnull=True
+        ).select_related('delta_base').order_by(f'{parent_field}_id', 'pk')
+
+    histories = {}
+    for version in versions.iterator(chunk_size=2**10):
+        histories.setdefault(getattr(version, f'{parent_field}_id'), []).append(version)
+
+    before = after = 0
+    for history in histories.values():
+        texts = [version.stored_statement for version in history]
+        changed = []
+        for version, text, (delta, base_index) in zip(history, texts, plan_history(texts, snapshot_interval)):
+            before += stored_size(version.statement, version.statement_delta)
+            statement, base = (None, history[base_index]) if delta is not None else (text, None)
+            after += stored_size(statement, delta)
+            if (version.statement, version.delta_base_id) != (statement, base and base.pk) or (
+                    delta is not None and bytes(version.statement_delta) != delta):
+                version.statement, version.statement_delta, version.delta_base = statement, delta, base
+                changed.append(version)
+        if changed:
+            with transaction.atomic():
+                version_model.objects.bulk_update(changed, ['statement', 'statement_delta', 'delta_base'])
+    return before, after
@@ -1,10 +1,14 @@
 import threading
 import time
 import math
+import hashlib
 
+from functools import wraps
 from random import shuffle
 
 from rest_framework import permissions, viewsets, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
@@ -13,24 +17,35 @@ from rest_framework.status import HTTP_202_ACCEPTED, HTTP_404_NOT_FOUND, HTTP_50
 from django.shortcuts import get_object_or_404, get_list_or_404
 from django.contrib.auth.models import User
 from django.db import transaction
+from django.db.models import Max, Count, OuterRef, Subquery, Value, CharField
+from django.db.models.functions import Cast, Coalesce, Concat, LPad
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 
 from .serializers import (
     ContainerSerializer, ContainerChildrenListSerializer, ItemSerializer,
     ItemStatementVersionSerializer, UserSerializer, SpectrumTypeSerializer, 
-    SpectrumValueSerializer
+    SpectrumValueSerializer, ContainerLazyTreeSerializer, containers_by_parent,
+    spectrum_types_by_container, serialize_items_fast, ItemBulkCreateSerializer,
+    ItemBulkUpdateSerializer, ItemSearchResultSerializer
     )
 
 import scripts.openai_compare as openai_compare
 import scripts.ai_curation_costs_calc as costs_calc
 
-from scripts.bart_large_mnli_compare import item_vs_criteria
-from scripts.my_custom_helper_functions import reclassify_items, create_user_comparison_record
-from scripts.sentence_transformers_compare import all_MiniLM_L6_v2_criterion_vs_items, strings_compute_criterion_embedding_comparison
+from winged_app.duplicates import find_duplicate_items, DEFAULT_THRESHOLD
+from scripts.bart_large_mnli_compare import concurrent_items_vs_criteria
+from scripts.my_custom_helper_functions import reclassify_items_in_batches, create_user_comparison_record, create_user_comparison_records
+from scripts.sentence_transformers_compare import all_MiniLM_L6_v2_criterion_vs_items, versions_comparison_function
 
 from winged_app.models import (
     Container, Item, ItemStatementVersion, SpectrumValue, SpectrumType,
     Criteria
     )
+from winged_app.tree_cache import get_cached_container_tree, invalidate_container_tree, container_tree_cache_stats
+from winged_app.pagination import ItemCursorPagination, SearchResultsPagination
+from winged_app.search import search_items
 
 # reorganized imports by origin and form.
 
@@ -49,6 +64,103 @@ class IsOwner(permissions.BasePermission):
         return obj.user == request.user
 
 
+def list_validators(request, querysets):
+    """
+    Computes ETag and Last-Modified for a listing out of max(updated_at)
+    and row count of each queryset it's built from.
+    Query string is part of the ETag since it shapes the listing.
+    """
+    parts = [request.get_full_path()]
+    last_modified = None
+    for queryset in querysets:
+        aggregate = queryset.aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+        parts.append(f"{queryset.model._meta.label}:{aggregate['count']}:{aggregate['last_modified']}")
+        if aggregate['last_modified'] and (last_modified is None or aggregate['last_modified'] > last_modified):
+            last_modified = aggregate['last_modified']
+
+    etag = quote_etag(hashlib.md5("|".join(parts).encode()).hexdigest())
+    return etag, int(last_modified.timestamp()) if last_modified else None
+
+
+def conditional_list(list_method):
+    """
+    Makes a list view answer 304 Not Modified when the client's copy is current,
+    before serializing anything. Validators come from the view's get_validator_querysets().
+    """
+    @wraps(list_method)
+    def inner(self, request, *args, **kwargs):
+        etag, last_modified = list_validators(request, self.get_validator_querysets())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = list_method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                response.headers.setdefault('ETag', etag)
+                if last_modified:
+                    response.headers.setdefault('Last-Modified', http_date(last_modified))
+        # Clients keep their copy but always revalidate it.
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return inner
+
+
+class ItemListMixin:
+    """
+    Item listing answering conditional GETs and serializing through
+    serialize_items_fast, unless a page was asked for.
+    """
+    def get_validator_querysets(self):
+        # Items, their spectrum values and the spectrum types labeling them.
+        items = self.get_queryset()
+        return [
+            items,
+            SpectrumValue.objects.filter(parent_item__in=items),
+            SpectrumType.objects.filter(user=self.request.user),
+            ]
+
+    @conditional_list
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None: # Pages are bounded, instances are fine there.
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        return Response(serialize_items_fast(queryset))
+
+
+def filter_items(items, query_params, fields=('actionable', 'done', 'archived')):
+    """
+    Narrows items by boolean query params, e.g. ?done=false&archived=false.
+    """
+    for field in fields:
+        value = query_params.get(field)
+        if value is None:
+            continue
+        if value.lower() not in ('true', 'false', '1', '0'):
+            raise ValidationError({field: "Must be true or false."})
+        items = items.filter(**{field: value.lower() in ('true', '1')})
+    return items
+
+
+def order_items_by_spectrum(items, spectrum_type_id):
+    """
+    Orders items by their value on a spectrum type, highest first and
+    items without one last, through a spectrum_rank annotation.
+    spectrum_rank packs value and id into one sortable string, so a cursor
+    pages over it without ties. Equal values come newest id first.
+    """
+    value = Subquery(SpectrumValue.objects.filter(parent_item=OuterRef('pk'), spectrum_type=spectrum_type_id).values('value')[:1])
+    # Shift any integer value above 0, which is left for missing values.
+    shifted_value = Coalesce(value + Value(2**31 + 1), Value(0))
+    spectrum_rank = Concat(
+        LPad(Cast(shifted_value, CharField()), 10, Value('0')),
+        LPad(Cast('id', CharField()), 20, Value('0')),
+        output_field=CharField(),
+        )
+    return items.annotate(spectrum_rank=spectrum_rank).order_by('-spectrum_rank')
+
+
 def user_input_compare(criteria, element1, element2):
     response = input(f"\n1. {element1} \nvs\n2. {element2}\n(Enter 1/2): ")
     return response != "1"
@@ -166,7 +278,7 @@ class RunScriptAPIView(APIView):
                     
                     while True:
                         try:
-                            if not comparison_function(criteria, sorted_list[mid].statement, key.statement):
+                            if not comparison_function(criteria, sorted_list[mid], key):
                                 left = mid + 1
                                 print("less than: {}".format(sorted_list[mid].statement))
                             else:
@@ -224,21 +336,34 @@ class RunScriptAPIView(APIView):
                 return sorted_list
             
 
-            sorted_items = [i for i in scored_items.distinct()]
+            def on_statements(function):
+                return lambda criteria, item_1, item_2: function(spectrumtype.description, item_1.statement, item_2.statement)
+
+            sorted_items = [i for i in scored_items.distinct().select_related('current_statement_version')]
             sorted_items.sort(key=lambda x: x.spectrumvalue_set.get(spectrum_type=spectrumtype).value, reverse=True)
+            items = [i for i in non_sorted_items.distinct().select_related('current_statement_version')]
+            criteria = None # Only comparisons of statement versions need one.
             
             functions = {
                 "paraphrase-mpnet-base-v2": None,
-                "all-mpnet-base-v2":strings_compute_criterion_embedding_comparison,
                 "bart_large_mnli":None,
-                "gpt-4":openai_compare.gpt_compare,
-                "user_curation":user_input_compare,
+                "gpt-4":on_statements(openai_compare.gpt_compare),
+                "user_curation":on_statements(user_input_compare),
                 }
+            embedding_models = ["all-mpnet-base-v2"]
+
+            if comparison_mode in embedding_models:
+                criteria = spectrumtype.get_criteria()
+                # Every embedding the ranking needs, stored in batches and kept in memory for the comparisons.
+                comparison_function = versions_comparison_function(
+                    comparison_mode,
+                    [criteria.current_criteria_statement_version] + [i.current_statement_version for i in sorted_items + items],
+                    )
+            else:
+                comparison_function = functions[comparison_mode]
 
-            comparison_function = functions[comparison_mode]
-
-            binary_insert_sort(spectrumtype.description,
-                               [i for i in non_sorted_items.distinct()],
+            binary_insert_sort(criteria,
+                               items,
                                comparison_function,
                                sorted_list=sorted_items)
             print("finished")
@@ -254,20 +379,23 @@ class ReEvaluateActionableItemsAPIView(APIView):
     authentication_classes = [TokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_items(self, source_container):
+        return get_list_or_404(
+                Item, parent_container=source_container,
+                done=False, archived=False, user=self.request.user
+                )
+
     def post(self, request, source_container_id, format=None):
         actionable = get_object_or_404(Criteria, name="actionable", user=self.request.user)
         non_actionable = get_object_or_404(Criteria, name="non-actionable", user=self.request.user)
         source_container = get_object_or_404(Container, id=source_container_id, user=self.request.user)
         
-        items = get_list_or_404(
-                Item, parent_container=source_container,
-                done=False, archived=False, user=self.request.user
-                )
+        items = self.get_items(source_container)
 
         # Start a new thread to run the script
         thread = threading.Thread(
-            target=reclassify_items,
-            args=[items, actionable, non_actionable, item_vs_criteria]
+            target=reclassify_items_in_batches,
+            args=[items, actionable, non_actionable, concurrent_items_vs_criteria]
             )
         
         thread.start()
@@ -276,26 +404,208 @@ class ReEvaluateActionableItemsAPIView(APIView):
 
 
 
-class ContainerItemListAPIView(ListAPIView):
+class ReEvaluateSubtreeActionableItemsAPIView(ReEvaluateActionableItemsAPIView):
+    """
+    Reclassifies items in source container and in all of its descendants.
+    """
+    def get_items(self, source_container):
+        return get_list_or_404(source_container.get_subtree_items(), done=False, archived=False)
+
+
+class ContainerItemListAPIView(ItemListMixin, ListAPIView):
+    """
+    Items in a container, filtered with ?actionable=, ?done= and ?archived=,
+    ordered by a spectrum type's values with ?order_by_spectrum=<id>
+    and paginated by cursor when ?page_size= is given.
+    """
     serializer_class = ItemSerializer
     authentication_classes = [TokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ItemCursorPagination
 
-    def get_queryset(self):
+    def get_items(self):
         container_id = self.kwargs.get('pk')
         return Item.objects.filter(parent_container=container_id, user=self.request.user)
 
+    def get_queryset(self):
+        items = filter_items(self.get_items(), self.request.query_params)
+        spectrum_type_id = self.get_order_by_spectrum()
+        if spectrum_type_id:
+            items = order_items_by_spectrum(items, spectrum_type_id)
+        return ItemSerializer.setup_eager_loading(items)
+
+    def get_order_by_spectrum(self):
+        spectrum_type_id = self.request.query_params.get('order_by_spectrum')
+        if spectrum_type_id and not spectrum_type_id.isdigit():
+            raise ValidationError({'order_by_spectrum': "Must be a spectrum type id."})
+        return spectrum_type_id
+
+    def get_pagination_ordering(self):
+        return ('-spectrum_rank',) if self.get_order_by_spectrum() else None
+
+
+class ContainerItemBulkCreateAPIView(APIView):
+    """
+    Creates an item in a container for every statement in {"statements": [...]},
+    with a fixed number of queries, see Item.bulk_create_with_versions.
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk, format=None):
+        container = get_object_or_404(Container, pk=pk, user=request.user)
+        serializer = ItemBulkCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        items = Item.bulk_create_with_versions(serializer.validated_data['statements'], container, request.user)
+
+        created = Item.objects.filter(pk__in=[item.pk for item in items]).order_by('pk')
+        return Response(serialize_items_fast(created), status=status.HTTP_201_CREATED)
+
+
+class ContainerSubtreeItemListAPIView(ContainerItemListAPIView):
+    """
+    Lists items in container and in all of its descendants.
+    """
+    def get_items(self):
+        container = get_object_or_404(Container, pk=self.kwargs.get('pk'), user=self.request.user)
+        return container.get_subtree_items()
+
+
+class ItemSearchAPIView(ListAPIView):
+    """
+    Full-text search of the user's items, ?q=<words>, best matches first,
+    ?history=true to match past statements too. See search.search_items.
+    """
+    serializer_class = ItemSearchResultSerializer
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SearchResultsPagination
+
+    def get_queryset(self):
+        query = self.request.query_params.get('q', '')
+        if not query.strip():
+            raise ValidationError({'q': "Must have words to search for."})
+        history = self.request.query_params.get('history', 'false').lower()
+        if history not in ('true', 'false', '1', '0'):
+            raise ValidationError({'history': "Must be true or false."})
+
+        items = search_items(Item.objects.filter(user=self.request.user), query, include_history=history in ('true', '1'))
+        return ItemSerializer.setup_eager_loading(items)
+
+
+class ItemDuplicatesAPIView(APIView):
+    """
+    Clusters of near-duplicate items, in a container or across all the user's
+    items, ?threshold=<0-100> for how similar, see duplicates.cluster_similar.
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_threshold(self):
+        threshold = self.request.query_params.get('threshold', str(DEFAULT_THRESHOLD))
+        if not threshold.isdigit() or int(threshold) > 100:
+            raise ValidationError({'threshold': "Must be an integer from 0 to 100."})
+        return int(threshold)
+
+    def get(self, request, pk=None, format=None):
+        threshold = self.get_threshold()
+        items = Item.objects.filter(user=request.user)
+        if pk is not None:
+            items = items.filter(parent_container=get_object_or_404(Container, pk=pk, user=request.user))
+
+        clusters = [
+            [{'id': id, 'statement': statement, 'parent_container': parent_container} for id, statement, parent_container in cluster]
+            for cluster in find_duplicate_items(items, threshold)
+            ]
+        return Response({'threshold': threshold, 'clusters': clusters})
+
+
+class ContainerTreeCacheStatsAPIView(APIView):
+    """
+    Container tree cache hits, misses and hit ratio as counted by the worker
+    answering, every worker's when "shared", see tree_cache.
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, format=None):
+        return Response(container_tree_cache_stats())
+
 
 class ContainerTreeView(viewsets.ViewSet):
     authentication_classes = [TokenAuthentication]
     serializer_class = ContainerChildrenListSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_validator_querysets(self):
+        # Items too, since moving one can change its containers' spectrum types.
+        return [
+            Container.objects.filter(user=self.request.user),
+            Item.objects.filter(user=self.request.user),
+            SpectrumValue.objects.filter(user=self.request.user),
+            SpectrumType.objects.filter(user=self.request.user),
+            ]
+
+    def is_lazy(self):
+        return self.request.query_params.get('lazy', '').lower() in ('true', '1')
+
+    @conditional_list
     def list(self, request, *args, **kwargs):
-        # Your list view logic here
-        queryset = Container.objects.filter(parent_container=None, user=self.request.user)
-        serializer = self.serializer_class(queryset, many=True, context={"request": request})
-        return Response(serializer.data)
+        """
+        Full tree, or with ?lazy=true only expanded branches plus a
+        children_count for collapsed containers.
+        """
+        lazy = self.is_lazy()
+        build_tree = lambda: self.build_tree(request, lazy=lazy)
+        tree = get_cached_container_tree(request.user.pk, build_tree, mode="lazy" if lazy else "full")
+        return Response(tree)
+
+    @action(detail=True, methods=['get'])
+    @conditional_list
+    def children(self, request, pk=None):
+        """
+        A container's children for on demand loading of collapsed branches,
+        collapse-aware below them.
+        """
+        container = get_object_or_404(Container, pk=pk, user=self.request.user)
+        build_tree = lambda: self.build_tree(request, lazy=True, root=container)
+        tree = get_cached_container_tree(request.user.pk, build_tree, mode=f"children-{container.pk}")
+        return Response(tree)
+
+    def get_lazy_containers(self, root=None):
+        """
+        returns the containers a lazy tree serializes, a level per query: root's
+        children, or the roots, then children of the expanded ones, each with a
+        children_count annotation.
+        """
+        containers = []
+        level = Container.objects.filter(user=self.request.user, parent_container=root)
+        while True:
+            nodes = list(level.annotate(children_count=Count('container')).order_by('pk'))
+            containers += nodes
+            expanded = [container.pk for container in nodes if not container.is_collapsed and container.children_count]
+            if not expanded:
+                return containers
+            level = Container.objects.filter(user=self.request.user, parent_container__in=expanded)
+
+    def build_tree(self, request, lazy=False, root=None):
+        if lazy: # Only what is served, a collapsed branch costs its root's row.
+            containers = self.get_lazy_containers(root)
+        elif root: # Fetch every container of root's subtree, or the user's, at once and build the tree in memory.
+            containers = root.get_subtree().order_by('pk')
+        else:
+            containers = Container.objects.filter(user=self.request.user).order_by('pk')
+        children_by_parent = containers_by_parent(containers)
+        nodes = children_by_parent.get(root.pk if root else None, [])
+        context = {
+            "request": request,
+            "children_by_parent": children_by_parent,
+            "spectrum_types_by_container": spectrum_types_by_container(self.request.user, containers if root or lazy else None),
+            }
+        serializer_class = ContainerLazyTreeSerializer if lazy else self.serializer_class
+        serializer = serializer_class(nodes, many=True, context=context)
+        return serializer.data
     
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
@@ -330,14 +640,20 @@ class ContainerViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
 
-class ItemViewSet(viewsets.ModelViewSet):
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'list': # One grouped query for every listed container's spectrum types.
+            context['spectrum_types_by_container'] = spectrum_types_by_container(self.request.user)
+        return context
+
+class ItemViewSet(ItemListMixin, viewsets.ModelViewSet):
     queryset = Item.objects.all()
     serializer_class = ItemSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwner]
     authentication_classes = [TokenAuthentication]
 
     def get_queryset(self):
-        return self.queryset.filter(user=self.request.user)
+        return ItemSerializer.setup_eager_loading(self.queryset.filter(user=self.request.user))
 
     def update(self, request, *args, **kwargs):
         with transaction.atomic():
@@ -350,9 +666,44 @@ class ItemViewSet(viewsets.ModelViewSet):
                     return Response({"error": f"An unexpected error occurred: {e}."}, status=HTTP_500_INTERNAL_SERVER_ERROR)
             return super().update(request, *args, **kwargs)
 
+    @action(detail=False, methods=['post'], url_path='bulk-update')
+    def bulk_update(self, request):
+        """
+        Applies {"patch": {...}} to every item in {"ids": [...]} with one UPDATE.
+        patch takes done, archived, actionable and parent_container.
+        """
+        serializer = ItemBulkUpdateSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data['ids'])
+        patch = serializer.validated_data['patch']
+
+        items = Item.objects.filter(user=request.user, pk__in=ids)
+        with transaction.atomic():
+            found = list(items.select_for_update().values('pk', 'parent_container', 'current_statement_version'))
+            missing = ids - {item['pk'] for item in found}
+            if missing:
+                raise ValidationError({'ids': [f"Items not found: {sorted(missing)}."]})
+
+            now = timezone.now()
+            changes = dict(patch, updated_at=now) # update() skips auto_now.
+            if 'done' in patch:
+                changes['completed_at'] = now if patch['done'] else None
+            items.update(**changes)
+
+            if 'actionable' in patch:
+                create_user_comparison_records(request, [item['current_statement_version'] for item in found], patch['actionable'])
+
+        if 'parent_container' in patch: # update() sends no post_save for the tree cache signals.
+            new_container_id = patch['parent_container'].pk if patch['parent_container'] else None
+            moved = [item['pk'] for item in found if item['parent_container'] != new_container_id]
+            if SpectrumValue.objects.filter(parent_item__in=moved).exists():
+                invalidate_container_tree(request.user.pk)
+
+        return Response(serialize_items_fast(items))
+
 
 class ItemStatementVersionViewSet(viewsets.ModelViewSet):
-    queryset = ItemStatementVersion.objects.all()
+    queryset = ItemStatementVersion.objects.select_related('delta_base')
     serializer_class = ItemStatementVersionSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwner]
     authentication_classes = [TokenAuthentication]